@@ -0,0 +1,86 @@
+"""
+Compare the CTranslate2 backend against the transformers pipeline, per
+language: whether the output matches and how much faster it is.
+
+Parity is reported as the share of sentences translated identically and
+the mean character-level similarity (difflib ratio) of the rest; int8
+quantization may change a word here and there, so a similarity close to 1
+is what to look for. Throughput is sentences and source words per second
+for one batched call over the whole sample, best of ``--runs``.
+
+Convert the models first:
+
+    python translation_backends.py convert
+
+Usage (from the caller_bot directory):
+
+    python benchmarks/translation_backend_benchmark.py --languages hindi urdu --repeat 8
+"""
+import os
+import sys
+import time
+import difflib
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lang import language_models, TRANSLATION_BATCH_SIZE
+from translation_backends import load_translator, ct2_model_dir
+from translation_benchmark import SAMPLE_SENTENCES
+
+
+def translate_all(translator, sentences):
+    return [item["translation_text"] for item in translator(sentences, max_length=512, batch_size=TRANSLATION_BATCH_SIZE)]
+
+
+def throughput(translator, sentences, runs):
+    translate_all(translator, sentences[:2])  # warm up
+    best = min(timed(translator, sentences) for _ in range(runs))
+    words = sum(len(sentence.split()) for sentence in sentences)
+    return len(sentences) / best, words / best
+
+
+def timed(translator, sentences):
+    start = time.perf_counter()
+    translate_all(translator, sentences)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check parity and throughput of translation backends")
+    parser.add_argument("--languages", nargs="*", default=list(language_models), help="Languages to compare")
+    parser.add_argument("--repeat", type=int, default=8, help="Copies of the sample sentences per batch")
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per backend")
+    args = parser.parse_args()
+
+    sentences = SAMPLE_SENTENCES * args.repeat
+    for lang in args.languages:
+        if not os.path.isdir(ct2_model_dir(lang)):
+            print(f"{lang}: not converted, skipping (python translation_backends.py convert {lang})")
+            continue
+
+        reference = load_translator(lang, language_models[lang], backend="transformers")
+        optimized = load_translator(lang, language_models[lang], backend="ctranslate2")
+
+        expected = translate_all(reference, SAMPLE_SENTENCES)
+        actual = translate_all(optimized, SAMPLE_SENTENCES)
+        identical = sum(a == b for a, b in zip(expected, actual))
+        similarity = sum(difflib.SequenceMatcher(None, a, b).ratio() for a, b in zip(expected, actual)) / len(expected)
+
+        ref_sentences, ref_words = throughput(reference, sentences, args.runs)
+        opt_sentences, opt_words = throughput(optimized, sentences, args.runs)
+
+        print(f"{lang}:")
+        print(f"  Parity:       {identical}/{len(expected)} identical, mean similarity {similarity:.3f}")
+        print(f"  transformers: {ref_sentences:.1f} sentences/s, {ref_words:.0f} words/s")
+        print(f"  ctranslate2:  {opt_sentences:.1f} sentences/s, {opt_words:.0f} words/s "
+              f"({opt_sentences / ref_sentences:.1f}x)")
+        for a, b in zip(expected, actual):
+            if a != b:
+                print(f"    transformers: {a}\n    ctranslate2:  {b}")
+
+        del reference, optimized
+
+
+if __name__ == "__main__":
+    main()
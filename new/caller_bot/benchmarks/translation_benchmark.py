@@ -0,0 +1,98 @@
+"""
+Measure translation latency for long answers, before and after sentence
+batching, and how much each approach stalls the event loop.
+
+"before" replays the old handling: 100-word slices translated one pipeline
+call at a time, directly inside the async endpoint. "after" splits on
+sentence boundaries and makes one batched pipeline call in the translation
+executor. While each runs, a heartbeat task ticks every 10 ms; the longest
+gap between ticks is how long any other request would have waited.
+
+The model is loaded once before timing, so load time is not included.
+
+Usage (from the caller_bot directory):
+
+    python benchmarks/translation_benchmark.py --lang hindi --sentences 40 --runs 3
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lang import translators, translate, split_sentences, translation_executor
+
+SAMPLE_SENTENCES = [
+    "You have the right to file a complaint at the nearest police station.",
+    "If the police refuse to register an FIR, you can approach the Superintendent of Police in writing.",
+    "Keep copies of every document you submit, along with the acknowledgement.",
+    "The consumer forum can order a refund, replacement or compensation for deficient service.",
+    "Under the Right to Information Act, a public authority must reply within thirty days.",
+]
+
+
+def translate_in_slices(translator, input_text):
+    """The old approach: fixed 100-word slices, one pipeline call each."""
+    words = input_text.split()
+    translated_text = ""
+    for i in range(0, len(words), 100):
+        translated = translator(" ".join(words[i:i + 100]), max_length=512)
+        translated_text += translated[0]["translation_text"] + " "
+    return translated_text.strip()
+
+
+async def heartbeat(stop, gaps):
+    last = time.perf_counter()
+    while not stop.is_set():
+        await asyncio.sleep(0.01)
+        now = time.perf_counter()
+        gaps.append(now - last - 0.01)
+        last = now
+
+
+async def timed(work):
+    stop, gaps = asyncio.Event(), []
+    beat = asyncio.create_task(heartbeat(stop, gaps))
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await work()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await beat
+    return elapsed, max(gaps, default=0.0)
+
+
+async def run(translator, text, runs):
+    async def before():
+        translate_in_slices(translator, text)
+
+    async def after():
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(translation_executor, translate, translator, text)
+
+    for name, work in (("before (100-word slices, inline)", before), ("after (batched sentences, executor)", after)):
+        results = [await timed(work) for _ in range(runs)]
+        print(f"{name}:")
+        print(f"  Latency:        {min(r[0] for r in results) * 1000:.0f} ms (best of {runs})")
+        print(f"  Max loop stall: {max(r[1] for r in results) * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sliced and batched translation of long answers")
+    parser.add_argument("--lang", default="hindi", help="Target language")
+    parser.add_argument("--sentences", type=int, default=40, help="Sentences in the answer")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per approach")
+    args = parser.parse_args()
+
+    text = " ".join(SAMPLE_SENTENCES[i % len(SAMPLE_SENTENCES)] for i in range(args.sentences))
+    print(f"Answer: {len(text.split())} words, {len(split_sentences(text))} segments")
+
+    translator = translators.get(args.lang)
+    translate(translator, SAMPLE_SENTENCES[0])  # warm up
+    asyncio.run(run(translator, text, args.runs))
+
+
+if __name__ == "__main__":
+    main()
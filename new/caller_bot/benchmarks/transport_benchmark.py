@@ -0,0 +1,90 @@
+"""
+Compare per-stage latency of answering one IVR question over HTTP and
+in-process.
+
+Each run transcribes a recording, asks a bot the transcribed question and
+renders the answer as speech, exactly as ``process_question`` does. The
+HTTP transport needs the RAG API (RAG_API_URL) and the translator service
+(TRANSLATOR_API) running; the in-process transport loads the bots and the
+translator in this process. The first run of each transport warms caches
+and connections and is not counted.
+
+Each stage is timed here, around the transport call, so HTTP figures
+include the round trip. In-process runs also report the finer stages that
+``metrics`` records inside the bots, the STT backend and the translator.
+Both come from ``metrics.snapshot``.
+
+Repeated runs of the same recording hit the translation and audio caches,
+so the TTS figures are for cached answers.
+
+Usage (from the caller_bot directory):
+
+    python benchmarks/transport_benchmark.py --recording-url https://.../question.mp3 \
+        --bot "RTI Bot" --language hindi --runs 5
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+CALLER_BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, CALLER_BOT_DIR)
+sys.path.insert(0, os.getenv("MULTI_BOT_DIR", os.path.join(os.path.dirname(CALLER_BOT_DIR), "multi_bot")))
+
+import metrics
+from rag_transport import get_transport, STAGES
+
+
+async def answer(transport, recording_url, bot, language):
+    # Unlabelled, unlike the observations made inside the stages
+    with metrics.timed("stt"):
+        question = await transport.transcribe(recording_url, language)
+    with metrics.timed("rag"):
+        answer_text = await transport.query(bot, question)
+    with metrics.timed("tts"):
+        await transport.speak(answer_text, language)
+
+
+def print_entry(name, entry):
+    print(f"  {name:<14} avg {entry['avg_ms']:>8.1f} ms   p95 {entry['p95_ms']:>8.1f} ms")
+
+
+async def run(mode, args):
+    transport = get_transport(mode)
+    await transport.start()
+    await answer(transport, args.recording_url, args.bot, args.language)  # warm up
+    metrics.reset()
+
+    start = time.perf_counter()
+    for _ in range(args.runs):
+        await answer(transport, args.recording_url, args.bot, args.language)
+    total = (time.perf_counter() - start) / args.runs
+
+    entries = metrics.snapshot()
+    print(f"{mode}:")
+    caller = {entry["stage"]: entry for entry in entries if not entry["channel"]}
+    for stage in STAGES:
+        if stage in caller:
+            print_entry(stage, caller[stage])
+    for entry in entries:
+        if entry["channel"]:
+            print_entry(f"  {entry['stage']}", entry)
+    print(f"  total avg {total * 1000:.1f} ms per question")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare HTTP and in-process IVR transports")
+    parser.add_argument("--recording-url", required=True, help="Recording of a spoken question")
+    parser.add_argument("--bot", default="RTI Bot", help="Bot to ask")
+    parser.add_argument("--language", default="english", help="Caller's language")
+    parser.add_argument("--runs", type=int, default=5, help="Timed questions per transport")
+    parser.add_argument("--modes", nargs="*", default=["http", "inprocess"], help="Transports to compare")
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        asyncio.run(run(mode, args))
+
+
+if __name__ == "__main__":
+    main()
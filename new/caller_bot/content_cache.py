@@ -0,0 +1,194 @@
+import os
+import time
+import uuid
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(*parts):
+    """Hash the given strings into a cache key."""
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+# Marks an entry that some process is producing
+PENDING_SUFFIX = ".pending"
+
+
+class ContentCache:
+    """
+    Content-addressed files in one directory, bounded in total size.
+
+    File names are derived from a hash of what produced them, so an entry
+    never changes once written and can be served with its name as ETag.
+    When the directory grows past ``max_bytes`` the least recently used
+    files are deleted. Recency survives restarts because every hit also
+    bumps the file's modification time.
+
+    Several processes may share the directory. Each indexes the files it
+    wrote or has been asked for; an entry another process wrote is found
+    on disk and indexed on first use. An entry being produced can be
+    marked pending, so other processes know it is worth waiting for.
+    """
+
+    def __init__(self, directory, max_bytes):
+        """
+        Args:
+            directory (str): Where entries are stored; created if missing
+            max_bytes (int): Total size at which eviction starts
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._total = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith((".tmp", PENDING_SUFFIX)):
+                # Left behind by a write that never finished
+                os.remove(path)
+                continue
+            st = os.stat(path)
+            self._entries[name] = [st.st_size, st.st_mtime]
+            self._total += st.st_size
+        logger.info(f"Content cache {directory}: {len(self._entries)} entries, {self._total / 1e6:.1f} MB")
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def get(self, name):
+        """Return the path of an entry, marking it recently used, or None."""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                entry = self._adopt(name)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            entry[1] = time.time()
+        try:
+            os.utime(self.path(name))
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(name)
+            return None
+        return self.path(name)
+
+    def put(self, name, write):
+        """
+        Create an entry by calling ``write(tmp_path)``, then publish it atomically.
+
+        Returns:
+            str: Path of the entry
+        """
+        tmp_path = self.path(f"{name}.{uuid.uuid4().hex}.tmp")
+        try:
+            write(tmp_path)
+            os.replace(tmp_path, self.path(name))
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        size = os.path.getsize(self.path(name))
+        with self._lock:
+            self._forget(name)
+            self._entries[name] = [size, time.time()]
+            self._total += size
+            self._evict(keep=name)
+        return self.path(name)
+
+    def mark_pending(self, name):
+        """
+        Announce that an entry is being produced.
+
+        Returns:
+            str: Token for ``clear_pending``
+        """
+        token = uuid.uuid4().hex
+        with open(self.path(name + PENDING_SUFFIX), "w") as f:
+            f.write(token)
+        return token
+
+    def clear_pending(self, name, token):
+        """Remove the pending mark, unless another producer has marked the entry since."""
+        path = self.path(name + PENDING_SUFFIX)
+        try:
+            with open(path) as f:
+                if f.read() != token:
+                    return
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def is_pending(self, name, max_age):
+        """Whether an entry was marked pending less than ``max_age`` seconds ago and is still being produced."""
+        try:
+            return time.time() - os.stat(self.path(name + PENDING_SUFFIX)).st_mtime < max_age
+        except FileNotFoundError:
+            return False
+
+    def get_text(self, name):
+        """Return a cached string, or None."""
+        path = self.get(name)
+        if path is None:
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def put_text(self, name, text):
+        """Cache a string."""
+        def write(tmp_path):
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+        self.put(name, write)
+
+    def _adopt(self, name):
+        """Index an entry written by another process, if it is on disk."""
+        try:
+            st = os.stat(self.path(name))
+        except FileNotFoundError:
+            return None
+        entry = self._entries[name] = [st.st_size, st.st_mtime]
+        self._total += st.st_size
+        self._evict(keep=name)
+        return entry
+
+    def _forget(self, name):
+        entry = self._entries.pop(name, None)
+        if entry:
+            self._total -= entry[0]
+
+    def _evict(self, keep):
+        if self._total <= self.max_bytes:
+            return
+        for name, _ in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if self._total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+            self._forget(name)
+            self._evictions += 1
+
+    def stats(self):
+        """Return entry count, size and hit/miss/eviction counters."""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions
+            }
@@ -1,14 +1,26 @@
 from fastapi import FastAPI, Request, Form, HTTPException
-from fastapi.responses import PlainTextResponse
-import httpx
+from fastapi.responses import PlainTextResponse, Response
 import logging
+import asyncio
 import os
-import uvicorn
+import sys
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# Shared modules from the multi_bot service
+MULTI_BOT_DIR = os.getenv(
+    "MULTI_BOT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "multi_bot")
+)
+sys.path.insert(0, MULTI_BOT_DIR)
+
+from http_pool import get_http_pool
+from rag_transport import get_transport
+import metrics
+from session_store import get_session_store
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -40,64 +52,131 @@ bot_mapping = {
     4: "Constitution Bot"
 }
 
-# Store user context
-user_sessions = {}
+# Forget a call this many seconds after its last change
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
 
-# Generate welcome menu in various languages
-async def generate_menu_audios():
-    """Generate welcome and menu audio files in supported languages"""
-    lang_clients = httpx.AsyncClient()
-    
-    welcome_text = {
+# Store user context, keyed by CallSid; shared by all workers of a multi-worker server
+user_sessions = get_session_store("ivr", SESSION_TTL)
+
+# App-lifetime keep-alive clients for the translator and RAG APIs
+http_pool = get_http_pool()
+
+# STT, RAG and TTS over HTTP, or called directly when co-located (RAG_TRANSPORT)
+transport = get_transport()
+if transport.mode == "inprocess":
+    app.mount("/translator", transport.translator_app)
+
+# Languages the IVR is offered in
+PROMPT_LANGUAGES = ("english", "hindi")
+
+# Fixed prompts, already written in each language
+STATIC_PROMPTS = {
+    "welcome": {
         "english": "Welcome to the Legal Assistant. Press 1 for English, 2 for Hindi.",
         "hindi": "कानूनी सहायक में आपका स्वागत है। अंग्रेजी के लिए 1 दबाएं, हिंदी के लिए 2 दबाएं।"
-    }
-    
-    menu_text = {
+    },
+    "menu": {
         "english": "Please select an option. Press 1 for RTI information. Press 2 for IPC information. Press 3 for labor laws. Press 4 for constitutional rights.",
         "hindi": "कृपया एक विकल्प चुनें। आरटीआई जानकारी के लिए 1 दबाएं। आईपीसी जानकारी के लिए 2 दबाएं। श्रम कानूनों के लिए 3 दबाएं। संवैधानिक अधिकारों के लिए 4 दबाएं।"
+    },
+    "invalid_selection": {
+        "english": "Invalid selection.",
+        "hindi": "अमान्य चयन।"
+    },
+    "next_question": {
+        "english": "Please ask your next question after the beep.",
+        "hindi": "कृपया बीप के बाद अपना अगला सवाल पूछें।"
+    },
+    "after_answer": {
+        "english": "Press 1 to ask another question. Press 2 to end the call.",
+        "hindi": "एक और सवाल पूछने के लिए 1 दबाएं। कॉल समाप्त करने के लिए 2 दबाएं।"
+    },
+    "thanks": {
+        "english": "Thank you for using our service. Goodbye.",
+        "hindi": "हमारी सेवा का उपयोग करने के लिए धन्यवाद। अलविदा।"
+    },
+    "goodbye": {
+        "english": "Thank you for using our Legal Assistant. Goodbye.",
+        "hindi": "हमारे लीगल असिस्टेंट का उपयोग करने के लिए धन्यवाद। अलविदा।"
+    },
+    "record_failed": {
+        "english": "We couldn't record your question. Please try again later.",
+        "hindi": "हम आपका सवाल रिकॉर्ड नहीं कर सके। कृपया बाद में पुनः प्रयास करें।"
+    },
+    "error": {
+        "english": "Sorry, we couldn't process your request. Please try again later.",
+        "hindi": "क्षमा करें, हम आपका अनुरोध पूरा नहीं कर सके। कृपया बाद में पुनः प्रयास करें।"
     }
+}
+
+# Prompts naming the selected bot, rendered once per bot
+BOT_PROMPTS = {
+    "selected": {
+        "english": "You've selected {bot}. Please ask your question after the beep.",
+        "hindi": "आपने {bot} का चयन किया है। कृपया बीप के बाद अपना सवाल पूछें।"
+    }
+}
+
+def bot_prompt(name, bot):
+    """Key of a bot-parameterized prompt, e.g. "selected:RTI Bot"."""
+    return f"{name}:{bot}"
+
+# Every prompt's text, by (prompt, language)
+PROMPT_TEXTS = {
+    (name, lang): text
+    for name, texts in STATIC_PROMPTS.items()
+    for lang, text in texts.items()
+}
+PROMPT_TEXTS.update({
+    (bot_prompt(name, bot), lang): text.format(bot=bot)
+    for name, texts in BOT_PROMPTS.items()
+    for bot in bot_mapping.values()
+    for lang, text in texts.items()
+})
+
+# Audio file for each prompt, by (prompt, language); filled in at startup so
+# moving through the menus never calls the translator
+prompt_audio = {}
+
+async def render_prompt(name, lang):
+    """Synthesize one prompt and record its audio file."""
+    prompt_audio[(name, lang)] = await transport.render(PROMPT_TEXTS[(name, lang)], lang)
+
+async def prerender_prompts():
+    """Render every prompt in every language, concurrently"""
+    keys = [key for key in PROMPT_TEXTS if key[1] in PROMPT_LANGUAGES]
+    results = await asyncio.gather(*(render_prompt(*key) for key in keys), return_exceptions=True)
     
-    # Map to store audio file paths
-    audio_files = {}
-    
-    for lang, text in welcome_text.items():
-        try:
-            # Create welcome audio
-            response = await lang_clients.post(
-                f"{TRANSLATOR_API}/translate/{lang}",
-                json={"text": text}
-            )
-            response.raise_for_status()
-            audio_files[f"welcome_{lang}"] = response.json()["audio_file"]
-            
-            # Create menu audio
-            response = await lang_clients.post(
-                f"{TRANSLATOR_API}/translate/{lang}",
-                json={"text": menu_text[lang]}
-            )
-            response.raise_for_status()
-            audio_files[f"menu_{lang}"] = response.json()["audio_file"]
-            
-            logger.info(f"Created menu audios for {lang}")
-        except Exception as e:
-            logger.error(f"Failed to create {lang} audios: {e}")
-    
-    await lang_clients.aclose()
-    return audio_files
+    for key, result in zip(keys, results):
+        if isinstance(result, Exception):
+            logger.error(f"Failed to render prompt {key}: {result}")
+    logger.info(f"Rendered {len(prompt_audio)}/{len(keys)} prompts")
 
-# Initialize audio files - will be populated during startup
-menu_audios = {}
+def play_prompt(name, language):
+    """
+    TwiML that plays a prompt in the caller's language.
+    
+    Falls back to having Exotel speak the English text if the prompt could
+    not be rendered at startup.
+    """
+    audio_file = prompt_audio.get((name, language))
+    if audio_file:
+        return f"<Play>{transport.audio_url(audio_file)}</Play>"
+    return f"<Say>{PROMPT_TEXTS[(name, 'english')]}</Say>"
 
 @app.on_event("startup")
 async def startup_event():
-    """Generate menu audios on startup"""
-    global menu_audios
+    """Prepare the transport and render all prompts on startup"""
     try:
-        menu_audios = await generate_menu_audios()
-        logger.info("Generated menu audio files")
+        await transport.start()
+        await prerender_prompts()
     except Exception as e:
-        logger.error(f"Failed to generate menu audios: {e}")
+        logger.error(f"Failed to render prompts: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled upstream connections"""
+    await http_pool.aclose()
 
 @app.get("/")
 def read_root():
@@ -115,12 +194,10 @@ async def welcome_ivr(
     # If no digits entered, play welcome message
     if not digits_entered:
         # Construct Exotel OBD flow XML to play welcome and gather digits
-        welcome_audio = menu_audios.get("welcome_english", "")
-        
         response_xml = f"""<?xml version="1.0" encoding="UTF-8"?>
         <Response>
-            <Play>{TRANSLATOR_API}/audio/{welcome_audio}</Play>
-            <GetDigits timeout="5" numDigits="1" callbackUrl="{request.url}"/>
+            {play_prompt("welcome", "english")}
+            <GetDigits timeout="5" numDigits="1" callbackUrl="/ivr/welcome"/>
         </Response>
         """
         return PlainTextResponse(content=response_xml, media_type="application/xml")
@@ -129,11 +206,9 @@ async def welcome_ivr(
     lang = "english" if digits_entered == "1" else "hindi" if digits_entered == "2" else "english"
     
     # Play menu options in selected language
-    menu_audio = menu_audios.get(f"menu_{lang}", "")
-    
     response_xml = f"""<?xml version="1.0" encoding="UTF-8"?>
     <Response>
-        <Play>{TRANSLATOR_API}/audio/{menu_audio}</Play>
+        {play_prompt("menu", lang)}
         <GetDigits timeout="5" numDigits="1" callbackUrl="/ivr/menu/{lang}"/>
     </Response>
     """
@@ -152,12 +227,10 @@ async def menu_selection(
     # Validate input
     if not digits_entered or digits_entered not in ["1", "2", "3", "4"]:
         # Invalid or no input, replay menu
-        menu_audio = menu_audios.get(f"menu_{language}", "")
-        
         response_xml = f"""<?xml version="1.0" encoding="UTF-8"?>
         <Response>
-            <Say>Invalid selection.</Say>
-            <Play>{TRANSLATOR_API}/audio/{menu_audio}</Play>
+            {play_prompt("invalid_selection", language)}
+            {play_prompt("menu", language)}
             <GetDigits timeout="5" numDigits="1" callbackUrl="/ivr/menu/{language}"/>
         </Response>
         """
@@ -167,47 +240,19 @@ async def menu_selection(
     option_num = int(digits_entered)
     selected_bot = bot_mapping.get(option_num)
     
-    user_sessions[CallSid] = {
+    user_sessions.set(CallSid, {
         "selected_bot": selected_bot,
         "language": language
-    }
+    })
     
-    # Prompt user to ask a question
-    prompt_text = {
-        "english": f"You've selected {selected_bot}. Please ask your question after the beep.",
-        "hindi": f"आपने {selected_bot} का चयन किया है। कृपया बीप के बाद अपना सवाल पूछें।"
-    }.get(language, f"You've selected {selected_bot}. Please ask your question after the beep.")
-
-    try:
-        # Get translated prompt
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{TRANSLATOR_API}/translate/{language}",
-                json={"text": prompt_text}
-            )
-            response.raise_for_status()
-            prompt_data = response.json()
-            audio_file = prompt_data["audio_file"]
-            
-            # Ask user to record their question
-            response_xml = f"""<?xml version="1.0" encoding="UTF-8"?>
-            <Response>
-                <Play>{TRANSLATOR_API}/audio/{audio_file}</Play>
-                <Record maxLength="30" playBeep="true" callbackUrl="/ivr/process_question/{CallSid}"/>
-            </Response>
-            """
-            return PlainTextResponse(content=response_xml, media_type="application/xml")
-    except Exception as e:
-        logger.error(f"Error creating prompt: {e}")
-        
-        # Fallback response
-        response_xml = """<?xml version="1.0" encoding="UTF-8"?>
-        <Response>
-            <Say>Sorry, we couldn't process your request. Please try again later.</Say>
-            <Hangup/>
-        </Response>
-        """
-        return PlainTextResponse(content=response_xml, media_type="application/xml")
+    # Ask user to record their question
+    response_xml = f"""<?xml version="1.0" encoding="UTF-8"?>
+    <Response>
+        {play_prompt(bot_prompt("selected", selected_bot), language)}
+        <Record maxLength="30" playBeep="true" callbackUrl="/ivr/process_question/{CallSid}"/>
+    </Response>
+    """
+    return PlainTextResponse(content=response_xml, media_type="application/xml")
 
 @app.post("/ivr/process_question/{call_sid}")
 async def process_question(
@@ -220,74 +265,59 @@ async def process_question(
     """Process the recorded question and get answer from RAG"""
     logger.info(f"Processing question for Call: {call_sid}, Recording: {RecordingUrl}, Status: {RecordingStatus}")
     
+    session = user_sessions.get(call_sid, {})
+    language = session.get("language", "english")
+    
     if RecordingStatus != "completed" or not RecordingUrl:
-        response_xml = """<?xml version="1.0" encoding="UTF-8"?>
+        response_xml = f"""<?xml version="1.0" encoding="UTF-8"?>
         <Response>
-            <Say>We couldn't record your question. Please try again later.</Say>
+            {play_prompt("record_failed", language)}
             <Hangup/>
         </Response>
         """
         return PlainTextResponse(content=response_xml, media_type="application/xml")
     
     try:
-        # Get session data
-        session = user_sessions.get(call_sid, {})
         selected_bot = session.get("selected_bot")
-        language = session.get("language", "english")
         
         if not selected_bot:
             raise ValueError("No bot selected for this call")
         
         # 1. Convert speech to text
-        async with httpx.AsyncClient() as client:
-            # Send recording to speech-to-text service
-            stt_response = await client.post(
-                f"{RAG_API_URL}/speech-to-text",
-                json={"audio_url": RecordingUrl, "language": language}
-            )
-            stt_response.raise_for_status()
-            stt_data = stt_response.json()
-            question_text = stt_data["text"]
-            
-            logger.info(f"Transcribed question: {question_text}")
-            
-            # 2. Query RAG API with the question
-            rag_response = await client.post(
-                f"{RAG_API_URL}/bots/{selected_bot}/query",
-                json={"query": question_text}
-            )
-            rag_response.raise_for_status()
-            rag_data = rag_response.json()
-            answer_text = rag_data["answer"]
-            
-            # 3. Convert answer to speech in the selected language
-            tts_response = await client.post(
-                f"{RAG_API_URL}/text-to-speech",
-                json={"text": answer_text, "language": language}
-            )
-            tts_response.raise_for_status()
-            tts_data = tts_response.json()
-            audio_file = tts_data["audio_file"]
-            
-            # 4. Play the answer to the user with option to ask another question
-            response_xml = f"""<?xml version="1.0" encoding="UTF-8"?>
-            <Response>
-                <Play>{RAG_API_URL}/audio/{audio_file}</Play>
-                <Gather numDigits="1" timeout="5" action="/ivr/after_answer/{call_sid}">
-                    <Say>Press 1 to ask another question. Press 2 to end the call.</Say>
-                </Gather>
-                <Say>Thank you for using our service. Goodbye.</Say>
-                <Hangup/>
-            </Response>
-            """
-            return PlainTextResponse(content=response_xml, media_type="application/xml")
+        question_text = await transport.transcribe(RecordingUrl, language, selected_bot)
+        
+        logger.info(f"Transcribed question: {question_text}")
+        
+        # 2. Query the bot with the question
+        answer_text = await transport.query(selected_bot, question_text, language)
+        
+        # 3. Speak the answer in the selected language, sentence by sentence:
+        # the first segment is ready now, later ones finish rendering while it plays
+        audio_files = await transport.speak(answer_text, language, selected_bot)
+        plays = "\n".join(
+            f"            <Play>{transport.audio_url(audio_file)}</Play>"
+            for audio_file in audio_files
+        )
+        
+        # 4. Play the answer to the user with option to ask another question
+        response_xml = f"""<?xml version="1.0" encoding="UTF-8"?>
+        <Response>
+{plays}
+            <Gather numDigits="1" timeout="5" action="/ivr/after_answer/{call_sid}">
+                {play_prompt("after_answer", language)}
+            </Gather>
+            {play_prompt("thanks", language)}
+            <Hangup/>
+        </Response>
+        """
+        return PlainTextResponse(content=response_xml, media_type="application/xml")
     except Exception as e:
         logger.error(f"Error processing question: {e}")
         
         # Fallback response
-        response_xml = """<?xml version="1.0" encoding="UTF-8"?>
+        response_xml = f"""<?xml version="1.0" encoding="UTF-8"?>
         <Response>
-            <Say>Sorry, we couldn't process your question. Please try again later.</Say>
+            {play_prompt("error", language)}
             <Hangup/>
         </Response>
         """
@@ -309,41 +339,19 @@ async def after_answer(
     
     if Digits == "1" and selected_bot:
         # User wants to ask another question
-        prompt_text = {
-            "english": "Please ask your next question after the beep.",
-            "hindi": "कृपया बीप के बाद अपना अगला सवाल पूछें।"
-        }.get(language, "Please ask your next question after the beep.")
-        
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{TRANSLATOR_API}/translate/{language}",
-                    json={"text": prompt_text}
-                )
-                response.raise_for_status()
-                prompt_data = response.json()
-                audio_file = prompt_data["audio_file"]
-                
-                # Ask user to record their next question
-                response_xml = f"""<?xml version="1.0" encoding="UTF-8"?>
-                <Response>
-                    <Play>{TRANSLATOR_API}/audio/{audio_file}</Play>
-                    <Record maxLength="30" playBeep="true" callbackUrl="/ivr/process_question/{call_sid}"/>
-                </Response>
-                """
-                return PlainTextResponse(content=response_xml, media_type="application/xml")
-        except Exception as e:
-            logger.error(f"Error creating prompt: {e}")
+        response_xml = f"""<?xml version="1.0" encoding="UTF-8"?>
+        <Response>
+            {play_prompt("next_question", language)}
+            <Record maxLength="30" playBeep="true" callbackUrl="/ivr/process_question/{call_sid}"/>
+        </Response>
+        """
+        return PlainTextResponse(content=response_xml, media_type="application/xml")
     
     # Default: end call
-    goodbye_text = {
-        "english": "Thank you for using our Legal Assistant. Goodbye.",
-        "hindi": "हमारे लीगल असिस्टेंट का उपयोग करने के लिए धन्यवाद। अलविदा।"
-    }.get(language, "Thank you for using our Legal Assistant. Goodbye.")
-    
+    user_sessions.delete(call_sid)
     response_xml = f"""<?xml version="1.0" encoding="UTF-8"?>
     <Response>
-        <Say>{goodbye_text}</Say>
+        {play_prompt("goodbye", language)}
         <Hangup/>
     </Response>
     """
@@ -354,14 +362,15 @@ async def health_check():
     """Health check endpoint"""
     try:
         # Check if RAG API is accessible
-        async with httpx.AsyncClient() as client:
-            rag_health = await client.get(f"{RAG_API_URL}/health", timeout=2.0)
-            rag_health.raise_for_status()
+        if transport.mode == "http":
+            await http_pool.arequest("rag", "GET", f"{RAG_API_URL}/health", timeout=2.0)
             
         return {
             "status": "healthy",
-            "rag_api": "connected",
-            "sessions_active": len(user_sessions)
+            "rag_api": "connected" if transport.mode == "http" else "inprocess",
+            "sessions": user_sessions.stats(),
+            "prompts_rendered": len(prompt_audio),
+            "http": http_pool.stats()
         }
     except Exception as e:
         logger.error(f"Health check failed: {e}")
@@ -371,5 +380,13 @@ async def health_check():
             "sessions_active": len(user_sessions)
         }
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage latency histograms in the Prometheus text format"""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
-    uvicorn.run("exotel_ivr:app", host="0.0.0.0", port=8080, reload=True)
+    import serving
+    
+    # Pre-fork workers (SERVER_MODE=dev for a single auto-reloading process)
+    serving.run(app, 8080, asgi=True, import_string="exotel_ivr:app", preload=transport.preload)
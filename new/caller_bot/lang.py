@@ -1,11 +1,27 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from pydantic import BaseModel
-from transformers import pipeline
+from typing import Literal
 from gtts import gTTS
 import logging
-import uuid
+import asyncio
 import os
-from fastapi.responses import FileResponse
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fastapi.responses import FileResponse, Response
+from starlette.concurrency import run_in_threadpool
+from content_cache import ContentCache, content_key
+from model_registry import ModelRegistry
+from translation_backends import load_translator
+
+# Shared modules from the multi_bot service
+sys.path.insert(0, os.getenv(
+    "MULTI_BOT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "multi_bot")
+))
+
+import metrics
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -15,6 +31,12 @@ app = FastAPI(title="Indian Language Translator API")
 
 class TextIn(BaseModel):
     text: str
+    # False when the text is already in the target language and only needs speaking
+    translate: bool = True
+    # Metric labels: the bot that wrote the text and the channel it is spoken on.
+    # Values metrics does not know are recorded as "other".
+    bot: str = ""
+    channel: Literal["", "api", "ivr", "phone", "web", "whatsapp"] = ""
 
 # Supported language to model map
 language_models = {
@@ -24,45 +46,80 @@ language_models = {
     "urdu": "Helsinki-NLP/opus-mt-en-ur",
 }
 
-# Preload models
-translators = {
-    lang: pipeline("translation", model=model)
-    for lang, model in language_models.items()
+# gTTS voice for each language
+tts_languages = {
+    "english": "en",
+    "hindi": "hi",
+    "malayalam": "ml",
+    "marathi": "mr",
+    "urdu": "ur",
 }
 
+# Models are loaded on first use, with the backend chosen by TRANSLATION_BACKEND;
+# at most TRANSLATION_MAX_MODELS stay in memory
+translators = ModelRegistry(
+    lambda lang: load_translator(lang, language_models[lang]),
+    max_resident=int(os.getenv("TRANSLATION_MAX_MODELS", "2"))
+)
+
+# Languages loaded at startup, busiest first
+PRELOAD_LANGUAGES = [
+    lang.strip() for lang in os.getenv("TRANSLATION_PRELOAD", "hindi").split(",")
+    if lang.strip() in language_models
+]
+
+# Model inference runs here so the event loop keeps serving other requests
+translation_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TRANSLATION_WORKERS", "2")),
+    thread_name_prefix="translate"
+)
+
+# Segments per forward pass, and the longest segment sent to the model
+TRANSLATION_BATCH_SIZE = int(os.getenv("TRANSLATION_BATCH_SIZE", "16"))
+MAX_SEGMENT_CHARS = 400
+
+# End of a sentence: ., ! or ? (or the Devanagari danda or Urdu full stop) followed by whitespace
+SENTENCE_END = re.compile(r"(?<=[.!?\u0964\u06d4])\s+")
+
+# gTTS calls Google over the network; renders run here, off the event loop
+tts_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TTS_WORKERS", "4")),
+    thread_name_prefix="tts"
+)
+
+# Audio being rendered, by file name; /audio waits on these instead of returning 404
+pending_renders = {}
+pending_renders_lock = threading.Lock()
+
+# Longest a request waits for a pending render, and the size /speak groups
+# sentences into after the first one
+RENDER_WAIT_SECONDS = float(os.getenv("TTS_RENDER_WAIT", "20"))
+RENDER_POLL_SECONDS = 0.2
+SPEECH_SEGMENT_CHARS = int(os.getenv("TTS_SEGMENT_CHARS", "300"))
+
+# Translations and synthesized audio, keyed by a hash of their input
+CACHE_DIR = os.getenv("TTS_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tts_cache"))
+cache = ContentCache(CACHE_DIR, int(os.getenv("TTS_CACHE_MAX_MB", "500")) * 1024 * 1024)
+
+# Audio names handed out by /translate and /speak; anything else is rejected by /audio
+AUDIO_NAME = re.compile(r"^[0-9a-f]{64}\.mp3$")
+
+@app.on_event("startup")
+def preload_models():
+    translators.preload(PRELOAD_LANGUAGES)
+
 @app.get("/")
 def read_root():
     return {"message": "Translator API is running"}
 
 @app.post("/translate/{lang}")
 async def translate_text_endpoint(lang: str, text_in: TextIn):
-    translator = translators.get(lang)
-    if not translator:
-        logger.error(f"Model for '{lang}' could not be loaded or is unsupported.")
-        raise HTTPException(status_code=400, detail=f"Model for '{lang}' could not be loaded or is unsupported.")
-
-    input_text = text_in.text
-    words = input_text.split()
-    max_words = 100
-    translated_text = ""
-
-    for i in range(0, len(words), max_words):
-        chunk = " ".join(words[i:i+max_words])
-        try:
-            logger.info(f"Translating words {i+1} to {min(i+max_words, len(words))}")
-            translated = translator(chunk, max_length=512)
-            translated_text += translated[0]['translation_text'] + " "
-        except Exception as e:
-            logger.error(f"Translation failed for words {i+1}-{i+max_words} with error: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Translation failed for words {i+1}-{i+max_words}.")
-
-    translated_text = translated_text.strip()
-
-    # Convert to speech
+    translated_text = await translate_cached(lang, text_in.text, text_in.translate)
+    
+    # Audio is keyed by what is spoken, so inputs with the same translation share it
+    file_name = start_render(translated_text, lang, text_in.bot, text_in.channel)
     try:
-        tts = gTTS(text=translated_text, lang='hi' if lang == 'hindi' else 'ur' if lang == 'urdu' else 'ml' if lang == 'malayalam' else 'mr')
-        file_name = f"tts_{uuid.uuid4().hex}.mp3"
-        tts.save(file_name)
+        await wait_for_render(file_name)
     except Exception as e:
         logger.error(f"TTS conversion failed: {str(e)}")
         raise HTTPException(status_code=500, detail="Text-to-speech conversion failed.")
@@ -73,10 +130,253 @@ async def translate_text_endpoint(lang: str, text_in: TextIn):
         "audio_file": file_name
     }
 
+@app.post("/speak/{lang}")
+async def speak_endpoint(lang: str, text_in: TextIn):
+    """
+    Translate text and synthesize it as an ordered list of audio segments.
+    
+    The first sentence is rendered before responding, so it can be played
+    straight away; the rest render in the background while it plays.
+    Fetching a segment from /audio waits for its render to finish.
+    """
+    translated_text = await translate_cached(lang, text_in.text, text_in.translate)
+    file_names = [
+        start_render(segment, lang, text_in.bot, text_in.channel) for segment in speech_segments(translated_text)
+    ]
+
+    if file_names:
+        try:
+            await wait_for_render(file_names[0])
+        except Exception as e:
+            logger.error(f"TTS conversion failed: {str(e)}")
+            raise HTTPException(status_code=500, detail="Text-to-speech conversion failed.")
+
+    return {
+        "language": lang.capitalize(),
+        "translated_text": translated_text,
+        "audio_files": file_names
+    }
+
+async def translate_cached(lang, input_text, translate=True):
+    """Translate text, reusing an earlier translation of the same text."""
+    if lang not in tts_languages:
+        logger.error(f"Model for '{lang}' could not be loaded or is unsupported.")
+        raise HTTPException(status_code=400, detail=f"Model for '{lang}' could not be loaded or is unsupported.")
+    # English needs no model, and prompts written in the target language only need speaking
+    if lang == "english" or not translate:
+        return input_text
+
+    translation_key = f"{content_key('translation', lang, input_text)}.txt"
+    translated_text = cache.get_text(translation_key)
+    if translated_text is None:
+        # A cold model can take seconds to load; keep the event loop free meanwhile
+        try:
+            translator = await run_in_threadpool(translators.get, lang)
+        except Exception as e:
+            logger.error(f"Model for '{lang}' could not be loaded: {str(e)}")
+            raise HTTPException(status_code=503, detail=f"Model for '{lang}' could not be loaded.")
+        loop = asyncio.get_running_loop()
+        translated_text = await loop.run_in_executor(translation_executor, translate, translator, input_text)
+        cache.put_text(translation_key, translated_text)
+    return translated_text
+
+def speech_segments(text):
+    """
+    Group sentences into the segments /speak renders.
+    
+    The first sentence stands alone so the caller hears something as soon
+    as possible; later ones are merged up to SPEECH_SEGMENT_CHARS to keep
+    the number of audio fetches down.
+    """
+    sentences = split_sentences(text)
+    if not sentences:
+        return []
+    segments = [sentences[0]]
+    current = ""
+    for sentence in sentences[1:]:
+        if current and len(current) + len(sentence) + 1 > SPEECH_SEGMENT_CHARS:
+            segments.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        segments.append(current)
+    return segments
+
+def start_render(text, lang, bot="", channel=""):
+    """
+    Start synthesizing ``text`` in ``lang`` unless it is cached or already rendering.
+    
+    ``bot`` and ``channel`` only label the render's metrics.
+    
+    Returns:
+        str: File name the audio will be served under
+    """
+    tts_lang = tts_languages.get(lang, "mr")
+    file_name = f"{content_key('tts', tts_lang, text)}.mp3"
+    with pending_renders_lock:
+        if file_name in pending_renders or cache.get(file_name) is not None:
+            return file_name
+        # Tells /audio in other worker processes that the file is on its way
+        token = cache.mark_pending(file_name)
+        future = tts_executor.submit(render_audio, file_name, text, lang, tts_lang, bot, channel)
+        pending_renders[file_name] = future
+
+    def done(future):
+        with pending_renders_lock:
+            pending_renders.pop(file_name, None)
+        cache.clear_pending(file_name, token)
+        if future.exception():
+            logger.error(f"TTS conversion failed for {file_name}: {future.exception()}")
+
+    future.add_done_callback(done)
+    return file_name
+
+def render_audio(file_name, text, lang, tts_lang, bot="", channel=""):
+    with metrics.timed("tts", bot=bot, language=lang, channel=channel):
+        cache.put(file_name, gTTS(text=text, lang=tts_lang).save)
+
+async def wait_for_file(file_name, timeout=RENDER_WAIT_SECONDS):
+    """
+    Wait while another worker process renders an audio file.
+
+    That process marks the file pending in the shared cache directory until
+    its render finishes, so only the mark is polled.
+
+    Raises:
+        asyncio.TimeoutError: If the file is still pending after ``timeout``
+    """
+    loop = asyncio.get_running_loop()
+    give_up = loop.time() + timeout
+    while cache.is_pending(file_name, RENDER_WAIT_SECONDS):
+        if loop.time() >= give_up:
+            raise asyncio.TimeoutError
+        await asyncio.sleep(RENDER_POLL_SECONDS)
+
+async def wait_for_render(file_name, timeout=RENDER_WAIT_SECONDS):
+    """Wait until a pending render has finished; raises its error if it failed."""
+    with pending_renders_lock:
+        future = pending_renders.get(file_name)
+    if future is not None:
+        await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+
+def split_sentences(text, max_chars=MAX_SEGMENT_CHARS):
+    """
+    Split text into sentences, breaking any longer than ``max_chars`` at clause or word boundaries.
+    
+    MarianMT translates each segment independently, so cutting mid-sentence
+    (as fixed word counts do) garbles the translation around the cut.
+    """
+    segments = []
+    for sentence in SENTENCE_END.split(text.strip()):
+        sentence = sentence.strip()
+        while len(sentence) > max_chars:
+            cut = max(sentence.rfind(sep, 0, max_chars) for sep in (", ", "; ", ": "))
+            if cut <= 0:
+                cut = sentence.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars - 1
+            segments.append(sentence[:cut + 1].strip())
+            sentence = sentence[cut + 1:].strip()
+        if sentence:
+            segments.append(sentence)
+    return segments
+
+def translate(translator, input_text):
+    """Translate text sentence by sentence, in one batched pipeline call."""
+    segments = split_sentences(input_text)
+    if not segments:
+        return ""
+    try:
+        logger.info(f"Translating {len(segments)} segments")
+        translated = translator(segments, max_length=512, batch_size=TRANSLATION_BATCH_SIZE)
+    except Exception as e:
+        logger.error(f"Translation failed with error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Translation failed.")
+
+    return " ".join(item['translation_text'].strip() for item in translated)
+
 @app.get("/audio/{file_name}")
-async def get_audio(file_name: str):
-    path = f"./{file_name}"
-    if os.path.exists(path):
-        return FileResponse(path, media_type="audio/mpeg", filename=file_name)
+async def get_audio(file_name: str, request: Request):
+    """
+    Serve synthesized audio.
+    
+    Files are content-addressed and never change, so the name doubles as a
+    strong ETag and clients may cache them indefinitely. Single byte ranges
+    are supported for players that seek or resume. A segment from /speak
+    that is still rendering, in this or another worker process, is waited
+    for rather than reported missing.
+    """
+    if not AUDIO_NAME.match(file_name):
+        raise HTTPException(status_code=404, detail="Audio file not found")
+    with pending_renders_lock:
+        rendering_here = file_name in pending_renders
+    try:
+        if rendering_here:
+            await wait_for_render(file_name)
+        elif cache.is_pending(file_name, RENDER_WAIT_SECONDS):
+            await wait_for_file(file_name)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Audio is still being rendered")
+    except Exception:
+        pass  # Render failed; nothing was cached, so fall through to 404
+
+    path = cache.get(file_name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Audio file not found")
+
+    etag = f'"{file_name[:-4]}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes"
+    }
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    size = os.path.getsize(path)
+    byte_range = parse_range(request.headers.get("range"), size)
+    if byte_range is None:
+        return FileResponse(path, media_type="audio/mpeg", filename=file_name, headers=headers)
+    if byte_range == "unsatisfiable":
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+
+    start, end = byte_range
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(content=data, status_code=206, media_type="audio/mpeg", headers=headers)
+
+def parse_range(header, size):
+    """
+    Parse a single-range ``Range`` header.
+    
+    Returns:
+        (start, end) inclusive, None to send the whole file, or "unsatisfiable"
+    """
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", (header or "").strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
     else:
-        raise HTTPException(status_code=404, detail="Audio file not found")
\ No newline at end of file
+        # Suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size or start > end:
+        return "unsatisfiable"
+    return start, end
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """Stage latency histograms in the Prometheus text format."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/cache/stats")
+def cache_stats():
+    return cache.stats()
+
+@app.get("/models/stats")
+def model_stats():
+    """Resident translation models, with load time and memory per language."""
+    return translators.stats()
@@ -0,0 +1,97 @@
+import gc
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def resident_memory():
+    """Resident set size of this process in bytes, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class ModelRegistry:
+    """
+    Loads models on first use and keeps at most ``max_resident`` in memory.
+
+    When a new model would exceed the cap, the least recently used one is
+    dropped. Requests already holding it keep working; its memory is
+    reclaimed once they finish. Concurrent requests for a model that is
+    not loaded yet wait for a single load.
+    """
+
+    def __init__(self, loader, max_resident):
+        """
+        Args:
+            loader: Function taking a key (e.g. a language) and returning its model
+            max_resident (int): Most models kept loaded at once
+        """
+        self.loader = loader
+        self.max_resident = max(1, max_resident)
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {}
+        self._stats = {}
+
+    def get(self, key):
+        """Return the model for ``key``, loading it (and evicting another) if needed."""
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self._stats[key]["requests"] += 1
+                return self._models[key]
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                if key in self._models:
+                    self._models.move_to_end(key)
+                    self._stats[key]["requests"] += 1
+                    return self._models[key]
+
+            rss_before = resident_memory()
+            start = time.time()
+            model = self.loader(key)
+            load_seconds = time.time() - start
+            rss_after = resident_memory()
+
+            memory_mb = None
+            if rss_before is not None and rss_after is not None:
+                memory_mb = round((rss_after - rss_before) / (1024 * 1024), 1)
+            logger.info(f"Loaded model for {key} in {load_seconds:.1f}s ({memory_mb} MB)")
+
+            with self._lock:
+                stats = self._stats.setdefault(key, {"loads": 0, "requests": 0})
+                stats.update(loads=stats["loads"] + 1, load_seconds=round(load_seconds, 2), memory_mb=memory_mb)
+                stats["requests"] += 1
+                self._models[key] = model
+                evicted = []
+                while len(self._models) > self.max_resident:
+                    evicted.append(self._models.popitem(last=False)[0])
+                self._loading.pop(key, None)
+
+        if evicted:
+            logger.info(f"Evicted models for {', '.join(evicted)}")
+            gc.collect()
+        return model
+
+    def preload(self, keys):
+        """Load models ahead of traffic, most important first."""
+        for key in keys[:self.max_resident]:
+            self.get(key)
+
+    def stats(self):
+        """Return which models are resident and per-model load time, memory and use counts."""
+        with self._lock:
+            return {
+                "max_resident": self.max_resident,
+                "resident": list(self._models),
+                "models": {key: dict(stats) for key, stats in self._stats.items()}
+            }
@@ -0,0 +1,159 @@
+"""
+How the IVR reaches speech-to-text, the RAG bots and text-to-speech.
+
+Selected with RAG_TRANSPORT:
+
+- ``http`` (default): calls the RAG API and the translator service over
+  pooled HTTP connections, for when they run on other hosts
+- ``inprocess``: calls ``LegalBotManager``, the STT backend and the
+  translator's functions directly, for when everything is co-located.
+  No request is serialized and no source documents are sent around.
+  The translator app is mounted on the IVR under /translator so the
+  audio it renders can be played from there.
+
+Either way, stage latency is recorded by ``metrics`` in the process that
+does the work, labelled with the ``ivr`` channel.
+"""
+import os
+import asyncio
+import logging
+
+from http_pool import get_http_pool
+
+logger = logging.getLogger(__name__)
+
+TRANSLATOR_API = os.getenv("TRANSLATOR_API", "http://localhost:8000")
+RAG_API_URL = os.getenv("RAG_API_URL", "http://localhost:8000")
+
+# Base URL Exotel fetches in-process audio from; relative when unset
+IVR_PUBLIC_URL = os.getenv("IVR_PUBLIC_URL", "")
+
+# Pipeline stages of one question
+STAGES = ("stt", "rag", "tts")
+
+
+class Transport:
+    """Hooks shared by both transports."""
+
+    mode = None
+
+    def preload(self):
+        """Load what forked server workers should share; called in the master."""
+
+    async def start(self):
+        """Prepare for traffic; called on application startup."""
+
+
+class HTTPTransport(Transport):
+    """Reaches the RAG API and the translator service over HTTP."""
+
+    mode = "http"
+
+    def __init__(self):
+        self.http_pool = get_http_pool()
+
+    async def transcribe(self, audio_url, language, bot=""):
+        response = await self.http_pool.arequest(
+            "rag", "POST", f"{RAG_API_URL}/speech-to-text",
+            json={"audio_url": audio_url, "language": language, "channel": "ivr", "bot": bot}
+        )
+        return response.json()["text"]
+
+    async def query(self, bot, question, language=""):
+        response = await self.http_pool.arequest(
+            "rag", "POST", f"{RAG_API_URL}/bots/{bot}/query",
+            params={
+                "priority": "voice", "profile": "voice", "sources": "false", "channel": "ivr",
+                "language": language
+            },
+            json={"query": question}
+        )
+        return response.json()["answer"]
+
+    async def speak(self, text, language, bot=""):
+        response = await self.http_pool.arequest(
+            "translator", "POST", f"{TRANSLATOR_API}/speak/{language}",
+            json={"text": text, "bot": bot, "channel": "ivr"}
+        )
+        return response.json()["audio_files"]
+
+    async def render(self, text, language):
+        response = await self.http_pool.arequest(
+            "translator", "POST", f"{TRANSLATOR_API}/translate/{language}",
+            json={"text": text, "translate": False, "channel": "ivr"}
+        )
+        return response.json()["audio_file"]
+
+    def audio_url(self, file_name):
+        return f"{TRANSLATOR_API}/audio/{file_name}"
+
+
+class InProcessTransport(Transport):
+    """Calls the bots, the STT backend and the translator in this process."""
+
+    mode = "inprocess"
+
+    def __init__(self):
+        import lang
+        from utils import LegalBotManager
+        from llm_backends import requires_google_api_key
+
+        if requires_google_api_key() and "GOOGLE_API_KEY" not in os.environ:
+            raise ValueError("GOOGLE_API_KEY environment variable not set")
+
+        self.lang = lang
+        self.translator_app = lang.app
+        self.bot_manager = LegalBotManager(google_api_key=os.getenv("GOOGLE_API_KEY"))
+
+    def preload(self):
+        self.bot_manager.preload()
+        # CTranslate2 models cannot be shared across fork; each worker loads them on startup
+        from translation_backends import TRANSLATION_BACKEND
+
+        if TRANSLATION_BACKEND == "transformers":
+            self.lang.preload_models()
+
+    async def start(self):
+        # Startup events of a mounted app do not run, so preload here
+        await asyncio.get_running_loop().run_in_executor(None, self.lang.preload_models)
+
+    async def transcribe(self, audio_url, language, bot=""):
+        from stt_backends import transcribe_recording
+
+        return await asyncio.get_running_loop().run_in_executor(
+            None, lambda: transcribe_recording(audio_url, language, channel="ivr", bot=bot)
+        )
+
+    async def query(self, bot, question, language=""):
+        result = await self.bot_manager.aquery_bot(
+            bot, question, priority="voice", profile="voice", channel="ivr", language=language
+        )
+        return result["result"]
+
+    async def speak(self, text, language, bot=""):
+        result = await self.lang.speak_endpoint(language, self.lang.TextIn(text=text, bot=bot, channel="ivr"))
+        return result["audio_files"]
+
+    async def render(self, text, language):
+        result = await self.lang.translate_text_endpoint(
+            language, self.lang.TextIn(text=text, translate=False, channel="ivr")
+        )
+        return result["audio_file"]
+
+    def audio_url(self, file_name):
+        return f"{IVR_PUBLIC_URL}/translator/audio/{file_name}"
+
+
+def get_transport(mode=None):
+    """
+    Create the transport named by ``mode`` or the RAG_TRANSPORT variable.
+
+    Args:
+        mode (str): "http" or "inprocess"
+    """
+    mode = (mode or os.getenv("RAG_TRANSPORT", "http")).lower()
+    if mode == "http":
+        return HTTPTransport()
+    if mode == "inprocess":
+        return InProcessTransport()
+    raise ValueError(f"Unknown RAG transport: {mode}")
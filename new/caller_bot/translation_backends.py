@@ -0,0 +1,132 @@
+"""
+Translation model backends.
+
+Selected with TRANSLATION_BACKEND:
+
+- ``transformers`` (default): the Hugging Face pipeline, full-precision PyTorch
+- ``ctranslate2``: the same MarianMT models converted to CTranslate2 and
+  quantized to int8, several times faster on CPU. Requires the optional
+  ``ctranslate2`` package and a one-off conversion:
+
+      python translation_backends.py convert hindi marathi
+
+Both backends are called like a translation pipeline, so callers do not
+need to know which one is in use.
+"""
+import os
+import sys
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+TRANSLATION_BACKEND = os.getenv("TRANSLATION_BACKEND", "transformers")
+
+# Where converted models are stored, one directory per language
+CT2_MODEL_DIR = os.getenv("CT2_MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ct2_models"))
+CT2_COMPUTE_TYPE = os.getenv("CT2_COMPUTE_TYPE", "int8")
+CT2_THREADS = int(os.getenv("CT2_THREADS", "0"))  # 0 lets CTranslate2 pick
+# Opus-MT models are configured for beam search with 4 beams; match it so output agrees
+CT2_BEAM_SIZE = int(os.getenv("CT2_BEAM_SIZE", "4"))
+
+
+class CTranslate2Translator:
+    """CTranslate2 model with the call signature of a translation pipeline."""
+
+    def __init__(self, model_dir, model_name):
+        """
+        Args:
+            model_dir (str): Directory written by ``convert``
+            model_name (str): Hugging Face model the conversion came from, for its tokenizer
+        """
+        import ctranslate2
+        from transformers import AutoTokenizer
+
+        self.translator = ctranslate2.Translator(
+            model_dir,
+            device="cpu",
+            compute_type=CT2_COMPUTE_TYPE,
+            intra_threads=CT2_THREADS
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+
+    def __call__(self, texts, max_length=512, batch_size=16):
+        """
+        Translate one string or a list of strings.
+
+        Returns:
+            list: ``{"translation_text": ...}`` per input, like the pipeline
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        tokens = [self.tokenizer.convert_ids_to_tokens(self.tokenizer.encode(text)) for text in texts]
+        results = self.translator.translate_batch(
+            tokens,
+            max_batch_size=batch_size,
+            beam_size=CT2_BEAM_SIZE,
+            max_decoding_length=max_length
+        )
+        return [
+            {"translation_text": self.tokenizer.decode(
+                self.tokenizer.convert_tokens_to_ids(result.hypotheses[0]), skip_special_tokens=True
+            )}
+            for result in results
+        ]
+
+
+def ct2_model_dir(lang):
+    return os.path.join(CT2_MODEL_DIR, lang)
+
+
+def load_translator(lang, model_name, backend=None):
+    """
+    Load the translator for a language with the configured backend.
+
+    Falls back to the transformers pipeline if the CTranslate2 model for
+    the language has not been converted yet.
+    """
+    backend = backend or TRANSLATION_BACKEND
+    if backend == "ctranslate2":
+        if os.path.isdir(ct2_model_dir(lang)):
+            return CTranslate2Translator(ct2_model_dir(lang), model_name)
+        logger.warning(f"No CTranslate2 model for {lang} in {CT2_MODEL_DIR}; using transformers. "
+                       f"Run: python translation_backends.py convert {lang}")
+    elif backend != "transformers":
+        raise ValueError(f"Unknown translation backend: {backend}")
+
+    from transformers import pipeline
+    return pipeline("translation", model=model_name)
+
+
+def convert(lang, model_name, quantization=CT2_COMPUTE_TYPE, force=False):
+    """Convert a Hugging Face MarianMT model to CTranslate2."""
+    from ctranslate2.converters import TransformersConverter
+
+    output_dir = ct2_model_dir(lang)
+    logger.info(f"Converting {model_name} to {output_dir} ({quantization})")
+    TransformersConverter(model_name).convert(output_dir, quantization=quantization, force=force)
+    return output_dir
+
+
+def main():
+    from lang import language_models
+
+    parser = argparse.ArgumentParser(description="Manage CTranslate2 translation models")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="Convert models to CTranslate2")
+    convert_parser.add_argument("languages", nargs="*", help="Languages to convert (default: all)")
+    convert_parser.add_argument("--quantization", default=CT2_COMPUTE_TYPE, help="e.g. int8, int8_float32, float32")
+    convert_parser.add_argument("--force", action="store_true", help="Overwrite existing conversions")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    languages = args.languages or list(language_models)
+    unknown = [lang for lang in languages if lang not in language_models]
+    if unknown:
+        sys.exit(f"Unsupported languages: {', '.join(unknown)}")
+    for lang in languages:
+        convert(lang, language_models[lang], args.quantization, args.force)
+
+
+if __name__ == "__main__":
+    main()
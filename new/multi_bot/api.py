@@ -1,18 +1,22 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks, UploadFile, File, Form, Depends
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Literal
 import os
-import shutil
+import sys
+import time
+import uuid
+import hashlib
 import logging
+import subprocess
 from utils import LegalBotManager
-from ingest.domain_ingestion import (
-    IPCDocumentIngestion,
-    RTIDocumentIngestion, 
-    LaborLawDocumentIngestion,
-    ConstitutionDocumentIngestion
-)
+from llm_backends import requires_google_api_key
+from llm_scheduler import LLMOverloaded
+from stt_backends import transcribe_recording, check_recording_url
+import metrics
+from ingest.jobs import JobQueue
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -39,16 +43,38 @@ app.add_middleware(
 )
 
 # Check for API key
-if "GOOGLE_API_KEY" not in os.environ:
+if requires_google_api_key() and "GOOGLE_API_KEY" not in os.environ:
     logger.error("GOOGLE_API_KEY environment variable not set")
     raise ValueError("GOOGLE_API_KEY environment variable not set")
 
 # Create global bot manager instance
-bot_manager = LegalBotManager(google_api_key=os.environ["GOOGLE_API_KEY"])
+bot_manager = LegalBotManager(google_api_key=os.getenv("GOOGLE_API_KEY"))
+
+# Persistent ingestion job queue, drained by a separate worker process
+ingest_jobs = JobQueue()
+ingest_worker = None
+
+# Upload limits
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024
 
 # Pydantic models for request/response
 class QueryRequest(BaseModel):
     query: str
+    # Seconds within which an answer is needed; slower LLM answers are hedged
+    # and finally replaced by an extractive answer
+    deadline_seconds: Optional[float] = None
+    
+class SpeechToTextRequest(BaseModel):
+    audio_url: str
+    language: Optional[str] = None
+    format: str = "mp3"
+    channel: Literal["api", "ivr", "phone", "web", "whatsapp"] = "api"
+    # Bot the recording's caller chose, for metrics; empty or one of BOT_DESCRIPTIONS
+    bot: str = ""
+
+class SpeechToTextResponse(BaseModel):
+    text: str
     
 class IngestRequest(BaseModel):
     domain: str
@@ -57,9 +83,16 @@ class DocumentResponse(BaseModel):
     content: str
     metadata: Dict[str, Any]
     
+class CitationResponse(BaseModel):
+    sentence: str
+    source: str
+    page: Optional[int] = None
+
 class QueryResponse(BaseModel):
     answer: str
     sources: Optional[List[DocumentResponse]] = None
+    citations: Optional[List[CitationResponse]] = None
+    answered_by: Optional[str] = None
     
 class BotInfoResponse(BaseModel):
     name: str
@@ -70,6 +103,28 @@ class StatusResponse(BaseModel):
     status: str
     message: str
 
+class IngestJobResponse(BaseModel):
+    id: str
+    domain: str
+    kind: str
+    target: Optional[str] = None
+    status: str
+    progress: Dict[str, Any]
+    error: Optional[str] = None
+    cancel_requested: bool
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+class IngestStartResponse(StatusResponse):
+    jobs: List[IngestJobResponse]
+
+class UploadResponse(StatusResponse):
+    filename: str
+    size: int
+    sha256: str
+    job: Optional[IngestJobResponse] = None
+
 # Bot information
 BOT_DESCRIPTIONS = {
     "IPC Bot": "Specialized in Indian Penal Code (IPC) sections, criminal offenses, and punishments.",
@@ -84,6 +139,20 @@ async def health_check():
     """Check if the API is running."""
     return StatusResponse(status="ok", message="API is running")
 
+# Query statistics endpoint
+@app.get("/stats", tags=["System"])
+async def get_stats():
+    """Get query coalescing and LLM scheduler counters, and stage latency percentiles."""
+    stats = bot_manager.get_query_stats()
+    scheduler = stats.pop("llm_scheduler")
+    return {"query_coalescing": stats, "llm_scheduler": scheduler, "stages": metrics.snapshot()}
+
+# Prometheus metrics endpoint
+@app.get("/metrics", tags=["System"])
+async def get_metrics():
+    """Stage latency histograms in the Prometheus text format."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 # Get available bots endpoint
 @app.get("/bots", response_model=List[BotInfoResponse], tags=["Bots"])
 async def get_available_bots():
@@ -102,109 +171,288 @@ async def get_available_bots():
 
 # Query bot endpoint
 @app.post("/bots/{bot_name}/query", response_model=QueryResponse, tags=["Queries"])
-async def query_bot(bot_name: str, request: QueryRequest):
-    """Query a specific bot with a question."""
+async def query_bot(
+    bot_name: str,
+    request: QueryRequest,
+    mode: Literal["generative", "extractive"] = "generative",
+    priority: Literal["voice", "chat", "batch"] = "chat",
+    profile: Literal["default", "voice", "whatsapp", "sms"] = "default",
+    sources: bool = True,
+    channel: Literal["api", "ivr", "phone", "web", "whatsapp"] = "api",
+    language: str = ""
+):
+    """
+    Query a specific bot with a question.
+    
+    ``mode=extractive`` skips the LLM and answers with the retrieved
+    sentences that best match the question, with citations.
+    
+    ``priority`` is the LLM scheduling class. Bulk jobs should send
+    ``batch`` so they never delay live callers; when the LLM is saturated
+    the request may be rejected with 503.
+    
+    ``profile`` tailors the answer to the channel it will be delivered on:
+    shorter, plainer answers for ``voice`` and ``sms``, message-sized ones
+    for ``whatsapp``.
+    
+    ``sources=false`` leaves out the source documents, for callers that
+    only use the answer. ``channel`` and ``language`` label the request's metrics.
+    """
     if bot_name not in BOT_DESCRIPTIONS:
         raise HTTPException(status_code=404, detail=f"Bot '{bot_name}' not found")
+    if language and language not in metrics.LABEL_VALUES["language"]:
+        raise HTTPException(status_code=400, detail=f"Unknown language: {language}")
         
     if bot_name not in bot_manager.get_available_bots():
         raise HTTPException(status_code=400, detail=f"Bot '{bot_name}' is not available. Documents need to be ingested first.")
     
     try:
-        result = bot_manager.query_bot(bot_name, request.query)
+        deadline = None
+        if request.deadline_seconds:
+            deadline = time.monotonic() + request.deadline_seconds
+        result = await bot_manager.aquery_bot(
+            bot_name, request.query, deadline=deadline, mode=mode, priority=priority, profile=profile,
+            channel=channel, language=language
+        )
         
         # Format source documents
-        sources = []
-        if "source_documents" in result:
+        source_docs = []
+        if sources and "source_documents" in result:
             for doc in result["source_documents"]:
-                sources.append(DocumentResponse(
+                source_docs.append(DocumentResponse(
                     content=doc.page_content,
                     metadata=doc.metadata
                 ))
         
         return QueryResponse(
             answer=result["result"],
-            sources=sources
+            sources=source_docs,
+            citations=[CitationResponse(**c) for c in result.get("citations", [])],
+            answered_by=result.get("answered_by")
         )
+    except LLMOverloaded as e:
+        logger.warning(f"Query shed by the LLM scheduler: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         logger.error(f"Error querying bot: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# Background task for document ingestion
-def ingest_documents(domain: str):
-    """Background task to ingest documents for a domain."""
+# Speech-to-text endpoint
+@app.post("/speech-to-text", response_model=SpeechToTextResponse, tags=["Speech"])
+def speech_to_text(request: SpeechToTextRequest):
+    """
+    Transcribe a recording by URL (e.g. a telephony provider's recording)
+    with the backend chosen by STT_BACKEND.
+    
+    Only URLs on the RECORDING_HOSTS allowlist are fetched, so the server
+    cannot be made to request internal hosts.
+    """
+    if request.bot and request.bot not in BOT_DESCRIPTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown bot: {request.bot}")
     try:
-        if domain == "ipc":
-            IPCDocumentIngestion().ingest()
-        elif domain == "rti":
-            RTIDocumentIngestion().ingest()
-        elif domain == "labor_law":
-            LaborLawDocumentIngestion().ingest()
-        elif domain == "constitution":
-            ConstitutionDocumentIngestion().ingest()
-        else:
-            logger.error(f"Unknown domain: {domain}")
-            return
-        
-        # Refresh available bots
-        bot_manager._check_available_bots()
-        
+        check_recording_url(request.audio_url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        return SpeechToTextResponse(text=transcribe_recording(
+            request.audio_url, request.language, fmt=request.format, channel=request.channel, bot=request.bot
+        ))
     except Exception as e:
-        logger.error(f"Error ingesting documents for {domain}: {e}")
+        logger.error(f"Error transcribing {request.audio_url}: {e}")
+        raise HTTPException(status_code=502, detail="Transcription failed")
+
+@app.on_event("startup")
+def start_ingest_worker():
+    """Start an ingestion worker process unless one is managed separately."""
+    global ingest_worker
+    if os.getenv("INGEST_WORKER_AUTOSTART", "1") == "0":
+        return
+    
+    ingest_worker = subprocess.Popen(
+        [sys.executable, "-m", "ingest.worker"],
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    logger.info(f"Started ingestion worker process {ingest_worker.pid}")
+
+@app.on_event("shutdown")
+def stop_ingest_worker():
+    """Stop the ingestion worker started by this process."""
+    if ingest_worker and ingest_worker.poll() is None:
+        ingest_worker.terminate()
 
 # Endpoint to trigger document ingestion
-@app.post("/ingest/{domain}", response_model=StatusResponse, tags=["Document Management"])
-async def start_ingestion(domain: str, background_tasks: BackgroundTasks):
-    """Start document ingestion for a specific domain."""
+@app.post("/ingest/{domain}", response_model=IngestStartResponse, tags=["Document Management"])
+async def start_ingestion(domain: str):
+    """
+    Queue document ingestion for a specific domain or all domains.
+    
+    A request for a domain that already has an ingestion queued returns the
+    queued job instead of adding another one. One queued while an ingestion
+    is running starts after it.
+    """
     valid_domains = ["ipc", "rti", "labor_law", "constitution", "all"]
     
     if domain not in valid_domains:
         raise HTTPException(status_code=400, detail=f"Invalid domain. Must be one of: {', '.join(valid_domains)}")
     
-    if domain == "all":
-        for d in ["ipc", "rti", "labor_law", "constitution"]:
-            background_tasks.add_task(ingest_documents, d)
-        return StatusResponse(
-            status="processing",
-            message="Document ingestion started for all domains"
-        )
+    domains = ["ipc", "rti", "labor_law", "constitution"] if domain == "all" else [domain]
+    jobs = [ingest_jobs.enqueue(d)[0] for d in domains]
+    
+    return IngestStartResponse(
+        status="processing",
+        message=f"Document ingestion queued for {'all domains' if domain == 'all' else domain}",
+        jobs=[IngestJobResponse(**job) for job in jobs]
+    )
+
+@app.get("/ingest/jobs", response_model=List[IngestJobResponse], tags=["Document Management"])
+async def list_ingestion_jobs(limit: int = 50):
+    """List recent ingestion jobs, newest first."""
+    return [IngestJobResponse(**job) for job in ingest_jobs.list(limit)]
+
+@app.get("/ingest/jobs/{job_id}", response_model=IngestJobResponse, tags=["Document Management"])
+async def get_ingestion_job(job_id: str):
+    """Get the status and progress of an ingestion job."""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return IngestJobResponse(**job)
+
+@app.delete("/ingest/jobs/{job_id}", response_model=IngestJobResponse, tags=["Document Management"])
+async def cancel_ingestion_job(job_id: str):
+    """Cancel a queued or running ingestion job."""
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    return IngestJobResponse(**ingest_jobs.cancel(job_id))
+
+def _check_upload(domain: str, filename: str, content_length: Optional[str]):
+    """Validate an upload before any of its body is read."""
+    valid_domains = ["ipc", "rti", "labor_law", "constitution"]
+    
+    if domain not in valid_domains:
+        raise HTTPException(status_code=400, detail=f"Invalid domain. Must be one of: {', '.join(valid_domains)}")
+    
+    if not filename or not filename.lower().endswith(('.pdf', '.txt')):
+        raise HTTPException(status_code=400, detail="Only PDF and text files are supported")
+    
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit")
+
+async def _store_upload(chunks, domain: str, filename: str, ingest: bool) -> UploadResponse:
+    """
+    Stream chunks to the domain's data directory, hashing them on the way.
+    
+    The file is written under a temporary name and renamed once complete,
+    so ingestion never picks up a partial upload. Disk writes and hashing
+    run on the thread pool, so a large upload does not stall the event loop.
+    """
+    domain_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", domain)
+    await run_in_threadpool(os.makedirs, domain_dir, exist_ok=True)
+    
+    # Never let a client-supplied name escape the domain directory
+    filename = os.path.basename(filename)
+    file_path = os.path.join(domain_dir, filename)
+    part_path = f"{file_path}.{uuid.uuid4().hex}.part"
+    
+    digest = hashlib.sha256()
+    size = 0
+    
+    def write(f, chunk):
+        digest.update(chunk)
+        f.write(chunk)
+    
+    def discard_part():
+        if os.path.exists(part_path):
+            os.unlink(part_path)
+    
+    try:
+        f = await run_in_threadpool(open, part_path, "wb")
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=f"File exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit")
+                await run_in_threadpool(write, f, chunk)
+        finally:
+            await run_in_threadpool(f.close)
+        await run_in_threadpool(os.replace, part_path, file_path)
+    finally:
+        await run_in_threadpool(discard_part)
+    
+    logger.info(f"Stored upload {file_path} ({size} bytes)")
+    
+    job = None
+    if ingest:
+        job, _ = await run_in_threadpool(ingest_jobs.enqueue, domain, kind="file", target=file_path)
+        message = f"File uploaded successfully to {domain}. Ingestion of this file has been queued."
     else:
-        background_tasks.add_task(ingest_documents, domain)
-        return StatusResponse(
-            status="processing",
-            message=f"Document ingestion started for {domain}"
-        )
+        message = f"File uploaded successfully to {domain}. Run ingestion to process the document."
+    
+    return UploadResponse(
+        status="success",
+        message=message,
+        filename=filename,
+        size=size,
+        sha256=digest.hexdigest(),
+        job=IngestJobResponse(**job) if job else None
+    )
 
 # Upload document endpoint
-@app.post("/upload", response_model=StatusResponse, tags=["Document Management"])
+@app.post("/upload", response_model=UploadResponse, tags=["Document Management"])
 async def upload_document(
+    request: Request,
     file: UploadFile = File(...),
-    domain: str = Form(...)
+    domain: str = Form(...),
+    ingest: bool = Form(True)
 ):
-    """Upload a document file to a specific domain."""
-    valid_domains = ["ipc", "rti", "labor_law", "constitution"]
+    """
+    Upload a document file to a specific domain.
     
-    if domain not in valid_domains:
-        raise HTTPException(status_code=400, detail=f"Invalid domain. Must be one of: {', '.join(valid_domains)}")
+    Unless ``ingest`` is false, the file alone is queued for incremental
+    ingestion and becomes searchable as soon as that job finishes.
     
-    # Check file type
-    if file.filename.endswith(('.pdf', '.txt')):
-        # Create directory if it doesn't exist
-        domain_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", domain)
-        os.makedirs(domain_dir, exist_ok=True)
-        
-        # Save file
-        file_path = os.path.join(domain_dir, file.filename)
-        with open(file_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
-            
-        return StatusResponse(
-            status="success",
-            message=f"File uploaded successfully to {domain}. Run ingestion to process the document."
-        )
-    else:
-        raise HTTPException(status_code=400, detail="Only PDF and text files are supported")
+    Starlette spools the whole multipart body before this runs, so the
+    domain, extension and size checks only apply once the upload has been
+    received. Clients sending large files should use
+    ``PUT /upload/{domain}/{filename}``, which checks first and streams.
+    """
+    _check_upload(domain, file.filename, request.headers.get("content-length"))
+    
+    async def read_chunks():
+        while True:
+            chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    
+    return await _store_upload(read_chunks(), domain, file.filename, ingest)
+
+# Raw upload endpoint
+@app.put("/upload/{domain}/{filename}", response_model=UploadResponse, tags=["Document Management"])
+async def upload_document_raw(request: Request, domain: str, filename: str, ingest: bool = True):
+    """
+    Upload a document as the raw request body.
+    
+    Unlike the multipart endpoint, the body is written to disk as it arrives
+    rather than being buffered first, and the size limit is enforced while
+    streaming.
+    """
+    _check_upload(domain, filename, request.headers.get("content-length"))
+    return await _store_upload(request.stream(), domain, filename, ingest)
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run("api:app", host="0.0.0.0", port=8000, reload=True)
+    import serving
+    
+    if serving.SERVER_MODE == "dev":
+        serving.run(app, 8000, asgi=True, import_string="api:app")
+    else:
+        # One ingestion worker for the whole server, not one per web worker
+        start_ingest_worker()
+        os.environ["INGEST_WORKER_AUTOSTART"] = "0"
+        master_pid = os.getpid()
+        try:
+            serving.run(app, 8000, asgi=True, preload=bot_manager.preload)
+        finally:
+            # Workers unwind through here too when they exit
+            if os.getpid() == master_pid:
+                stop_ingest_worker()
@@ -1,9 +1,10 @@
 import os
 import streamlit as st
 from utils import LegalBotManager
+from llm_backends import requires_google_api_key
 from dotenv import load_dotenv
 import logging
-import requests
+from http_pool import get_http_pool
 
 # Load environment variables
 load_dotenv()
@@ -16,7 +17,7 @@ logger = logging.getLogger(__name__)
 def initialize_bot_manager():
     """Initialize the bot manager (cached to prevent reinitialization)."""
     api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
+    if requires_google_api_key() and not api_key:
         st.error("GOOGLE_API_KEY not found in environment variables!")
         st.stop()
     
@@ -38,7 +39,8 @@ web_voice_url = "http://localhost:5002"
 web_voice_running = False
 
 try:
-    response = requests.get(web_voice_url, timeout=1)
+    # Pooled session, so Streamlit reruns reuse one keep-alive connection
+    response = get_http_pool().request("web_voice", "GET", web_voice_url)
     if response.status_code == 200:
         web_voice_running = True
 except:
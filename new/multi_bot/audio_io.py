@@ -0,0 +1,192 @@
+import io
+import os
+import base64
+import threading
+
+# Largest recording accepted from a client or downloaded from Twilio
+MAX_AUDIO_BYTES = int(os.getenv("MAX_AUDIO_MB", "10")) * 1024 * 1024
+
+# Read size when streaming audio into a buffer
+CHUNK_SIZE = 64 * 1024
+
+# Upload content types accepted as raw audio, and the container each one holds
+AUDIO_CONTENT_TYPES = {
+    "audio/webm": "webm",
+    "audio/ogg": "ogg",
+    "audio/wav": "wav",
+    "audio/x-wav": "wav",
+    "audio/mpeg": "mp3",
+    "application/octet-stream": "webm"
+}
+
+
+class AudioTooLarge(ValueError):
+    """Raised when a recording exceeds MAX_AUDIO_BYTES."""
+
+
+class MemoryFile(io.RawIOBase):
+    """
+    Read-only, seekable file over a buffer, without copying it.
+
+    Lets bytes already in memory be handed to libraries that expect a file
+    object (the STT clients, PyAV) instead of writing them to a temp file.
+    """
+
+    def __init__(self, data, name="audio"):
+        self._view = memoryview(data)
+        self._pos = 0
+        # Some APIs infer the container format from the file name
+        self.name = name
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self._view) - self._pos))
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def read(self, size=-1):
+        end = len(self._view) if size is None or size < 0 else min(self._pos + size, len(self._view))
+        data = self._view[self._pos:end].tobytes()
+        self._pos = max(self._pos, end)
+        return data
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = len(self._view) + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def getbuffer(self):
+        """The underlying bytes as a memoryview."""
+        return self._view
+
+
+class AudioBuffer:
+    """
+    Growable byte buffer that recordings are streamed into and reused from.
+
+    Each fill overwrites the previous contents, so after the first few
+    requests no new memory is allocated for audio at all. The buffer only
+    grows (up to MAX_AUDIO_BYTES) and never shrinks.
+    """
+
+    def __init__(self, capacity=256 * 1024):
+        self._data = bytearray(capacity)
+        self.size = 0
+
+    def _reserve(self, needed):
+        if needed > len(self._data):
+            grown = bytearray(max(needed, 2 * len(self._data)))
+            grown[:self.size] = memoryview(self._data)[:self.size]
+            self._data = grown
+
+    def _check_size(self, max_bytes):
+        if self.size > max_bytes:
+            raise AudioTooLarge(f"Audio is larger than {max_bytes // (1024 * 1024)} MB")
+
+    def read_from(self, stream, max_bytes=MAX_AUDIO_BYTES):
+        """
+        Fill the buffer from a binary stream, reading directly into it.
+
+        Returns:
+            memoryview: The audio that was read
+        """
+        self.size = 0
+        readinto = getattr(stream, "readinto", None)
+        while True:
+            self._reserve(self.size + CHUNK_SIZE)
+            if readinto:
+                with memoryview(self._data) as view:
+                    n = readinto(view[self.size:self.size + CHUNK_SIZE])
+            else:
+                chunk = stream.read(CHUNK_SIZE)
+                n = len(chunk)
+                self._data[self.size:self.size + n] = chunk
+            if not n:
+                break
+            self.size += n
+            self._check_size(max_bytes)
+        return self.view()
+
+    def read_chunks(self, chunks, max_bytes=MAX_AUDIO_BYTES):
+        """
+        Fill the buffer from an iterable of byte chunks, e.g. ``response.iter_content()``.
+
+        Returns:
+            memoryview: The audio that was read
+        """
+        self.size = 0
+        for chunk in chunks:
+            self._reserve(self.size + len(chunk))
+            self._data[self.size:self.size + len(chunk)] = chunk
+            self.size += len(chunk)
+            self._check_size(max_bytes)
+        return self.view()
+
+    def view(self):
+        """The current contents, without copying."""
+        return memoryview(self._data)[:self.size]
+
+
+_local = threading.local()
+
+
+def thread_audio_buffer():
+    """
+    Get this thread's reusable audio buffer.
+
+    The contents stay valid until the same thread fills the buffer again,
+    so finish with one recording before reading the next.
+    """
+    buffer = getattr(_local, "buffer", None)
+    if buffer is None:
+        buffer = _local.buffer = AudioBuffer()
+    return buffer
+
+
+def read_request_audio(request, max_bytes=MAX_AUDIO_BYTES):
+    """
+    Get the session ID and recording from a Flask audio upload.
+
+    Raw uploads (an ``audio/*`` body with ``?session_id=``) are streamed
+    into the thread's buffer. The older JSON form with a base64 ``audio``
+    field is still accepted.
+
+    Returns:
+        tuple: (session_id, audio as a bytes-like object or None, container format)
+
+    Raises:
+        AudioTooLarge: If the recording exceeds ``max_bytes``
+    """
+    if request.content_length and request.content_length > max_bytes * 4 // 3 + 1024:
+        raise AudioTooLarge(f"Audio is larger than {max_bytes // (1024 * 1024)} MB")
+
+    content_type = (request.mimetype or "").lower()
+    if content_type in AUDIO_CONTENT_TYPES:
+        session_id = request.args.get("session_id") or request.headers.get("X-Session-Id")
+        audio = thread_audio_buffer().read_from(request.stream, max_bytes)
+        return session_id, audio if len(audio) else None, AUDIO_CONTENT_TYPES[content_type]
+
+    data = request.get_json(silent=True) or {}
+    audio_b64 = data.get("audio")
+    audio = None
+    if audio_b64:
+        # Remove data URL prefix if present
+        audio = base64.b64decode(audio_b64.split(",", 1)[1] if "," in audio_b64 else audio_b64)
+        if len(audio) > max_bytes:
+            raise AudioTooLarge(f"Audio is larger than {max_bytes // (1024 * 1024)} MB")
+    return data.get("session_id"), audio, "webm"
@@ -0,0 +1,112 @@
+"""
+Measure the per-request cost of receiving a recording, before and after
+the audio path was moved into memory.
+
+"before" replays the old handling: parse a JSON body, base64-decode the
+audio, write it to a NamedTemporaryFile and read it back for the STT call.
+"after" streams a raw binary body into the thread's reusable buffer and
+hands the STT backend a zero-copy file view. Speech recognition itself is
+not run; only the cost of getting the audio to it is measured.
+
+For each path the script reports the request body size, Python memory
+allocated per request (tracemalloc), bytes read and written through
+syscalls per request (from /proc/self/io, on Linux) and time per request.
+
+Usage (from the multi_bot directory):
+
+    python benchmarks/audio_path_benchmark.py --size-kb 480 --requests 200
+"""
+import io
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_io import thread_audio_buffer, MemoryFile
+
+
+def proc_io():
+    """Bytes read and written through syscalls by this process so far, if known."""
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def consume(audio_file):
+    """Stand-in for the STT client reading the whole recording."""
+    chunk = bytearray(64 * 1024)
+    while audio_file.readinto(chunk):
+        pass
+
+
+def before(body):
+    data = json.loads(body)
+    audio_b64 = data["audio"]
+    audio_bytes = base64.b64decode(audio_b64.split(",")[1] if "," in audio_b64 else audio_b64)
+
+    with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as temp_file:
+        temp_filename = temp_file.name
+        temp_file.write(audio_bytes)
+    try:
+        with open(temp_filename, "rb") as audio_file:
+            consume(audio_file)
+    finally:
+        os.unlink(temp_filename)
+
+
+def after(body):
+    audio = thread_audio_buffer().read_from(io.BytesIO(body))
+    consume(MemoryFile(audio, name="audio.webm"))
+
+
+def measure(name, fn, body, requests):
+    fn(body)  # warm up, so the reusable buffer is already sized
+
+    io_start = proc_io()
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(requests):
+        fn(body)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    total = sum(stat.size for stat in tracemalloc.take_snapshot().statistics("filename"))
+    tracemalloc.stop()
+    io_end = proc_io()
+
+    print(f"{name}:")
+    print(f"  Request body:       {len(body) / 1024:.0f} KB")
+    print(f"  Peak traced memory: {peak / 1024:.0f} KB")
+    print(f"  Retained memory:    {total / 1024:.0f} KB")
+    if io_start and io_end:
+        print(f"  Syscall reads:      {(io_end[0] - io_start[0]) / requests / 1024:.0f} KB per request")
+        print(f"  Syscall writes:     {(io_end[1] - io_start[1]) / requests / 1024:.0f} KB per request")
+    print(f"  Time:               {elapsed / requests * 1000:.2f} ms per request")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare temp-file and in-memory audio handling")
+    parser.add_argument("--size-kb", type=int, default=480, help="Recording size (480 KB is ~30 s of Opus)")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per path")
+    args = parser.parse_args()
+
+    audio = os.urandom(args.size_kb * 1024)
+    json_body = json.dumps({
+        "session_id": "benchmark",
+        "audio": "data:audio/webm;base64," + base64.b64encode(audio).decode("ascii")
+    }).encode("utf-8")
+
+    measure("before (base64 JSON + temp file)", before, json_body, args.requests)
+    measure("after (raw body + reusable buffer)", after, audio, args.requests)
+
+
+if __name__ == "__main__":
+    main()
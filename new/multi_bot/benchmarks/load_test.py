@@ -0,0 +1,88 @@
+"""
+Load test LegalBotManager without calling Gemini.
+
+Runs queries concurrently through the same manager the channel servers use,
+with the fake LLM backend, and reports latency percentiles and throughput.
+What remains is our own overhead: embedding, vector search, prompt
+assembly, scheduling, plus the simulated LLM time you configure.
+
+Usage (from the multi_bot directory, after ingesting at least one domain):
+
+    python benchmarks/load_test.py --bot "IPC Bot" --concurrency 16 --requests 400
+
+The fake backend is tuned through FAKE_LLM_LATENCY_MEDIAN,
+FAKE_LLM_LATENCY_SIGMA, FAKE_LLM_TOKENS_PER_SECOND and FAKE_LLM_MAX_TOKENS.
+Set them to 0 to measure retrieval and serving overhead alone.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_QUERIES = [
+    "What is the punishment for theft?",
+    "How do I file an RTI application?",
+    "What are the fundamental rights in the Constitution?",
+    "What is the minimum wage for factory workers?",
+    "Is cheating a cognizable offence?",
+    "How long does a public information officer have to reply?",
+    "What does Article 21 protect?",
+    "How many working hours are allowed per week?"
+]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list."""
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the legal bots with the fake LLM backend")
+    parser.add_argument("--bot", default="IPC Bot", help="Bot to query")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="Total queries to send")
+    parser.add_argument("--queries-file", help="File with one query per line")
+    parser.add_argument("--backend", default="fake", help="LLM backend to use (default: fake)")
+    args = parser.parse_args()
+
+    os.environ["LLM_BACKEND"] = args.backend
+    from utils import LegalBotManager
+
+    queries = DEFAULT_QUERIES
+    if args.queries_file:
+        with open(args.queries_file, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    manager = LegalBotManager()
+    if args.bot not in manager.get_available_bots():
+        sys.exit(f"{args.bot} is not available; ingest its documents first")
+
+    # Warm up so model loading is not counted
+    manager.query_bot(args.bot, queries[0])
+
+    def run(i):
+        start = time.perf_counter()
+        manager.query_bot(args.bot, queries[i % len(queries)])
+        return time.perf_counter() - start
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        latencies = sorted(pool.map(run, range(args.requests)))
+    elapsed = time.perf_counter() - started
+
+    print(f"Backend:      {args.backend}")
+    print(f"Requests:     {args.requests} at concurrency {args.concurrency}")
+    print(f"Throughput:   {args.requests / elapsed:.1f} req/s")
+    print(f"Mean latency: {statistics.mean(latencies) * 1000:.1f} ms")
+    for pct in (50, 95, 99):
+        print(f"p{pct}:          {percentile(latencies, pct) * 1000:.1f} ms")
+    print(f"Coalescing:   {manager.get_query_stats()}")
+
+
+if __name__ == "__main__":
+    main()
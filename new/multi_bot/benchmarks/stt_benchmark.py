@@ -0,0 +1,86 @@
+"""
+Compare speech-to-text backends on real recordings.
+
+Each backend transcribes the given clips at the requested concurrency, and
+the script reports latency percentiles and the real-time factor (processing
+time divided by audio duration; below 1 is faster than real time). Running
+the local backend at a concurrency above 1 shows the effect of batching.
+
+Usage (from the multi_bot directory):
+
+    python benchmarks/stt_benchmark.py --backends local openai --language hindi \\
+        --concurrency 4 --repeat 5 recordings/*.mp3
+
+Audio durations are read with faster-whisper's decoder, so it must be
+installed even when only API backends are benchmarked.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stt_backends import get_stt_backend, SAMPLE_RATE
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list."""
+    index = max(0, min(len(values) - 1, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def audio_duration(path):
+    """Length of a recording in seconds."""
+    from faster_whisper import decode_audio
+    return len(decode_audio(path, sampling_rate=SAMPLE_RATE)) / SAMPLE_RATE
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark speech-to-text backends")
+    parser.add_argument("files", nargs="+", help="Audio files to transcribe")
+    parser.add_argument("--backends", nargs="+", default=["local", "openai"], help="Backends to compare")
+    parser.add_argument("--language", default=None, help="Language name or code (default: detect)")
+    parser.add_argument("--concurrency", type=int, default=1, help="Concurrent transcriptions")
+    parser.add_argument("--repeat", type=int, default=3, help="Times to transcribe each file")
+    args = parser.parse_args()
+
+    clips = []
+    for path in args.files:
+        with open(path, "rb") as f:
+            clips.append((path, f.read(), audio_duration(path)))
+    jobs = clips * args.repeat
+    total_audio = sum(duration for _, _, duration in jobs)
+
+    for name in args.backends:
+        start = time.perf_counter()
+        backend = get_stt_backend(name)
+        load_time = time.perf_counter() - start
+
+        def run(job):
+            path, data, _ = job
+            started = time.perf_counter()
+            backend.transcribe(data, args.language, fmt=os.path.splitext(path)[1].lstrip(".") or "mp3")
+            return time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            latencies = sorted(pool.map(run, jobs))
+        elapsed = time.perf_counter() - started
+
+        print(f"Backend:          {name}")
+        print(f"Load time:        {load_time:.1f} s")
+        print(f"Clips:            {len(jobs)} ({total_audio:.0f} s of audio) at concurrency {args.concurrency}")
+        print(f"Real-time factor: {elapsed / total_audio:.3f} (wall clock)")
+        print(f"Mean latency:     {statistics.mean(latencies) * 1000:.0f} ms")
+        for pct in (50, 95):
+            print(f"p{pct}:              {percentile(latencies, pct) * 1000:.0f} ms")
+        if hasattr(backend, "stats"):
+            print(f"Batching:         {backend.stats()}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
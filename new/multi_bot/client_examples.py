@@ -44,6 +44,12 @@ def start_ingestion(domain):
     response = requests.post(f"{BASE_URL}/ingest/{domain}")
     print_response(response)
 
+# Example 6: Check an ingestion job
+def check_ingestion_job(job_id):
+    print(f"\n⏳ Checking ingestion job {job_id}")
+    response = requests.get(f"{BASE_URL}/ingest/jobs/{job_id}")
+    print_response(response)
+
 if __name__ == "__main__":
     # Run examples
     check_health()
@@ -0,0 +1,239 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+from collections import namedtuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Per-upstream settings: connect and read timeouts (seconds), retries after the
+# first attempt, and the most connections kept open to it
+Upstream = namedtuple("Upstream", ["connect_timeout", "read_timeout", "retries", "max_connections"])
+
+UPSTREAMS = {
+    "twilio": Upstream(connect_timeout=3.0, read_timeout=10.0, retries=3, max_connections=16),
+    "translator": Upstream(connect_timeout=2.0, read_timeout=30.0, retries=2, max_connections=32),
+    "rag": Upstream(connect_timeout=2.0, read_timeout=30.0, retries=1, max_connections=32),
+    "web_voice": Upstream(connect_timeout=0.5, read_timeout=1.0, retries=0, max_connections=2),
+    "default": Upstream(connect_timeout=3.0, read_timeout=15.0, retries=2, max_connections=10)
+}
+
+# Responses worth retrying: rate limited or the upstream is briefly unavailable
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+def upstream_settings(name):
+    """Settings for an upstream, with HTTP_<NAME>_TIMEOUT / _RETRIES overrides from the environment."""
+    settings = UPSTREAMS.get(name, UPSTREAMS["default"])
+    prefix = f"HTTP_{name.upper()}_"
+    if os.getenv(prefix + "TIMEOUT"):
+        settings = settings._replace(read_timeout=float(os.getenv(prefix + "TIMEOUT")))
+    if os.getenv(prefix + "RETRIES"):
+        settings = settings._replace(retries=int(os.getenv(prefix + "RETRIES")))
+    return settings
+
+
+def backoff_delay(attempt, base=0.2, cap=5.0):
+    """Exponential backoff with full jitter for the given retry attempt (0-based)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class HTTPPool:
+    """
+    Shared outbound HTTP clients, one keep-alive connection pool per upstream.
+
+    The sync side uses a ``requests.Session`` per upstream, for Flask and
+    Streamlit code. The async side uses an ``httpx.AsyncClient`` per
+    upstream, for FastAPI code. Both retry connection errors, timeouts and
+    429/5xx responses with jittered exponential backoff; the async side
+    sleeps without blocking the event loop. Each request counts whether it
+    opened a new connection or reused a pooled one; the counts are kept in
+    ``metrics`` so that they add up over a server's worker processes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._async_clients = {}
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        """A forked worker opens its own connections; the inherited ones belong to the parent."""
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._async_clients = {}
+
+    def _count(self, upstream, field, n=1):
+        metrics.increment(f"http_{field}", n, upstream=upstream)
+
+    def session(self, upstream):
+        """Get the ``requests.Session`` for an upstream."""
+        with self._lock:
+            session = self._sessions.get(upstream)
+            if session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                settings = upstream_settings(upstream)
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.max_connections)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[upstream] = session
+            return session
+
+    def async_client(self, upstream):
+        """Get the ``httpx.AsyncClient`` for an upstream."""
+        with self._lock:
+            client = self._async_clients.get(upstream)
+            if client is None:
+                import httpx
+
+                settings = upstream_settings(upstream)
+                client = httpx.AsyncClient(
+                    timeout=httpx.Timeout(settings.read_timeout, connect=settings.connect_timeout),
+                    limits=httpx.Limits(
+                        max_connections=settings.max_connections,
+                        max_keepalive_connections=settings.max_connections
+                    )
+                )
+                self._async_clients[upstream] = client
+            return client
+
+    def request(self, upstream, method, url, **kwargs):
+        """
+        Send a request through an upstream's session, retrying transient failures.
+
+        Args:
+            upstream (str): Upstream name, e.g. "twilio"
+            method (str): HTTP method
+            url (str): Request URL
+            **kwargs: Passed to ``requests.Session.request`` (e.g. ``json``, ``stream``)
+
+        Returns:
+            requests.Response: The response, with 4xx/5xx already raised as errors
+        """
+        import requests
+
+        settings = upstream_settings(upstream)
+        kwargs.setdefault("timeout", (settings.connect_timeout, settings.read_timeout))
+        session = self.session(upstream)
+
+        for attempt in range(settings.retries + 1):
+            connections_before = self._open_connections(session)
+            self._count(upstream, "requests")
+            try:
+                response = session.request(method, url, **kwargs)
+                if response.status_code in RETRY_STATUSES and attempt < settings.retries:
+                    response.close()
+                    raise requests.exceptions.RetryError(f"{upstream} returned {response.status_code}")
+                response.raise_for_status()
+                return response
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.RetryError) as e:
+                if attempt == settings.retries:
+                    self._count(upstream, "failures")
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"Retry {attempt + 1}/{settings.retries} for {upstream} in {delay:.2f}s: {e}")
+                self._count(upstream, "retries")
+                time.sleep(delay)
+            except requests.exceptions.RequestException:
+                self._count(upstream, "failures")
+                raise
+            finally:
+                self._count(upstream, "new_connections", self._open_connections(session) - connections_before)
+
+    async def arequest(self, upstream, method, url, **kwargs):
+        """
+        Async version of ``request`` using the upstream's ``httpx.AsyncClient``.
+
+        Returns:
+            httpx.Response: The response, with 4xx/5xx already raised as errors
+        """
+        import httpx
+
+        settings = upstream_settings(upstream)
+        client = self.async_client(upstream)
+
+        async def trace(event_name, info):
+            if event_name == "connection.connect_tcp.complete":
+                self._count(upstream, "new_connections")
+
+        for attempt in range(settings.retries + 1):
+            self._count(upstream, "requests")
+            try:
+                response = await client.request(method, url, extensions={"trace": trace}, **kwargs)
+                if response.status_code in RETRY_STATUSES and attempt < settings.retries:
+                    raise httpx.HTTPStatusError(
+                        f"{upstream} returned {response.status_code}", request=response.request, response=response
+                    )
+                response.raise_for_status()
+                return response
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                retryable = not isinstance(e, httpx.HTTPStatusError) or e.response.status_code in RETRY_STATUSES
+                if not retryable or attempt == settings.retries:
+                    self._count(upstream, "failures")
+                    raise
+                delay = backoff_delay(attempt)
+                logger.warning(f"Retry {attempt + 1}/{settings.retries} for {upstream} in {delay:.2f}s: {e}")
+                self._count(upstream, "retries")
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _open_connections(session):
+        """Connections urllib3 has opened so far across a session's pools."""
+        total = 0
+        for adapter in set(session.adapters.values()):
+            for key in adapter.poolmanager.pools.keys():
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is not None:
+                    total += pool.num_connections
+        return total
+
+    def stats(self):
+        """Return request, retry, failure and connection counters per upstream."""
+        stats = {}
+        for name, values in metrics.counters().items():
+            if name.startswith("http_"):
+                for labels, value in values.items():
+                    upstream = dict(labels)["upstream"]
+                    stats.setdefault(upstream, {
+                        "requests": 0, "retries": 0, "failures": 0, "new_connections": 0
+                    })[name[len("http_"):]] = int(value)
+        for values in stats.values():
+            values["reused_connections"] = max(values["requests"] - values["new_connections"], 0)
+            values["reuse_ratio"] = values["reused_connections"] / values["requests"] if values["requests"] else 0.0
+        return stats
+
+    def close(self):
+        """Close the sync sessions."""
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), {}
+        for session in sessions:
+            session.close()
+
+    async def aclose(self):
+        """Close the async clients; call on application shutdown."""
+        with self._lock:
+            clients, self._async_clients = list(self._async_clients.values()), {}
+        for client in clients:
+            await client.aclose()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_http_pool():
+    """Return the process-wide ``HTTPPool``."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = HTTPPool()
+        return _pool
@@ -1,4 +1,5 @@
 import os
+import shutil
 import logging
 # Use our custom loaders instead of the problematic ones
 from .custom_loaders import SimpleTextLoader as TextLoader
@@ -7,6 +8,7 @@ from .custom_loaders import SimpleDirectoryLoader as DirectoryLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
+from . import versioning
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -15,7 +17,11 @@ logger = logging.getLogger(__name__)
 class BaseDocumentIngestion:
     """Base class for domain-specific document ingestion."""
     
-    def __init__(self, domain_name, data_dir="data", vector_store_dir="vectorstores"):
+    # Chunks embedded and written per batch; also the progress reporting granularity
+    embed_batch_size = 64
+    
+    def __init__(self, domain_name, data_dir="data", vector_store_dir="vectorstores", keep_versions=2,
+                 force_reextract=None):
         """
         Initialize the document ingestion process.
         
@@ -23,14 +29,23 @@ class BaseDocumentIngestion:
             domain_name (str): Name of the legal domain (e.g., "ipc", "rti")
             data_dir (str): Directory containing the source documents
             vector_store_dir (str): Directory to store the vector database
+            keep_versions (int): Number of published vector store versions to retain
+            force_reextract (bool): Ignore cached PDF text and extract it again.
+                Defaults to the PDF_FORCE_REEXTRACT environment variable.
         """
         self.domain_name = domain_name
-        self.data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), data_dir, domain_name)
-        self.vector_store_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), vector_store_dir, f"{domain_name}_index")
+        # Absolute, so document sources match between full and single-file ingests
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        self.data_dir = os.path.join(base_dir, data_dir, domain_name)
+        self.vector_store_root = os.path.join(base_dir, vector_store_dir)
+        self.keep_versions = keep_versions
+        if force_reextract is None:
+            force_reextract = os.getenv("PDF_FORCE_REEXTRACT", "0") == "1"
+        self.pdf_loader_kwargs = {"force_reextract": force_reextract}
         
         # Create directories if they don't exist
         os.makedirs(self.data_dir, exist_ok=True)
-        os.makedirs(self.vector_store_dir, exist_ok=True)
+        os.makedirs(versioning.versions_dir(self.vector_store_root, domain_name), exist_ok=True)
         
         # Initialize the text splitter
         self.text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
@@ -38,18 +53,40 @@ class BaseDocumentIngestion:
         # Initialize embeddings (using HuggingFace to avoid API key requirements)
         self.embedding = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
         
+        # Optional callable receiving progress fields as keyword arguments
+        self.progress_callback = None
+        
         logger.info(f"Initialized {domain_name} document ingestion")
+    
+    def _report_progress(self, **fields):
+        """Pass progress counters to the registered callback, if any."""
+        if self.progress_callback:
+            self.progress_callback(**fields)
+    
+    @property
+    def vector_store_dir(self):
+        """Directory of the currently published vector store, if any."""
+        return versioning.resolve_index_path(self.vector_store_root, self.domain_name)
         
     def load_documents(self):
         """Load documents from the data directory."""
         logger.info(f"Loading documents from {self.data_dir}")
+        self._report_progress(stage="loading", files=0, pages=0)
+        
+        loaded = {"files": 0, "pages": 0}
+        
+        def on_loaded(file_path, docs):
+            loaded["files"] += 1
+            loaded["pages"] += len(docs)
+            self._report_progress(**loaded)
         
         # Load PDFs
-        pdf_loader = DirectoryLoader(self.data_dir, glob="**/*.pdf", loader_cls=PyPDFLoader)
+        pdf_loader = DirectoryLoader(self.data_dir, glob="**/*.pdf", loader_cls=PyPDFLoader, on_loaded=on_loaded,
+                                     loader_kwargs=self.pdf_loader_kwargs)
         pdf_docs = pdf_loader.load()
         
         # Load text files
-        text_loader = DirectoryLoader(self.data_dir, glob="**/*.txt", loader_cls=TextLoader)
+        text_loader = DirectoryLoader(self.data_dir, glob="**/*.txt", loader_cls=TextLoader, on_loaded=on_loaded)
         text_docs = text_loader.load()
         
         # Combine documents
@@ -59,29 +96,104 @@ class BaseDocumentIngestion:
         return documents
     
     def process_documents(self, documents):
-        """Split documents into chunks and create embeddings."""
+        """
+        Split documents into chunks and build a new vector store version.
+        
+        The store is built in a fresh staging directory and only published
+        once it has been verified, so servers never read a half-built index.
+        """
         logger.info(f"Processing {len(documents)} documents")
         
         # Split text into chunks
         chunks = self.text_splitter.split_documents(documents)
         logger.info(f"Created {len(chunks)} text chunks")
         
-        # Create vector store
-        db = Chroma.from_documents(
-            documents=chunks,
-            embedding=self.embedding,
-            persist_directory=self.vector_store_dir
-        )
+        return self._build_version(chunks)
+    
+    def _build_version(self, chunks, base_dir=None, replace_source=None):
+        """
+        Build, verify and publish a vector store version.
+        
+        Args:
+            chunks (list): Chunks to embed and add
+            base_dir (str): Published version to start from instead of an empty store
+            replace_source (str): Source whose existing chunks are removed first
         
-        # Persist the database
-        db.persist()
-        logger.info(f"Vector store created and persisted at {self.vector_store_dir}")
+        Raises:
+            ValueError: If there are no chunks, e.g. the documents hold only whitespace
+        """
+        if not chunks:
+            raise ValueError(f"No text to index for {replace_source or self.domain_name}; nothing was published")
+        
+        self._report_progress(stage="embedding", chunks=len(chunks), chunks_embedded=0)
+        
+        version, staging_dir = versioning.new_version(self.vector_store_root, self.domain_name)
+        logger.info(f"Building {self.domain_name} version {version} in {staging_dir}")
+        
+        try:
+            if base_dir:
+                # Published versions are never written to, so copying one is safe.
+                # This is a full copy: Chroma updates its SQLite and index files in
+                # place, so hardlinking them would modify the published version too
+                shutil.copytree(base_dir, staging_dir, dirs_exist_ok=True)
+            
+            # Create vector store, embedding in batches so progress can be reported
+            db = Chroma(
+                persist_directory=staging_dir,
+                embedding_function=self.embedding
+            )
+            
+            removed = 0
+            if replace_source:
+                stale_ids = db.get(where={"source": replace_source})["ids"]
+                if stale_ids:
+                    db.delete(ids=stale_ids)
+                    removed = len(stale_ids)
+            expected_count = db._collection.count() + len(chunks)
+            
+            for start in range(0, len(chunks), self.embed_batch_size):
+                batch = chunks[start:start + self.embed_batch_size]
+                db.add_documents(batch)
+                self._report_progress(chunks_embedded=start + len(batch))
+            
+            # Persist the database
+            db.persist()
+            self._report_progress(stage="verifying", chunks_removed=removed)
+            self.verify_vector_store(db, expected_count, chunks[0].page_content)
+        except Exception:
+            logger.error(f"Build of {self.domain_name} version {version} failed, discarding it")
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise
+        
+        # Flip the pointer and drop versions nobody should be reading any more
+        versioning.publish_version(self.vector_store_root, self.domain_name, version)
+        versioning.collect_garbage(self.vector_store_root, self.domain_name, keep=self.keep_versions)
+        logger.info(f"Vector store created and persisted at {staging_dir}")
+        self._report_progress(stage="published", version=version)
         
         return db
     
-    def ingest(self):
-        """Execute the complete ingestion process."""
+    def verify_vector_store(self, db, expected_count, probe_text):
+        """Check that a freshly built store holds every chunk and answers a search."""
+        count = db._collection.count()
+        if count != expected_count:
+            raise ValueError(f"Vector store holds {count} chunks, expected {expected_count}")
+        
+        if not db.similarity_search(probe_text[:500], k=1):
+            raise ValueError("Vector store returned no results for a known chunk")
+    
+    def ingest(self, progress_callback=None):
+        """
+        Execute the complete ingestion process.
+        
+        Args:
+            progress_callback (callable): Optional callable receiving progress
+                fields (stage, files, pages, chunks, chunks_embedded) as keyword
+                arguments. It may raise to abort the ingestion, up to the
+                "published" stage, when the new version is already live.
+        """
         logger.info(f"Starting ingestion process for {self.domain_name}")
+        self.progress_callback = progress_callback
         
         # Load documents
         documents = self.load_documents()
@@ -94,14 +206,49 @@ class BaseDocumentIngestion:
             logger.warning(f"No documents found in {self.data_dir}")
             return None
     
+    def ingest_file(self, file_path, progress_callback=None):
+        """
+        Add or refresh a single document without rebuilding the domain.
+        
+        The published version is copied, chunks previously indexed from the
+        same file are replaced, and the result is published as a new version.
+        Only this file is embedded, but the copy reads and writes the whole
+        store, so each call costs time and disk in proportion to its size.
+        
+        Args:
+            file_path (str): PDF or text file inside this domain's data directory
+            progress_callback (callable): Same as for ``ingest``
+        """
+        self.progress_callback = progress_callback
+        file_path = os.path.abspath(file_path)
+        logger.info(f"Starting incremental ingestion of {file_path} into {self.domain_name}")
+        
+        if file_path.lower().endswith(".pdf"):
+            loader = PyPDFLoader(file_path, **self.pdf_loader_kwargs)
+        else:
+            loader = TextLoader(file_path)
+        self._report_progress(stage="loading", files=0, pages=0)
+        documents = loader.load()
+        self._report_progress(files=1, pages=len(documents))
+        
+        if not documents:
+            logger.warning(f"No text extracted from {file_path}")
+            return None
+        
+        chunks = self.text_splitter.split_documents(documents)
+        logger.info(f"Created {len(chunks)} text chunks from {file_path}")
+        
+        return self._build_version(chunks, base_dir=self.vector_store_dir, replace_source=file_path)
+    
     def load_vector_store(self):
-        """Load an existing vector store."""
-        if os.path.exists(self.vector_store_dir):
-            logger.info(f"Loading vector store from {self.vector_store_dir}")
+        """Load the currently published vector store."""
+        vector_store_dir = self.vector_store_dir
+        if vector_store_dir:
+            logger.info(f"Loading vector store from {vector_store_dir}")
             return Chroma(
-                persist_directory=self.vector_store_dir,
+                persist_directory=vector_store_dir,
                 embedding_function=self.embedding
             )
         else:
-            logger.error(f"Vector store not found at {self.vector_store_dir}")
+            logger.error(f"No vector store published for {self.domain_name} under {self.vector_store_root}")
             return None
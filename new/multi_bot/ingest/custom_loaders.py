@@ -4,6 +4,7 @@ from typing import List, Dict, Any, Optional
 from langchain.docstore.document import Document
 import logging
 from pypdf import PdfReader
+from .text_cache import file_sha256, get_default_cache
 
 logger = logging.getLogger(__name__)
 
@@ -27,20 +28,46 @@ class SimpleTextLoader:
             return []
 
 class SimplePdfLoader:
-    """Load PDFs using PyPDF."""
+    """Load PDFs using PyPDF, reusing previously extracted page text."""
     
-    def __init__(self, file_path: str):
-        """Initialize with file path."""
+    def __init__(self, file_path: str, use_cache: bool = True, force_reextract: bool = False):
+        """Initialize with file path.
+
+        ``force_reextract`` ignores cached text and refreshes the cache.
+        """
         self.file_path = file_path
+        self.use_cache = use_cache
+        self.force_reextract = force_reextract
+    
+    def _extract_pages(self) -> List[str]:
+        """Extract the text of every page, including empty ones."""
+        pdf = PdfReader(self.file_path)
+        return [page.extract_text() or "" for page in pdf.pages]
+    
+    def _load_pages(self) -> List[str]:
+        """Return page texts from the cache, extracting and caching on a miss."""
+        if not self.use_cache:
+            return self._extract_pages()
+        
+        cache = get_default_cache()
+        file_hash = file_sha256(self.file_path)
+        
+        if not self.force_reextract:
+            texts = cache.get_pages(file_hash)
+            if texts is not None:
+                logger.debug(f"Using cached text for {self.file_path}")
+                return texts
+        
+        texts = self._extract_pages()
+        cache.put_pages(file_hash, texts)
+        return texts
     
     def load(self) -> List[Document]:
         """Load PDF file."""
         try:
-            pdf = PdfReader(self.file_path)
             documents = []
             
-            for i, page in enumerate(pdf.pages):
-                text = page.extract_text()
+            for i, text in enumerate(self._load_pages()):
                 if text.strip():  # Skip empty pages
                     metadata = {"source": self.file_path, "page": i}
                     documents.append(Document(page_content=text, metadata=metadata))
@@ -53,11 +80,18 @@ class SimplePdfLoader:
 class SimpleDirectoryLoader:
     """Load documents from a directory."""
     
-    def __init__(self, directory: str, glob: str = "**/*", loader_cls=None):
-        """Initialize with directory and glob pattern."""
+    def __init__(self, directory: str, glob: str = "**/*", loader_cls=None, on_loaded=None,
+                 loader_kwargs: Optional[Dict[str, Any]] = None):
+        """Initialize with directory and glob pattern.
+
+        ``on_loaded`` is called as ``on_loaded(file_path, docs)`` after each file.
+        ``loader_kwargs`` are passed to ``loader_cls`` along with the file path.
+        """
         self.directory = directory
         self.glob_pattern = glob  # store internally as glob_pattern
         self.loader_cls = loader_cls
+        self.on_loaded = on_loaded
+        self.loader_kwargs = loader_kwargs or {}
     
     def load(self) -> List[Document]:
         """Load all documents matching the pattern from the directory."""
@@ -67,13 +101,18 @@ class SimpleDirectoryLoader:
         for file_path in glob.glob(pattern, recursive=True):
             if not os.path.isfile(file_path):
                 continue
-                
+            
+            docs = []
             try:
                 if self.loader_cls:
-                    loader = self.loader_cls(file_path)
+                    loader = self.loader_cls(file_path, **self.loader_kwargs)
                     docs = loader.load()
                     documents.extend(docs)
             except Exception as e:
                 logger.error(f"Error loading file {file_path}: {e}")
+            
+            # Outside the try so the callback can abort the whole load
+            if self.on_loaded:
+                self.on_loaded(file_path, docs)
         
         return documents
@@ -9,8 +9,8 @@ logger = logging.getLogger(__name__)
 class IPCDocumentIngestion(BaseDocumentIngestion):
     """Document ingestion for Indian Penal Code (IPC)."""
     
-    def __init__(self, data_dir="data", vector_store_dir="vectorstores"):
-        super().__init__("ipc", data_dir, vector_store_dir)
+    def __init__(self, data_dir="data", vector_store_dir="vectorstores", **kwargs):
+        super().__init__("ipc", data_dir, vector_store_dir, **kwargs)
         logger.info("IPC Document Ingestion initialized")
         
     def load_documents(self):
@@ -23,22 +23,32 @@ class IPCDocumentIngestion(BaseDocumentIngestion):
 class RTIDocumentIngestion(BaseDocumentIngestion):
     """Document ingestion for Right to Information (RTI)."""
     
-    def __init__(self, data_dir="data", vector_store_dir="vectorstores"):
-        super().__init__("rti", data_dir, vector_store_dir)
+    def __init__(self, data_dir="data", vector_store_dir="vectorstores", **kwargs):
+        super().__init__("rti", data_dir, vector_store_dir, **kwargs)
         logger.info("RTI Document Ingestion initialized")
 
 
 class LaborLawDocumentIngestion(BaseDocumentIngestion):
     """Document ingestion for Labor Laws."""
     
-    def __init__(self, data_dir="data", vector_store_dir="vectorstores"):
-        super().__init__("labor_law", data_dir, vector_store_dir)
+    def __init__(self, data_dir="data", vector_store_dir="vectorstores", **kwargs):
+        super().__init__("labor_law", data_dir, vector_store_dir, **kwargs)
         logger.info("Labor Law Document Ingestion initialized")
 
 
 class ConstitutionDocumentIngestion(BaseDocumentIngestion):
     """Document ingestion for Constitution of India."""
     
-    def __init__(self, data_dir="data", vector_store_dir="vectorstores"):
-        super().__init__("constitution", data_dir, vector_store_dir)
+    def __init__(self, data_dir="data", vector_store_dir="vectorstores", **kwargs):
+        super().__init__("constitution", data_dir, vector_store_dir, **kwargs)
         logger.info("Constitution Document Ingestion initialized")
+
+
+
+# Ingestion class for each domain name
+DOMAIN_INGESTORS = {
+    "ipc": IPCDocumentIngestion,
+    "rti": RTIDocumentIngestion,
+    "labor_law": LaborLawDocumentIngestion,
+    "constitution": ConstitutionDocumentIngestion
+}
@@ -11,13 +11,13 @@ from domain_ingestion import (
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def ingest_all_domains():
+def ingest_all_domains(force_reextract=None):
     """Ingest documents for all domains."""
     domains = [
-        IPCDocumentIngestion(),
-        RTIDocumentIngestion(),
-        LaborLawDocumentIngestion(),
-        ConstitutionDocumentIngestion()
+        IPCDocumentIngestion(force_reextract=force_reextract),
+        RTIDocumentIngestion(force_reextract=force_reextract),
+        LaborLawDocumentIngestion(force_reextract=force_reextract),
+        ConstitutionDocumentIngestion(force_reextract=force_reextract)
     ]
     
     for domain_ingestor in domains:
@@ -26,18 +26,18 @@ def ingest_all_domains():
     
     logger.info("All domains processed successfully")
 
-def ingest_specific_domain(domain):
+def ingest_specific_domain(domain, force_reextract=None):
     """Ingest documents for a specific domain."""
     domain_mapping = {
-        "ipc": IPCDocumentIngestion(),
-        "rti": RTIDocumentIngestion(),
-        "labor_law": LaborLawDocumentIngestion(),
-        "constitution": ConstitutionDocumentIngestion()
+        "ipc": IPCDocumentIngestion,
+        "rti": RTIDocumentIngestion,
+        "labor_law": LaborLawDocumentIngestion,
+        "constitution": ConstitutionDocumentIngestion
     }
     
     if domain in domain_mapping:
         logger.info(f"Processing {domain} domain")
-        domain_mapping[domain].ingest()
+        domain_mapping[domain](force_reextract=force_reextract).ingest()
         logger.info(f"{domain} domain processed successfully")
     else:
         logger.error(f"Unknown domain: {domain}")
@@ -46,10 +46,12 @@ def ingest_specific_domain(domain):
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Ingest documents for legal domains")
     parser.add_argument("--domain", type=str, help="Specific domain to ingest (ipc, rti, labor_law, constitution)")
+    parser.add_argument("--force-reextract", action="store_true", default=None,
+                        help="Ignore the cached PDF text and extract every page again")
     
     args = parser.parse_args()
     
     if args.domain:
-        ingest_specific_domain(args.domain)
+        ingest_specific_domain(args.domain, force_reextract=args.force_reextract)
     else:
-        ingest_all_domains()
+        ingest_all_domains(force_reextract=args.force_reextract)
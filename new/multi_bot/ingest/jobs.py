@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.getenv(
+    "INGEST_JOBS_DB",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "vectorstores", "ingest_jobs.sqlite3")
+)
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    domain TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    target TEXT,
+    status TEXT NOT NULL,
+    progress TEXT NOT NULL DEFAULT '{}',
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    worker_pid INTEGER,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+"""
+
+
+class IngestionCancelled(Exception):
+    """Raised inside a running ingestion when its job has been cancelled."""
+
+
+class JobQueue:
+    """
+    Persistent ingestion job queue backed by SQLite.
+
+    The API process enqueues jobs and a separate worker process claims and
+    runs them, so both sides only ever share this database file.
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH):
+        """Open (and create if needed) the job database."""
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = self._connect()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_dict(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["progress"] = json.loads(job["progress"])
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def enqueue(self, domain, kind="domain", target=None):
+        """
+        Queue an ingestion job, coalescing with an identical queued job.
+
+        A job that is already running may have read its files before the
+        change that prompted this request, so it does not count; the new
+        job waits for it, since ``claim`` runs one job per domain at a time.
+
+        Args:
+            domain (str): Domain to ingest
+            kind (str): "domain" for a full rebuild, "file" for a single file
+            target (str): File path for "file" jobs
+
+        Returns:
+            tuple: (job dict, True if a new job was created)
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE domain = ? AND kind = ? AND target IS ? "
+                "AND status = ? AND cancel_requested = 0 ORDER BY created_at LIMIT 1",
+                (domain, kind, target, QUEUED)
+            ).fetchone()
+            if row is not None:
+                conn.execute("COMMIT")
+                return self._to_dict(row), False
+
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, domain, kind, target, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, domain, kind, target, QUEUED, time.time())
+            )
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+        logger.info(f"Queued {kind} ingestion job {job_id} for {domain}")
+        return self._to_dict(row), True
+
+    def get(self, job_id):
+        """Return a job as a dict, or None if it does not exist."""
+        with self._connection() as conn:
+            return self._to_dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def list(self, limit=50):
+        """Return the most recent jobs, newest first."""
+        with self._connection() as conn:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def claim(self, worker_pid):
+        """
+        Claim the oldest queued job whose domain is not already being ingested.
+
+        Returns:
+            dict: The claimed job, or None if nothing is runnable
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND domain NOT IN "
+                "(SELECT domain FROM jobs WHERE status = ?) ORDER BY created_at LIMIT 1",
+                (QUEUED, RUNNING)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker_pid = ?, started_at = ? WHERE id = ?",
+                (RUNNING, worker_pid, time.time(), row["id"])
+            )
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+            conn.execute("COMMIT")
+            return self._to_dict(row)
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def update_progress(self, job_id, **fields):
+        """Merge progress counters into a job's progress record."""
+        with self._connection() as conn:
+            row = conn.execute("SELECT progress FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            progress = json.loads(row["progress"])
+            progress.update(fields)
+            conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(progress), job_id))
+
+    def is_cancel_requested(self, job_id):
+        """Check whether cancellation has been requested for a job."""
+        with self._connection() as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def cancel(self, job_id):
+        """
+        Cancel a job.
+
+        Queued jobs are cancelled immediately; running jobs are flagged and
+        stop at their next progress checkpoint.
+        """
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED)
+            )
+            conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?",
+                (job_id, RUNNING)
+            )
+        return self.get(job_id)
+
+    def finish(self, job_id, status, error=None):
+        """Record the final state of a job."""
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id)
+            )
+
+    def requeue_orphans(self):
+        """Put back jobs left running by a worker process that has died."""
+        with self._connection() as conn:
+            rows = conn.execute("SELECT id, worker_pid FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+            orphans = [row["id"] for row in rows if not _pid_alive(row["worker_pid"])]
+            for job_id in orphans:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker_pid = NULL, started_at = NULL WHERE id = ?",
+                    (QUEUED, job_id)
+                )
+
+        if orphans:
+            logger.warning(f"Requeued {len(orphans)} orphaned ingestion job(s)")
+        return orphans
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    if pid == os.getpid():
+        return True
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows; assume it is alive
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but belongs to someone else, or the platform cannot tell
+        return True
+    return True
@@ -0,0 +1,142 @@
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+from contextlib import contextmanager
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.getenv(
+    "PDF_TEXT_CACHE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "vectorstores", "pdf_text_cache.sqlite3")
+)
+# Compressed page text kept before the oldest files are evicted; 0 for no limit
+DEFAULT_MAX_BYTES = int(float(os.getenv("PDF_TEXT_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_hash TEXT PRIMARY KEY,
+    num_pages INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    bytes INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS pages (
+    file_hash TEXT NOT NULL,
+    page INTEGER NOT NULL,
+    text BLOB NOT NULL,
+    PRIMARY KEY (file_hash, page)
+) WITHOUT ROWID;
+"""
+
+
+def file_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """Hash a file's contents without reading it into memory at once."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PdfTextCache:
+    """
+    Persistent cache of extracted PDF page text.
+
+    Entries are keyed by the PDF's content hash and page number, so renaming
+    or re-uploading an unchanged file still hits the cache while any edit to
+    the file misses it. Page text is stored zlib-compressed in SQLite.
+
+    Once the stored text exceeds ``max_bytes``, the files cached longest ago
+    are evicted. SQLite reuses the freed pages, so the database stops growing
+    but does not shrink.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        """Open (and create if needed) the cache database."""
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self._connection() as conn:
+            conn.executescript(_SCHEMA)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(files)")]
+            if "bytes" not in columns:
+                # Caches written before sizes were tracked
+                conn.execute("ALTER TABLE files ADD COLUMN bytes INTEGER NOT NULL DEFAULT 0")
+                conn.execute(
+                    "UPDATE files SET bytes = "
+                    "(SELECT COALESCE(SUM(LENGTH(text)), 0) FROM pages WHERE pages.file_hash = files.file_hash)"
+                )
+
+    @contextmanager
+    def _connection(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_pages(self, file_hash: str) -> Optional[List[str]]:
+        """Return every page's text, or None unless the whole file is cached."""
+        with self._connection() as conn:
+            row = conn.execute("SELECT num_pages FROM files WHERE file_hash = ?", (file_hash,)).fetchone()
+            if row is None:
+                return None
+            rows = conn.execute(
+                "SELECT text FROM pages WHERE file_hash = ? ORDER BY page", (file_hash,)
+            ).fetchall()
+
+        if len(rows) != row[0]:
+            return None
+        return [zlib.decompress(text).decode("utf-8") for (text,) in rows]
+
+    def put_pages(self, file_hash: str, texts: List[str]):
+        """Store the text of every page of a file, replacing any previous entry."""
+        blobs = [zlib.compress(text.encode("utf-8")) for text in texts]
+        size = sum(len(blob) for blob in blobs)
+        with self._connection() as conn:
+            conn.execute("DELETE FROM pages WHERE file_hash = ?", (file_hash,))
+            conn.executemany(
+                "INSERT INTO pages (file_hash, page, text) VALUES (?, ?, ?)",
+                [(file_hash, i, blob) for i, blob in enumerate(blobs)]
+            )
+            # Written last, so a file only counts as cached once all pages are in
+            conn.execute(
+                "INSERT OR REPLACE INTO files (file_hash, num_pages, created_at, bytes) VALUES (?, ?, ?, ?)",
+                (file_hash, len(texts), time.time(), size)
+            )
+            if self.max_bytes:
+                self._evict(conn, keep=file_hash)
+
+    def _evict(self, conn, keep: str):
+        """Delete the oldest files, other than ``keep``, until the cache fits in ``max_bytes``."""
+        (total,) = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM files").fetchone()
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        rows = conn.execute(
+            "SELECT file_hash, bytes FROM files WHERE file_hash != ? ORDER BY created_at", (keep,)
+        ).fetchall()
+        for old_hash, size in rows:
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM files WHERE file_hash = ?", (old_hash,))
+            conn.execute("DELETE FROM pages WHERE file_hash = ?", (old_hash,))
+            total -= size
+            evicted += 1
+        logger.info(f"Evicted {evicted} files from the PDF text cache, {total} bytes remain")
+
+
+_default_cache = None
+
+
+def get_default_cache() -> PdfTextCache:
+    """Return the process-wide cache at ``DEFAULT_CACHE_PATH``."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = PdfTextCache()
+    return _default_cache
@@ -0,0 +1,123 @@
+import os
+import time
+import uuid
+import shutil
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Name of the pointer file that records the live version of a domain
+POINTER_FILE = "CURRENT"
+
+
+def versions_dir(vector_store_root, domain_name):
+    """Directory holding every built version of a domain's vector store."""
+    return os.path.join(vector_store_root, f"{domain_name}_versions")
+
+
+def legacy_index_dir(vector_store_root, domain_name):
+    """Unversioned index directory written by older ingestion runs."""
+    return os.path.join(vector_store_root, f"{domain_name}_index")
+
+
+def new_version(vector_store_root, domain_name):
+    """
+    Create an empty staging directory for a new version.
+
+    Version names start with a millisecond timestamp so that sorting them
+    by name also sorts them by age, even for back-to-back incremental builds.
+
+    Returns:
+        tuple: (version name, staging directory path)
+    """
+    now = time.time()
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+    version = f"{stamp}{int(now * 1000) % 1000:03d}-{uuid.uuid4().hex[:6]}"
+    path = os.path.join(versions_dir(vector_store_root, domain_name), version)
+    os.makedirs(path)
+    return version, path
+
+
+def current_version(vector_store_root, domain_name):
+    """Return the name of the published version, or None if there is none."""
+    pointer = os.path.join(versions_dir(vector_store_root, domain_name), POINTER_FILE)
+    try:
+        with open(pointer, "r", encoding="utf-8") as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return version or None
+
+
+def resolve_index_path(vector_store_root, domain_name):
+    """
+    Return the directory readers should open for a domain.
+
+    The published version wins; otherwise a legacy ``{domain}_index``
+    directory is used so existing deployments keep working until their
+    next ingest.
+    """
+    version = current_version(vector_store_root, domain_name)
+    if version:
+        path = os.path.join(versions_dir(vector_store_root, domain_name), version)
+        if os.path.isdir(path):
+            return path
+        logger.warning(f"{domain_name} points at missing version {version}")
+
+    legacy_path = legacy_index_dir(vector_store_root, domain_name)
+    if os.path.isdir(legacy_path) and os.listdir(legacy_path):
+        return legacy_path
+    return None
+
+
+def publish_version(vector_store_root, domain_name, version):
+    """Atomically point the domain at ``version``."""
+    root = versions_dir(vector_store_root, domain_name)
+    pointer = os.path.join(root, POINTER_FILE)
+    tmp_pointer = f"{pointer}.{uuid.uuid4().hex}.tmp"
+
+    with open(tmp_pointer, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+
+    # os.replace is atomic on both POSIX and Windows, so readers see
+    # either the old version or the new one, never a partial file.
+    os.replace(tmp_pointer, pointer)
+    logger.info(f"Published {domain_name} vector store version {version}")
+
+
+def collect_garbage(vector_store_root, domain_name, keep=2):
+    """
+    Delete old versions of a domain's vector store.
+
+    The live version and the ``keep - 1`` versions published before it are
+    retained, so servers still answering from the previous version can
+    finish their in-flight queries. Versions newer than the live one may be
+    builds in progress and are never touched.
+    """
+    root = versions_dir(vector_store_root, domain_name)
+    live = current_version(vector_store_root, domain_name)
+    if not live or not os.path.isdir(root):
+        return []
+
+    versions = sorted(
+        name for name in os.listdir(root)
+        if os.path.isdir(os.path.join(root, name))
+    )
+    older = [name for name in versions if name < live]
+    stale = older[:max(len(older) - (keep - 1), 0)]
+
+    removed = []
+    for name in stale:
+        path = os.path.join(root, name)
+        try:
+            shutil.rmtree(path)
+            removed.append(name)
+        except OSError as e:
+            # Files may still be held open (notably on Windows); retry next run
+            logger.warning(f"Could not remove old version {path}: {e}")
+
+    if removed:
+        logger.info(f"Removed {len(removed)} old {domain_name} version(s): {', '.join(removed)}")
+    return removed
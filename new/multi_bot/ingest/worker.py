@@ -0,0 +1,98 @@
+"""
+Ingestion worker process.
+
+Run from the multi_bot directory:
+
+    python -m ingest.worker
+
+The worker claims jobs from the persistent job queue one at a time and runs
+them outside any web server. Several workers may share a queue; a domain is
+never ingested by two of them at once.
+"""
+import os
+import time
+import argparse
+import logging
+from .jobs import JobQueue, IngestionCancelled, SUCCEEDED, FAILED, CANCELLED
+from .domain_ingestion import DOMAIN_INGESTORS
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class IngestionWorker:
+    """Claims queued ingestion jobs and runs them to completion."""
+
+    def __init__(self, queue=None, poll_interval=1.0):
+        self.queue = queue or JobQueue()
+        self.poll_interval = poll_interval
+        # Ingestors are reused across jobs so the embedding model loads once
+        self._ingestors = {}
+
+    def _get_ingestor(self, domain):
+        if domain not in self._ingestors:
+            self._ingestors[domain] = DOMAIN_INGESTORS[domain]()
+        return self._ingestors[domain]
+
+    def run_job(self, job):
+        """Run a single claimed job and record its outcome."""
+        job_id = job["id"]
+        logger.info(f"Running {job['kind']} ingestion job {job_id} for {job['domain']}")
+
+        def progress(**fields):
+            self.queue.update_progress(job_id, **fields)
+            # Once the new version is live there is nothing left to cancel
+            if fields.get("stage") != "published" and self.queue.is_cancel_requested(job_id):
+                raise IngestionCancelled(f"Job {job_id} was cancelled")
+
+        try:
+            if job["domain"] not in DOMAIN_INGESTORS:
+                raise ValueError(f"Unknown domain: {job['domain']}")
+
+            ingestor = self._get_ingestor(job["domain"])
+            if job["kind"] == "file":
+                ingestor.ingest_file(job["target"], progress_callback=progress)
+            else:
+                ingestor.ingest(progress_callback=progress)
+        except IngestionCancelled:
+            logger.info(f"Ingestion job {job_id} cancelled")
+            self.queue.finish(job_id, CANCELLED)
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed: {e}")
+            self.queue.finish(job_id, FAILED, error=str(e))
+        else:
+            logger.info(f"Ingestion job {job_id} finished")
+            self.queue.finish(job_id, SUCCEEDED)
+
+    def run(self, once=False):
+        """
+        Process jobs until interrupted.
+
+        Args:
+            once (bool): Exit as soon as the queue has no runnable job
+        """
+        self.queue.requeue_orphans()
+        logger.info(f"Ingestion worker {os.getpid()} started")
+
+        while True:
+            job = self.queue.claim(os.getpid())
+            if job is None:
+                if once:
+                    return
+                time.sleep(self.poll_interval)
+                continue
+            self.run_job(job)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run queued document ingestion jobs")
+    parser.add_argument("--once", action="store_true", help="Exit when no job is waiting")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Seconds between queue polls")
+
+    args = parser.parse_args()
+
+    try:
+        IngestionWorker(poll_interval=args.poll_interval).run(once=args.once)
+    except KeyboardInterrupt:
+        logger.info("Ingestion worker stopped")
@@ -0,0 +1,117 @@
+import os
+import re
+import math
+import time
+import random
+import hashlib
+import logging
+from typing import Any, List, Optional
+from langchain_core.language_models.llms import LLM
+from langchain_core.callbacks import CallbackManagerForLLMRun
+
+logger = logging.getLogger(__name__)
+
+# Backend used when none is passed explicitly
+DEFAULT_BACKEND = "gemini"
+
+
+def backend_name(backend=None):
+    """Resolve the backend name from the argument or the LLM_BACKEND variable."""
+    return (backend or os.getenv("LLM_BACKEND", DEFAULT_BACKEND)).lower()
+
+
+def requires_google_api_key(backend=None):
+    """Check whether the selected backend needs GOOGLE_API_KEY."""
+    return backend_name(backend) == "gemini"
+
+
+class FakeLegalLLM(LLM):
+    """
+    Deterministic, offline stand-in for Gemini.
+
+    Answers are assembled from the retrieved context in the prompt, so the
+    output size and shape resemble a real answer. The same prompt always
+    yields the same answer and the same simulated latency: a log-normal
+    time to first token followed by generation at a fixed token rate.
+    """
+
+    latency_median: float = 0.8
+    latency_sigma: float = 0.35
+    tokens_per_second: float = 60.0
+    max_output_tokens: int = 256
+    seed: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-legal"
+
+    def _compose_answer(self, prompt: str, rng: random.Random) -> List[str]:
+        match = re.search(r"context to answer the question:\s*(.*?)\s*Question:", prompt, re.S)
+        words = (match.group(1) if match else prompt).split() or ["No", "context", "provided."]
+
+        length = rng.randint(self.max_output_tokens // 2, self.max_output_tokens)
+        answer = ["Based", "on", "the", "provided", "documents:"]
+        while len(answer) < length:
+            answer.extend(words[:length - len(answer)])
+        return answer[:length]
+
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        rng = random.Random(hashlib.sha256(f"{self.seed}:{prompt}".encode("utf-8")).digest())
+        tokens = self._compose_answer(prompt, rng)
+
+        delay = 0.0
+        if self.latency_median > 0:
+            delay = rng.lognormvariate(math.log(self.latency_median), self.latency_sigma)
+        if self.tokens_per_second > 0:
+            delay += len(tokens) / self.tokens_per_second
+        time.sleep(delay)
+
+        return " ".join(tokens)
+
+
+def get_llm(backend=None, temperature=0.2, max_output_tokens=None):
+    """
+    Create the LLM for the selected backend.
+
+    Args:
+        backend (str): "gemini" or "fake"; defaults to the LLM_BACKEND variable
+        temperature (float): Sampling temperature
+        max_output_tokens (int): Optional cap on generated tokens
+
+    Returns:
+        A LangChain LLM or chat model usable in any chain
+    """
+    backend = backend_name(backend)
+
+    if backend == "gemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        if "GOOGLE_API_KEY" not in os.environ:
+            raise ValueError("GOOGLE_API_KEY environment variable not set")
+
+        kwargs = {}
+        if max_output_tokens:
+            kwargs["max_output_tokens"] = max_output_tokens
+        return ChatGoogleGenerativeAI(
+            model=os.getenv("GEMINI_MODEL", "gemini-2.0-flash"),
+            temperature=temperature,
+            **kwargs
+        )
+
+    if backend == "fake":
+        logger.info("Using the fake LLM backend; answers are synthetic")
+        return FakeLegalLLM(
+            latency_median=float(os.getenv("FAKE_LLM_LATENCY_MEDIAN", "0.8")),
+            latency_sigma=float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.35")),
+            tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "60")),
+            max_output_tokens=max_output_tokens or int(os.getenv("FAKE_LLM_MAX_TOKENS", "256")),
+            seed=int(os.getenv("FAKE_LLM_SEED", "0"))
+        )
+
+    raise ValueError(f"Unknown LLM backend: {backend}")
@@ -0,0 +1,288 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+import itertools
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, most urgent first
+PRIORITIES = ("voice", "chat", "batch")
+
+# Share of the rate limit each class must leave untouched. With a limiter
+# shared between processes this keeps the last tokens for live callers even
+# when another process is running a batch job.
+RATE_RESERVE = {"voice": 0.0, "chat": 0.1, "batch": 0.3}
+
+
+class LLMOverloaded(Exception):
+    """Raised when a request is shed instead of being sent to the LLM."""
+
+
+class TokenBucket:
+    """In-process token bucket rate limiter."""
+
+    def __init__(self, rate_per_second, capacity=None):
+        self.rate = rate_per_second
+        self.capacity = capacity or max(rate_per_second, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, reserve=0.0):
+        """
+        Take a token if one is available above the reserve.
+
+        Returns:
+            float: 0 if a token was taken, otherwise seconds until one should be
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            needed = 1.0 + reserve * self.capacity
+            if self._tokens >= needed:
+                self._tokens -= 1.0
+                return 0.0
+            return (needed - self._tokens) / self.rate
+
+
+class SharedTokenBucket:
+    """Token bucket kept in SQLite so every server process draws on one quota."""
+
+    def __init__(self, db_path, name, rate_per_second, capacity=None):
+        self.db_path = db_path
+        self.name = name
+        self.rate = rate_per_second
+        self.capacity = capacity or max(rate_per_second, 1.0)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+            conn.execute(
+                "INSERT OR IGNORE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                (name, self.capacity, time.time())
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+
+    def try_acquire(self, reserve=0.0):
+        """Same contract as ``TokenBucket.try_acquire``."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            tokens, updated = conn.execute(
+                "SELECT tokens, updated FROM buckets WHERE name = ?", (self.name,)
+            ).fetchone()
+            now = time.time()
+            tokens = min(self.capacity, tokens + max(now - updated, 0) * self.rate)
+
+            needed = 1.0 + reserve * self.capacity
+            wait = 0.0
+            if tokens >= needed:
+                tokens -= 1.0
+            else:
+                wait = (needed - tokens) / self.rate
+
+            conn.execute("UPDATE buckets SET tokens = ?, updated = ? WHERE name = ?", (tokens, now, self.name))
+            conn.execute("COMMIT")
+            return wait
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+
+class _Waiter:
+    __slots__ = ("rank", "seq", "priority", "bot_name", "shed")
+
+    def __init__(self, rank, seq, priority, bot_name):
+        self.rank = rank
+        self.seq = seq
+        self.priority = priority
+        self.bot_name = bot_name
+        self.shed = False
+
+
+class LLMScheduler:
+    """
+    Admission control in front of the LLM.
+
+    Requests wait in one queue ordered by priority class (voice, then chat,
+    then batch) and arrival. A request is admitted when the global
+    concurrency limit, its bot's bulkhead and the rate limit all allow it; a
+    bot at its bulkhead limit does not hold up requests for other bots.
+    When the queue is full, a new request displaces the newest waiter of a
+    lower class, or is itself rejected if there is none. Waiters that exceed
+    their class's maximum wait are rejected too.
+    """
+
+    def __init__(self, max_concurrency=8, per_bot_concurrency=4, requests_per_minute=0,
+                 max_queue=64, max_wait=None, rate_limit_db=None):
+        """
+        Args:
+            max_concurrency (int): LLM calls in flight across all bots
+            per_bot_concurrency (int): LLM calls in flight for any single bot
+            requests_per_minute (float): Rate limit, 0 for none
+            max_queue (int): Waiting requests before shedding starts
+            max_wait (dict): Longest wait in seconds per priority class
+            rate_limit_db (str): SQLite file to share the rate limit between processes
+        """
+        self.max_concurrency = max_concurrency
+        self.per_bot_concurrency = per_bot_concurrency
+        self.max_queue = max_queue
+        self.max_wait = {"voice": 5.0, "chat": 30.0, "batch": 300.0}
+        self.max_wait.update(max_wait or {})
+
+        self.bucket = None
+        if requests_per_minute:
+            if rate_limit_db:
+                self.bucket = SharedTokenBucket(rate_limit_db, "llm", requests_per_minute / 60.0)
+            else:
+                self.bucket = TokenBucket(requests_per_minute / 60.0)
+
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._waiters = []
+        self._in_flight = 0
+        self._bot_in_flight = {}
+        # Rate-limit tokens taken for a waiter that was no longer next when it got back the lock
+        self._rate_credit = 0
+        self._admitted = {p: 0 for p in PRIORITIES}
+        self._shed = {p: 0 for p in PRIORITIES}
+        self._wait_time = {p: 0.0 for p in PRIORITIES}
+
+    @classmethod
+    def from_env(cls):
+        """Build a scheduler configured from LLM_* environment variables."""
+        return cls(
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+            per_bot_concurrency=int(os.getenv("LLM_PER_BOT_CONCURRENCY", "4")),
+            requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", "1000")),
+            max_queue=int(os.getenv("LLM_MAX_QUEUE", "64")),
+            max_wait={p: float(os.getenv(f"LLM_MAX_WAIT_{p.upper()}", default))
+                      for p, default in (("voice", "5"), ("chat", "30"), ("batch", "300"))},
+            rate_limit_db=os.getenv("LLM_RATE_LIMIT_DB") or None
+        )
+
+    def _next_admissible(self):
+        """Most urgent waiter whose bot has bulkhead room, or None."""
+        candidates = [
+            w for w in self._waiters
+            if self._bot_in_flight.get(w.bot_name, 0) < self.per_bot_concurrency
+        ]
+        return min(candidates, key=lambda w: (w.rank, w.seq), default=None)
+
+    def _enqueue(self, bot_name, priority):
+        waiter = _Waiter(PRIORITIES.index(priority), next(self._seq), priority, bot_name)
+
+        if len(self._waiters) >= self.max_queue:
+            victim = max(self._waiters, key=lambda w: (w.rank, w.seq))
+            if victim.rank <= waiter.rank:
+                self._shed[priority] += 1
+                raise LLMOverloaded(f"LLM queue is full; {priority} request rejected")
+            victim.shed = True
+            self._waiters.remove(victim)
+            self._cond.notify_all()
+
+        self._waiters.append(waiter)
+        return waiter
+
+    def _acquire(self, bot_name, priority, timeout):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        if timeout is None:
+            timeout = self.max_wait[priority]
+
+        start = time.monotonic()
+        give_up = start + timeout
+
+        with self._cond:
+            waiter = self._enqueue(bot_name, priority)
+            while True:
+                if waiter.shed:
+                    self._shed[priority] += 1
+                    raise LLMOverloaded(f"{priority} request shed to make room for more urgent work")
+
+                now = time.monotonic()
+                sleep = give_up - now
+                if self._in_flight < self.max_concurrency and self._next_admissible() is waiter:
+                    if self.bucket is None or self._rate_credit:
+                        if self.bucket is not None:
+                            self._rate_credit -= 1
+                        self._waiters.remove(waiter)
+                        self._in_flight += 1
+                        self._bot_in_flight[bot_name] = self._bot_in_flight.get(bot_name, 0) + 1
+                        self._admitted[priority] += 1
+                        self._wait_time[priority] += now - start
+                        # The next waiter may be admissible too, e.g. one for another bot
+                        self._cond.notify_all()
+                        return
+
+                    # A shared bucket is a SQLite transaction; other threads keep the lock meanwhile
+                    self._cond.release()
+                    try:
+                        rate_wait = self.bucket.try_acquire(RATE_RESERVE[priority])
+                    finally:
+                        self._cond.acquire()
+                    if rate_wait == 0.0:
+                        # Held as credit: the loop re-checks admission order, and if
+                        # someone else is next now, the token is theirs
+                        self._rate_credit += 1
+                        self._cond.notify_all()
+                        continue
+                    sleep = min(sleep, rate_wait)
+
+                if now >= give_up:
+                    self._waiters.remove(waiter)
+                    self._shed[priority] += 1
+                    self._cond.notify_all()
+                    raise LLMOverloaded(f"{priority} request waited {timeout:.1f}s for the LLM")
+
+                self._cond.wait(max(sleep, 0.001))
+
+    def _release(self, bot_name):
+        with self._cond:
+            self._in_flight -= 1
+            self._bot_in_flight[bot_name] -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, bot_name, priority="chat", timeout=None):
+        """
+        Hold an LLM slot for the duration of the block.
+
+        Args:
+            bot_name (str): Bot making the call, for its bulkhead
+            priority (str): "voice", "chat" or "batch"
+            timeout (float): Longest wait for admission; defaults to the class maximum
+
+        Raises:
+            LLMOverloaded: If the request is shed or times out waiting
+        """
+        self._acquire(bot_name, priority, timeout)
+        try:
+            yield
+        finally:
+            self._release(bot_name)
+
+    def stats(self):
+        """Return queue depths, in-flight counts and per-class totals."""
+        with self._cond:
+            depth = {p: 0 for p in PRIORITIES}
+            for waiter in self._waiters:
+                depth[waiter.priority] += 1
+            return {
+                "in_flight": self._in_flight,
+                "bot_in_flight": dict(self._bot_in_flight),
+                "queue_depth": depth,
+                "admitted": dict(self._admitted),
+                "shed": dict(self._shed),
+                "avg_wait_seconds": {
+                    p: self._wait_time[p] / self._admitted[p] if self._admitted[p] else 0.0
+                    for p in PRIORITIES
+                }
+            }
@@ -0,0 +1,426 @@
+"""
+Latency histograms for each stage of answering a question, exported in
+the Prometheus text format.
+
+Stages are timed with ``timed``::
+
+    with timed("stt", language="hindi", channel="phone"):
+        text = stt_backend.transcribe(audio, "hindi")
+
+Every observation is labelled by stage, bot, language and channel. Label
+values outside ``LABEL_VALUES`` are recorded as ``other``: some come from
+clients, and each distinct value would otherwise add a series for good. Use
+Prometheus' ``histogram_quantile`` for p50/p95/p99 across a fleet;
+``snapshot`` estimates them for this server from the same buckets.
+
+Set METRICS_ENABLED=0 to turn instrumentation off. ``timed`` then returns
+a shared no-op context manager and ``observe`` returns immediately, so
+each instrumented stage costs a fraction of a microsecond.
+
+Counters for the stats endpoints are kept with ``increment``::
+
+    increment("calls")
+    increment("answers", answered_by="cache")
+
+They count even with METRICS_ENABLED=0, and are exported as
+``legal_assistant_<name>_total``.
+
+Under a pre-fork server, ``serving`` calls ``share`` in the master before
+forking. Every process then writes its values to one SQLite database
+every METRICS_FLUSH_INTERVAL seconds (default 1), and ``render``,
+``snapshot`` and ``counters`` report the sum over all of the server's
+processes, whichever worker is asked.
+"""
+import os
+import json
+import time
+import uuid
+import atexit
+import bisect
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+METRICS_DIR = os.getenv(
+    "METRICS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "vectorstores")
+)
+FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "1"))
+
+# Stages that are timed
+STAGES = ("audio_download", "stt", "embedding", "vector_search", "llm", "tts")
+
+# Labels on every observation, in exposition order
+LABELS = ("stage", "bot", "language", "channel")
+
+# Values the bot, language and channel labels may take; empty means unknown
+LABEL_VALUES = {
+    "bot": frozenset({"IPC Bot", "RTI Bot", "Labor Law Bot", "Constitution Bot"}),
+    "language": frozenset({"english", "hindi", "tamil", "telugu", "marathi", "malayalam", "urdu"}),
+    "channel": frozenset({"phone", "web", "whatsapp", "ivr", "api"})
+}
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_NAME = "legal_assistant_stage_duration_seconds"
+COUNTER_PREFIX = "legal_assistant_"
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# One row per process and label set, holding that process's running totals
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS histograms (
+    process TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    bot TEXT NOT NULL,
+    language TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    counts TEXT NOT NULL,
+    sum REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (process, stage, bot, language, channel)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS counters (
+    process TEXT NOT NULL,
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (process, name, labels)
+) WITHOUT ROWID;
+"""
+
+
+class _Histogram:
+    """Bucket counts, sum and count for one set of label values."""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation within its bucket, as Prometheus does."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                if i == len(BUCKETS):
+                    return BUCKETS[-1]
+                lower = BUCKETS[i - 1] if i else 0.0
+                return lower + (BUCKETS[i] - lower) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+
+_histograms = {}
+# (name, ((label, value), ...)) -> value
+_counters = {}
+# Keys changed since the last flush
+_dirty_histograms = set()
+_dirty_counters = set()
+_lock = threading.Lock()
+
+# Database shared by the server's processes, once ``share`` has been called
+_db_path = None
+# Names this process's rows; a restarted worker may get a pid that was used before
+_process = uuid.uuid4().hex
+_local = threading.local()
+
+
+def _label(name, value):
+    if not value:
+        return ""
+    return value if value in LABEL_VALUES[name] else "other"
+
+
+def observe(stage, seconds, bot="", language="", channel=""):
+    """Record one duration for a stage."""
+    if not METRICS_ENABLED:
+        return
+    key = (stage, _label("bot", bot), _label("language", language), _label("channel", channel))
+    bucket = bisect.bisect_left(BUCKETS, seconds)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = _Histogram()
+        histogram.counts[bucket] += 1
+        histogram.sum += seconds
+        histogram.count += 1
+        _dirty_histograms.add(key)
+
+
+def increment(name, amount=1, **labels):
+    """
+    Add to a counter.
+
+    Args:
+        name (str): Counter name, e.g. "calls"
+        amount (float): How much to add
+        **labels: Label values, e.g. ``bot="cyber"``
+    """
+    key = (name, tuple(sorted((label, str(value)) for label, value in labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+        _dirty_counters.add(key)
+
+
+class _Timer:
+    __slots__ = ("stage", "labels", "start")
+
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        observe(self.stage, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timed(stage, **labels):
+    """
+    Context manager that records how long its block takes.
+
+    Args:
+        stage (str): One of STAGES
+        **labels: ``bot``, ``language`` and/or ``channel``
+    """
+    if not METRICS_ENABLED:
+        return _NULL_TIMER
+    return _Timer(stage, labels)
+
+
+def _connect():
+    """This thread's connection to the shared database, reopened after a fork."""
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.pid != os.getpid():
+        conn = sqlite3.connect(_db_path, timeout=5, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn, _local.pid = conn, os.getpid()
+    return conn
+
+
+def flush():
+    """Write this process's changed values to the shared database; does nothing unless shared."""
+    if _db_path is None:
+        return
+    with _lock:
+        histogram_keys, counter_keys = set(_dirty_histograms), set(_dirty_counters)
+        _dirty_histograms.clear()
+        _dirty_counters.clear()
+        histogram_rows = [
+            (_process, *key, json.dumps(_histograms[key].counts), _histograms[key].sum, _histograms[key].count)
+            for key in histogram_keys
+        ]
+        counter_rows = [(_process, key[0], json.dumps(key[1]), _counters[key]) for key in counter_keys]
+    if not histogram_rows and not counter_rows:
+        return
+
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "INSERT OR REPLACE INTO histograms (process, stage, bot, language, channel, counts, sum, count) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            histogram_rows
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO counters (process, name, labels, value) VALUES (?, ?, ?, ?)",
+            counter_rows
+        )
+        conn.execute("COMMIT")
+    except Exception as e:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        logger.warning(f"Writing metrics to {_db_path} failed: {e}")
+        # Rows hold running totals, so the next flush catches up
+        with _lock:
+            _dirty_histograms.update(histogram_keys)
+            _dirty_counters.update(counter_keys)
+
+
+def _flush_forever():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+
+def _start_flusher():
+    threading.Thread(target=_flush_forever, name="metrics-flusher", daemon=True).start()
+
+
+def share(name):
+    """
+    Pool the values of all of a server's processes in one SQLite database.
+
+    Call in the master before forking workers. Values left by an earlier
+    run of the same server are cleared.
+
+    Args:
+        name: Identifies the server, e.g. its port; each server has its own database
+    """
+    global _db_path
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    _db_path = os.path.join(METRICS_DIR, f"metrics-{name}.sqlite3")
+    conn = _connect()
+    conn.executescript(_SCHEMA)
+    conn.execute("DELETE FROM histograms")
+    conn.execute("DELETE FROM counters")
+    with _lock:
+        _dirty_histograms.update(_histograms)
+        _dirty_counters.update(_counters)
+    _start_flusher()
+    atexit.register(flush)
+
+
+def _after_fork():
+    """A forked worker starts from zero under a name of its own; what the master recorded stays the master's."""
+    global _lock, _process
+    _lock = threading.Lock()
+    _process = uuid.uuid4().hex
+    _histograms.clear()
+    _counters.clear()
+    _dirty_histograms.clear()
+    _dirty_counters.clear()
+    if _db_path is not None:
+        _start_flusher()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _collect():
+    """Histograms and counters summed over the processes sharing the database, or this process's own."""
+    histograms = {}
+    if _db_path is None:
+        with _lock:
+            for key, histogram in _histograms.items():
+                copy = histograms[key] = _Histogram()
+                copy.counts, copy.sum, copy.count = list(histogram.counts), histogram.sum, histogram.count
+            return histograms, dict(_counters)
+
+    flush()
+    conn = _connect()
+    for stage, bot, language, channel, counts, total, count in conn.execute(
+        "SELECT stage, bot, language, channel, counts, sum, count FROM histograms"
+    ):
+        key = (stage, bot, language, channel)
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = _Histogram()
+        for i, n in enumerate(json.loads(counts)):
+            histogram.counts[i] += n
+        histogram.sum += total
+        histogram.count += count
+    counter_values = {
+        (name, tuple(tuple(pair) for pair in json.loads(labels))): value
+        for name, labels, value in conn.execute("SELECT name, labels, SUM(value) FROM counters GROUP BY name, labels")
+    }
+    return histograms, counter_values
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_bound(bound):
+    return repr(float(bound))
+
+
+def render():
+    """All histograms and counters in the Prometheus text exposition format."""
+    histograms, counter_values = _collect()
+
+    lines = [
+        f"# HELP {METRIC_NAME} Time spent in each stage of answering a question",
+        f"# TYPE {METRIC_NAME} histogram"
+    ]
+    for key, histogram in sorted(histograms.items()):
+        labels = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(LABELS, key))
+        cumulative = 0
+        for bound, n in zip(BUCKETS, histogram.counts):
+            cumulative += n
+            lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{_format_bound(bound)}"}} {cumulative}')
+        lines.append(f'{METRIC_NAME}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{METRIC_NAME}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{METRIC_NAME}_count{{{labels}}} {histogram.count}")
+
+    previous = None
+    for (name, labels), value in sorted(counter_values.items()):
+        metric = f"{COUNTER_PREFIX}{name}_total"
+        if name != previous:
+            lines.append(f"# TYPE {metric} counter")
+            previous = name
+        label_text = ",".join(f'{label}="{_escape(label_value)}"' for label, label_value in labels)
+        lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot():
+    """
+    Per-label-set counts and estimated p50/p95/p99 in milliseconds, for JSON stats endpoints.
+
+    Returns:
+        list: One dict per stage/bot/language/channel combination
+    """
+    result = []
+    for key, histogram in sorted(_collect()[0].items()):
+        entry = dict(zip(LABELS, key))
+        entry["count"] = histogram.count
+        entry["avg_ms"] = round(histogram.sum / histogram.count * 1000, 1)
+        for name, q in (("p50_ms", 0.5), ("p95_ms", 0.95), ("p99_ms", 0.99)):
+            entry[name] = round(histogram.quantile(q) * 1000, 1)
+        result.append(entry)
+    return result
+
+
+def counters():
+    """
+    All counters, summed over the server's processes.
+
+    Returns:
+        dict: Counter name -> {tuple of (label, value) pairs: value}
+    """
+    result = {}
+    for (name, labels), value in _collect()[1].items():
+        result.setdefault(name, {})[labels] = value
+    return result
+
+
+def reset():
+    """Drop all recorded observations and counts, including those of the server's other processes."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _dirty_histograms.clear()
+        _dirty_counters.clear()
+    if _db_path is not None:
+        conn = _connect()
+        conn.execute("DELETE FROM histograms")
+        conn.execute("DELETE FROM counters")
@@ -80,3 +80,41 @@ BOT_PROMPTS = {
     "Labor Law Bot": LABOR_LAW_PROMPT,
     "Constitution Bot": CONSTITUTION_PROMPT
 }
+
+# Answer style instructions, added to each domain prompt for its channel
+STYLE_INSTRUCTIONS = {
+    "default": "",
+    "voice": """Your answer will be read aloud on a phone call. Answer in at most three short sentences
+of plain spoken language. Do not use lists, headings, symbols or markdown; say "section 379"
+rather than "S. 379".
+""",
+    "whatsapp": """Your answer will be sent as a WhatsApp message. Keep it under 1200 characters.
+Use short paragraphs or a few bullet points, and no headings or tables.
+""",
+    "sms": """Your answer will be sent as a text message. Answer in one or two sentences,
+under 300 characters, in plain text.
+"""
+}
+
+_CONTEXT_MARKER = "Use the following context to answer the question:"
+
+
+def _with_style(template, style):
+    """Insert a style instruction just before the context section of a template."""
+    instruction = STYLE_INSTRUCTIONS[style]
+    if not instruction:
+        return template
+    return template.replace(_CONTEXT_MARKER, instruction + "\n" + _CONTEXT_MARKER, 1)
+
+
+# Prompt variants per bot and answer style
+BOT_PROMPT_STYLES = {
+    bot_name: {
+        style: prompt if style == "default" else PromptTemplate(
+            template=_with_style(prompt.template, style),
+            input_variables=["context", "question"]
+        )
+        for style in STYLE_INSTRUCTIONS
+    }
+    for bot_name, prompt in BOT_PROMPTS.items()
+}
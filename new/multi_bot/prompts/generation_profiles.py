@@ -0,0 +1,14 @@
+from collections import namedtuple
+
+# How answers are generated for a channel: output token cap (None for the
+# model's default), answer style from STYLE_INSTRUCTIONS, and temperature
+GenerationProfile = namedtuple("GenerationProfile", ["max_output_tokens", "style", "temperature"])
+
+# Voice answers are read aloud by <Say> and WhatsApp replies are cut at 1500
+# characters, so there is no point generating more than a channel can deliver
+GENERATION_PROFILES = {
+    "default": GenerationProfile(max_output_tokens=None, style="default", temperature=0.2),
+    "voice": GenerationProfile(max_output_tokens=160, style="voice", temperature=0.1),
+    "whatsapp": GenerationProfile(max_output_tokens=350, style="whatsapp", temperature=0.2),
+    "sms": GenerationProfile(max_output_tokens=90, style="sms", temperature=0.1)
+}
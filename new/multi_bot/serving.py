@@ -0,0 +1,143 @@
+"""
+Run a channel server in production: a pre-fork gunicorn master with
+several worker processes.
+
+The master imports the app, which loads the embedding model, and runs its
+``preload`` function, which reads the vector index files into the OS page
+cache, before any worker is forked. The workers then share the model's
+pages copy-on-write instead of each loading its own copy, and open the
+indexes themselves without touching the disk. The garbage collector is
+frozen after preloading so that collections in the workers do not touch,
+and thereby copy, the preloaded objects.
+
+Settings:
+
+- SERVER_MODE: ``production``, or ``dev`` for the single-process Flask
+  debug server / uvicorn with auto-reload. Defaults to ``production`` where
+  gunicorn is installed and the platform can fork, and to ``dev`` otherwise
+  (e.g. on Windows)
+- SERVER_WORKERS: worker processes (default 2)
+- SERVER_THREADS: threads per worker for the Flask servers (default 8)
+- SERVER_TIMEOUT: seconds a silent worker is given before it is restarted (default 120)
+- SERVER_GRACEFUL_TIMEOUT: seconds workers get to finish requests on reload or shutdown (default 30)
+- SERVER_MAX_REQUESTS: restart a worker after this many requests, 0 for never (default 0)
+
+``kill -HUP <master pid>`` replaces the workers gracefully: new workers
+are forked from the preloaded master and old ones finish their requests
+first. Code changes need a new master, ``kill -USR2`` followed by
+``kill -QUIT`` of the old master.
+
+State that does not survive ``fork`` (connection pools, background
+threads, gRPC clients, CTranslate2 models, vector store clients) is reset
+in each worker by ``os.register_at_fork`` hooks in the modules that own it.
+"""
+import os
+import gc
+import logging
+import importlib.util
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# gunicorn is optional, and pre-forking needs os.fork, which Windows lacks
+PREFORK_AVAILABLE = hasattr(os, "fork") and importlib.util.find_spec("gunicorn") is not None
+
+SERVER_MODE = os.getenv("SERVER_MODE") or ("production" if PREFORK_AVAILABLE else "dev")
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "2"))
+SERVER_THREADS = int(os.getenv("SERVER_THREADS", "8"))
+SERVER_TIMEOUT = int(os.getenv("SERVER_TIMEOUT", "120"))
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+SERVER_MAX_REQUESTS = int(os.getenv("SERVER_MAX_REQUESTS", "0"))
+
+
+def multiprocess():
+    """Whether the server will run several worker processes, which must then share their state."""
+    return SERVER_MODE == "production" and SERVER_WORKERS > 1
+
+
+def _post_fork(server, worker):
+    logger.info(f"Worker {worker.pid} forked")
+
+
+def run(app, port, asgi=False, import_string=None, preload=None, host="0.0.0.0"):
+    """
+    Serve an app until the server is shut down.
+
+    Args:
+        app: The Flask or FastAPI application
+        port (int): Port to listen on
+        asgi (bool): True for FastAPI apps
+        import_string (str): "module:app", used by uvicorn's auto-reload in dev mode
+        preload (callable): Warms shared models and indexes in the master before forking
+        host (str): Interface to listen on
+    """
+    if SERVER_MODE == "dev":
+        if not os.getenv("SERVER_MODE"):
+            logger.warning("gunicorn or os.fork is unavailable; serving with a single development process")
+        if asgi:
+            import uvicorn
+            uvicorn.run(import_string, host=host, port=port, reload=True)
+        else:
+            app.run(host=host, port=port, debug=True)
+        return
+
+    if SERVER_MODE != "production":
+        raise ValueError(f"Unknown SERVER_MODE: {SERVER_MODE}")
+    if not PREFORK_AVAILABLE:
+        raise RuntimeError(
+            "SERVER_MODE=production needs gunicorn and a platform with os.fork; "
+            "install gunicorn or set SERVER_MODE=dev"
+        )
+    from gunicorn.app.base import BaseApplication
+
+    from session_store import memory_stores
+
+    # A call's next request can land on any worker, so each must see every session
+    per_process = memory_stores()
+    if SERVER_WORKERS > 1 and per_process:
+        raise RuntimeError(
+            f"Sessions ({', '.join(per_process)}) are kept in memory, per worker; "
+            "set SESSION_STORE=sqlite or SERVER_WORKERS=1"
+        )
+
+    # Every worker reports the whole server's metrics, not just its own
+    metrics.share(port)
+
+    if preload:
+        preload()
+    gc.collect()
+    gc.freeze()
+
+    options = {
+        "bind": f"{host}:{port}",
+        "workers": SERVER_WORKERS,
+        "timeout": SERVER_TIMEOUT,
+        "graceful_timeout": SERVER_GRACEFUL_TIMEOUT,
+        "max_requests": SERVER_MAX_REQUESTS,
+        "max_requests_jitter": SERVER_MAX_REQUESTS // 10,
+        "preload_app": True,
+        "post_fork": _post_fork
+    }
+    if asgi:
+        options["worker_class"] = "uvicorn.workers.UvicornWorker"
+    else:
+        options["worker_class"] = "gthread"
+        options["threads"] = SERVER_THREADS
+    if os.path.isdir("/dev/shm"):
+        # Worker heartbeats on tmpfs, so a slow disk cannot stall them
+        options["worker_tmp_dir"] = "/dev/shm"
+
+    class Server(BaseApplication):
+        def load_config(self):
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    logger.info(
+        f"Serving on {host}:{port} with {SERVER_WORKERS} workers"
+        + ("" if asgi else f" x {SERVER_THREADS} threads")
+    )
+    Server().run()
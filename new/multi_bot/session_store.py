@@ -0,0 +1,353 @@
+"""
+Expiring key-value storage for per-call, per-browser and per-chat sessions.
+
+Each server keeps its sessions in a ``SessionStore`` from
+``get_session_store(namespace, ttl)`` instead of a plain dict. Entries
+expire ``ttl`` seconds after they were last written; expired entries are
+never returned, and a background thread deletes them every
+SESSION_SWEEP_INTERVAL seconds.
+
+Backends, selected with SESSION_STORE:
+
+- ``memory``: a dict in this process
+- ``sqlite``: one SQLite database (SESSION_DB) shared by every worker
+  process on the host, so any worker can serve any step of a call
+
+When SESSION_STORE is unset, ``sqlite`` is used if the server will run
+several worker processes (see ``serving``) and ``memory`` otherwise.
+
+Values are JSON-compatible dicts, stored as compact UTF-8 JSON and
+compressed when large. Reads return a copy: change a session with
+``update`` (or by assigning the whole value), not by mutating what
+``get`` returned.
+"""
+import os
+import json
+import time
+import zlib
+import sqlite3
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+SESSION_STORE = os.getenv("SESSION_STORE")
+SESSION_DB = os.getenv(
+    "SESSION_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "vectorstores", "sessions.sqlite3")
+)
+SWEEP_INTERVAL = float(os.getenv("SESSION_SWEEP_INTERVAL", "60"))
+
+# Encoded values larger than this are zlib-compressed
+COMPRESS_OVER = 512
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_expires ON sessions (expires);
+"""
+
+
+def encode(value):
+    """Serialize a session to bytes: a one-byte tag, then JSON or compressed JSON."""
+    data = json.dumps(value, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if len(data) > COMPRESS_OVER:
+        compressed = zlib.compress(data)
+        if len(compressed) < len(data):
+            return b"z" + compressed
+    return b"j" + data
+
+
+def decode(blob):
+    """Inverse of ``encode``."""
+    blob = bytes(blob)
+    data = zlib.decompress(blob[1:]) if blob[:1] == b"z" else blob[1:]
+    return json.loads(data)
+
+
+class SessionStore:
+    """Dict-style access shared by the backends."""
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+    def __delitem__(self, key):
+        self.delete(key)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return self.count()
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions in a dict in this process."""
+
+    backend = "memory"
+
+    def __init__(self, namespace, ttl):
+        """
+        Args:
+            namespace (str): Name of this kind of session, e.g. "call"
+            ttl (float): Seconds an entry lives after its last write
+        """
+        self.namespace = namespace
+        self.ttl = ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[0] <= now:
+            del self._data[key]
+            return None
+        return item[1]
+
+    def get(self, key, default=None):
+        """Return a copy of a session, or ``default`` if it is missing or expired."""
+        with self._lock:
+            blob = self._live(key, time.time())
+        return default if blob is None else decode(blob)
+
+    def set(self, key, value):
+        """Store a session, resetting its TTL."""
+        blob = encode(value)
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, blob)
+
+    def update(self, key, **fields):
+        """
+        Change some fields of a session atomically, resetting its TTL.
+
+        Returns:
+            dict: The updated session, or None if there was none
+        """
+        with self._lock:
+            now = time.time()
+            blob = self._live(key, now)
+            if blob is None:
+                return None
+            value = decode(blob)
+            value.update(fields)
+            self._data[key] = (now + self.ttl, encode(value))
+            return value
+
+    def delete(self, key):
+        """Remove a session; returns whether there was one."""
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def sweep(self):
+        """Delete expired sessions; returns how many."""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (expires, _) in self._data.items() if expires <= now]
+            for key in expired:
+                del self._data[key]
+        return len(expired)
+
+    def count(self):
+        now = time.time()
+        with self._lock:
+            return sum(1 for expires, _ in self._data.values() if expires > now)
+
+    def stats(self):
+        """Return backend, live entry count and stored bytes."""
+        now = time.time()
+        with self._lock:
+            live = [blob for expires, blob in self._data.values() if expires > now]
+        return {"backend": self.backend, "entries": len(live), "bytes": sum(len(blob) for blob in live)}
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a SQLite database shared by every process on the host."""
+
+    backend = "sqlite"
+
+    def __init__(self, namespace, ttl, db_path=SESSION_DB):
+        """
+        Args:
+            namespace (str): Name of this kind of session, e.g. "call"
+            ttl (float): Seconds an entry lives after its last write
+            db_path (str): Database file
+        """
+        self.namespace = namespace
+        self.ttl = ttl
+        self.db_path = db_path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        """This thread's connection, reopened after a fork."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key, default=None):
+        """Return a copy of a session, or ``default`` if it is missing or expired."""
+        row = self._connect().execute(
+            "SELECT value FROM sessions WHERE namespace = ? AND key = ? AND expires > ?",
+            (self.namespace, key, time.time())
+        ).fetchone()
+        return default if row is None else decode(row[0])
+
+    def set(self, key, value):
+        """Store a session, resetting its TTL."""
+        self._connect().execute(
+            "INSERT OR REPLACE INTO sessions (namespace, key, value, expires) VALUES (?, ?, ?, ?)",
+            (self.namespace, key, encode(value), time.time() + self.ttl)
+        )
+
+    def update(self, key, **fields):
+        """
+        Change some fields of a session atomically, resetting its TTL.
+
+        Returns:
+            dict: The updated session, or None if there was none
+        """
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute(
+                "SELECT value FROM sessions WHERE namespace = ? AND key = ? AND expires > ?",
+                (self.namespace, key, now)
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            value = decode(row[0])
+            value.update(fields)
+            conn.execute(
+                "UPDATE sessions SET value = ?, expires = ? WHERE namespace = ? AND key = ?",
+                (encode(value), now + self.ttl, self.namespace, key)
+            )
+            conn.execute("COMMIT")
+            return value
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def delete(self, key):
+        """Remove a session; returns whether there was one."""
+        cursor = self._connect().execute(
+            "DELETE FROM sessions WHERE namespace = ? AND key = ?", (self.namespace, key)
+        )
+        return cursor.rowcount > 0
+
+    def sweep(self):
+        """Delete expired sessions; returns how many."""
+        cursor = self._connect().execute(
+            "DELETE FROM sessions WHERE namespace = ? AND expires <= ?", (self.namespace, time.time())
+        )
+        return cursor.rowcount
+
+    def count(self):
+        return self._connect().execute(
+            "SELECT COUNT(*) FROM sessions WHERE namespace = ? AND expires > ?", (self.namespace, time.time())
+        ).fetchone()[0]
+
+    def stats(self):
+        """Return backend, live entry count and stored bytes."""
+        entries, size = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM sessions WHERE namespace = ? AND expires > ?",
+            (self.namespace, time.time())
+        ).fetchone()
+        return {"backend": self.backend, "entries": entries, "bytes": size}
+
+
+_stores = []
+_stores_lock = threading.Lock()
+_sweeper_pid = None
+
+
+def _sweep_forever():
+    while True:
+        time.sleep(SWEEP_INTERVAL)
+        with _stores_lock:
+            stores = list(_stores)
+        for store in stores:
+            try:
+                removed = store.sweep()
+                if removed:
+                    logger.info(f"Expired {removed} {store.namespace} sessions")
+            except Exception as e:
+                logger.warning(f"Sweeping {store.namespace} sessions failed: {e}")
+
+
+def _ensure_sweeper():
+    """Start the sweeper thread in this process if it is not running (threads do not survive fork)."""
+    global _sweeper_pid
+    if _sweeper_pid != os.getpid():
+        _sweeper_pid = os.getpid()
+        threading.Thread(target=_sweep_forever, name="session-sweeper", daemon=True).start()
+
+
+def _after_fork():
+    global _stores_lock
+    _stores_lock = threading.Lock()
+    if _stores:
+        _ensure_sweeper()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def _default_backend():
+    import serving
+
+    return "sqlite" if serving.multiprocess() else "memory"
+
+
+def memory_stores():
+    """Namespaces of the stores that keep their sessions in this process only."""
+    with _stores_lock:
+        return [store.namespace for store in _stores if store.backend == "memory"]
+
+
+def get_session_store(namespace, ttl, backend=None):
+    """
+    Create a session store and register it with the background sweeper.
+
+    Args:
+        namespace (str): Name of this kind of session; stores with different
+            names never see each other's keys
+        ttl (float): Seconds an entry lives after its last write
+        backend (str): "memory" or "sqlite"; defaults to the SESSION_STORE variable,
+            then to "sqlite" for a multi-worker server and "memory" otherwise
+
+    Returns:
+        SessionStore
+    """
+    backend = (backend or SESSION_STORE or _default_backend()).lower()
+    if backend == "memory":
+        store = MemorySessionStore(namespace, ttl)
+    elif backend == "sqlite":
+        store = SQLiteSessionStore(namespace, ttl)
+    else:
+        raise ValueError(f"Unknown session store: {backend}")
+
+    with _stores_lock:
+        _stores.append(store)
+        _ensure_sweeper()
+    return store
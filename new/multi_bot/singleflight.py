@@ -0,0 +1,96 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls that share a key into a single execution.
+
+    The first caller for a key runs the function; callers arriving while it
+    is still running wait for the same result (or exception) instead of
+    repeating the work. Once the call finishes the key is forgotten, so this
+    deduplicates in-flight work only and never serves stale results.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._executions = 0
+        self._collapsed = 0
+
+    def _join(self, key):
+        """Return the shared future for ``key`` and whether the caller leads it."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self._collapsed += 1
+                return future, False
+
+            future = Future()
+            self._calls[key] = future
+            self._executions += 1
+            return future, True
+
+    def _run(self, key, future, fn, args, kwargs):
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            with self._lock:
+                self._calls.pop(key, None)
+            future.set_exception(e)
+        else:
+            with self._lock:
+                self._calls.pop(key, None)
+            future.set_result(result)
+
+    def do(self, key, fn, *args, timeout=None, **kwargs):
+        """
+        Run ``fn(*args, **kwargs)`` unless an identical call is in flight.
+
+        ``timeout`` bounds how long a caller that joined another's call waits
+        for it; the caller that runs the function always waits for it.
+
+        Raises:
+            concurrent.futures.TimeoutError: If a joined call is still running after ``timeout``
+        """
+        future, leader = self._join(key)
+        if leader:
+            self._run(key, future, fn, args, kwargs)
+            timeout = None
+        return future.result(timeout=timeout)
+
+    async def ado(self, key, fn, *args, executor=None, timeout=None, **kwargs):
+        """
+        Async variant of ``do``; the function itself runs in ``executor``.
+
+        Sync and async callers share flights, so a request on one path can be
+        satisfied by work started on the other. ``timeout`` bounds the wait of
+        joining callers only, as for ``do``.
+
+        Raises:
+            asyncio.TimeoutError: If a joined call is still running after ``timeout``
+        """
+        future, leader = self._join(key)
+        if leader:
+            loop = asyncio.get_running_loop()
+            loop.run_in_executor(executor, self._run, key, future, fn, args, kwargs)
+            timeout = None
+        # Shielded so one cancelled or timed-out waiter does not cancel the shared call
+        return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), timeout)
+
+    def stats(self):
+        """Return counters describing how much work was collapsed."""
+        with self._lock:
+            executions = self._executions
+            collapsed = self._collapsed
+            in_flight = len(self._calls)
+
+        calls = executions + collapsed
+        return {
+            "calls": calls,
+            "executions": executions,
+            "collapsed": collapsed,
+            "collapse_ratio": collapsed / calls if calls else 0.0,
+            "in_flight": in_flight
+        }
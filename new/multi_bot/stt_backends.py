@@ -0,0 +1,416 @@
+import os
+import time
+import queue
+import logging
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import Future
+from audio_io import MemoryFile
+
+logger = logging.getLogger(__name__)
+
+# Backend used when none is passed explicitly
+DEFAULT_BACKEND = "openai"
+
+# Whisper takes ISO 639-1 codes, Google Speech takes BCP-47 tags
+LANGUAGE_CODES = {
+    "english": ("en", "en-IN"),
+    "hindi": ("hi", "hi-IN"),
+    "tamil": ("ta", "ta-IN"),
+    "telugu": ("te", "te-IN"),
+    "marathi": ("mr", "mr-IN")
+}
+
+# Hosts recordings may be fetched from by URL, with their subdomains
+RECORDING_HOSTS = [
+    host.strip().lower()
+    for host in os.getenv("RECORDING_HOSTS", "api.twilio.com,recordings.exotel.com").split(",")
+    if host.strip()
+]
+
+# Whisper works on 16 kHz audio in windows of 30 seconds
+SAMPLE_RATE = 16000
+WINDOW_SAMPLES = 30 * SAMPLE_RATE
+
+# Whisper's decoder context length
+MAX_DECODE_TOKENS = 448
+
+
+def whisper_language(language):
+    """Map a language name ("Hindi") or tag ("hi-IN") to a Whisper code ("hi")."""
+    if not language:
+        return None
+    language = language.lower()
+    if language in LANGUAGE_CODES:
+        return LANGUAGE_CODES[language][0]
+    return language.split("-")[0]
+
+
+def bcp47_language(language):
+    """Map a language name ("Hindi") to a BCP-47 tag ("hi-IN"); tags pass through."""
+    return LANGUAGE_CODES.get(language.lower(), (None, language))[1]
+
+
+def _as_file(audio, fmt):
+    """Wrap a bytes-like object in a named file without copying; files pass through."""
+    if hasattr(audio, "read"):
+        return audio
+    if isinstance(audio, str):
+        return open(audio, "rb")
+    # The name is used by APIs that infer the container from it
+    return MemoryFile(audio, name=f"audio.{fmt}")
+
+
+def _as_bytes(audio):
+    """Get the contents of a bytes-like object, a file object or a path as bytes."""
+    if isinstance(audio, bytes):
+        return audio
+    if hasattr(audio, "read"):
+        return audio.read()
+    if isinstance(audio, str):
+        with open(audio, "rb") as f:
+            return f.read()
+    return bytes(audio)
+
+
+class OpenAIWhisperSTT:
+    """Transcription with the hosted OpenAI Whisper API."""
+
+    name = "openai"
+
+    def __init__(self, model="whisper-1"):
+        import openai
+
+        self.openai = openai
+        self.model = model
+
+    def transcribe(self, audio, language=None, fmt="mp3"):
+        """
+        Transcribe one recording.
+
+        Args:
+            audio: A bytes-like object (e.g. a memoryview), a binary file object or a path
+            language (str): Language name or code; detected when omitted
+            fmt (str): Container format, e.g. "mp3" or "webm"
+
+        Returns:
+            str: The transcribed text
+        """
+        kwargs = {}
+        if whisper_language(language):
+            kwargs["language"] = whisper_language(language)
+
+        result = self.openai.Audio.transcribe(model=self.model, file=_as_file(audio, fmt), **kwargs)
+        return result.text if hasattr(result, "text") else result["text"]
+
+
+class GoogleSpeechSTT:
+    """Transcription with Google Cloud Speech-to-Text."""
+
+    name = "google"
+
+    # Container format -> (encoding name, sample rate); None lets Google read the header
+    ENCODINGS = {
+        "webm": ("WEBM_OPUS", 48000),
+        "ogg": ("OGG_OPUS", 48000),
+        "wav": ("ENCODING_UNSPECIFIED", None),
+        "flac": ("ENCODING_UNSPECIFIED", None)
+    }
+
+    def __init__(self):
+        from google.cloud import speech
+
+        self.speech = speech
+        self.client = self._connect()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _connect(self):
+        credentials = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+        if credentials:
+            return self.speech.SpeechClient.from_service_account_json(credentials)
+        return self.speech.SpeechClient()
+
+    def _after_fork(self):
+        # gRPC channels cannot be used across fork; a forked worker connects on first use
+        self.client = None
+
+    def transcribe(self, audio, language=None, fmt="webm"):
+        """Transcribe one recording; same arguments as ``OpenAIWhisperSTT.transcribe``."""
+        if fmt not in self.ENCODINGS:
+            raise ValueError(f"Google Speech backend does not support {fmt} audio")
+        encoding, sample_rate = self.ENCODINGS[fmt]
+
+        config = {
+            "encoding": getattr(self.speech.RecognitionConfig.AudioEncoding, encoding),
+            "language_code": bcp47_language(language or "english"),
+            "enable_automatic_punctuation": True
+        }
+        if sample_rate:
+            config["sample_rate_hertz"] = sample_rate
+
+        if self.client is None:
+            self.client = self._connect()
+        response = self.client.recognize(
+            config=self.speech.RecognitionConfig(**config),
+            audio=self.speech.RecognitionAudio(content=_as_bytes(audio))
+        )
+        return "".join(result.alternatives[0].transcript for result in response.results)
+
+
+class LocalWhisperSTT:
+    """
+    Transcription on the local CPU with faster-whisper (CTranslate2).
+
+    The model is loaded once and shared by every request in the process.
+    Clips of up to 30 seconds are queued and transcribed in batches: a
+    single batching thread collects whatever arrives within ``batch_wait``
+    seconds, up to ``batch_size`` clips, and runs them through the encoder
+    and decoder together. Longer clips use faster-whisper's own segmented
+    transcription on CTranslate2's worker pool.
+
+    CTranslate2's threads do not survive ``fork``, so a forked server
+    worker loads its own copy of the model on its first request.
+    """
+
+    name = "local"
+
+    def __init__(self, model_size="small", compute_type="int8", cpu_threads=0, num_workers=2,
+                 batch_size=8, batch_wait=0.025, beam_size=1, warmup=True):
+        """
+        Args:
+            model_size (str): Whisper model name or path to a converted model
+            compute_type (str): CTranslate2 compute type; int8 is fastest on CPU
+            cpu_threads (int): Threads per CTranslate2 worker, 0 for automatic
+            num_workers (int): CTranslate2 workers, i.e. calls that run in parallel
+            batch_size (int): Most short clips transcribed together
+            batch_wait (float): Seconds to wait for more clips before running a batch
+            beam_size (int): Decoding beam size; 1 is greedy
+            warmup (bool): Transcribe a second of silence so the first caller does not pay for it
+        """
+        from faster_whisper import decode_audio
+        from faster_whisper.tokenizer import Tokenizer
+
+        self._decode_audio = decode_audio
+        self._tokenizer_cls = Tokenizer
+        self._model_args = (model_size, compute_type, cpu_threads, num_workers)
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.beam_size = beam_size
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._batched_clips = 0
+        self._load_lock = threading.Lock()
+        self._load()
+
+        if warmup:
+            import numpy as np
+            self._submit(np.zeros(SAMPLE_RATE, dtype=np.float32), "en").result()
+
+    def _load(self):
+        """Load the model and start the batching thread in this process."""
+        from faster_whisper import WhisperModel
+
+        model_size, compute_type, cpu_threads, num_workers = self._model_args
+        start = time.time()
+        self.model = WhisperModel(
+            model_size,
+            device="cpu",
+            compute_type=compute_type,
+            cpu_threads=cpu_threads,
+            num_workers=num_workers
+        )
+        logger.info(f"Loaded faster-whisper {model_size} ({compute_type}) in {time.time() - start:.1f}s")
+
+        self._queue = queue.Queue()
+        threading.Thread(target=self._batch_loop, name="stt-batcher", daemon=True).start()
+        self._pid = os.getpid()
+
+    def _ensure_loaded(self):
+        if self._pid != os.getpid():
+            with self._load_lock:
+                if self._pid != os.getpid():
+                    self._load()
+
+    def transcribe(self, audio, language=None, fmt=None):
+        """
+        Transcribe one recording; same arguments as ``OpenAIWhisperSTT.transcribe``.
+
+        ``fmt`` is not needed: the container is detected from the data.
+        """
+        # PyAV reads paths and file objects directly
+        self._ensure_loaded()
+        source = audio if isinstance(audio, str) else _as_file(audio, fmt or "audio")
+        samples = self._decode_audio(source, sampling_rate=SAMPLE_RATE)
+        language = whisper_language(language)
+
+        if len(samples) <= WINDOW_SAMPLES:
+            return self._submit(samples, language).result()
+
+        segments, _ = self.model.transcribe(samples, language=language, beam_size=self.beam_size)
+        return " ".join(segment.text.strip() for segment in segments)
+
+    def _submit(self, samples, language):
+        future = Future()
+        self._queue.put((samples, language, future))
+        return future
+
+    def _batch_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            give_up = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = give_up - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                texts = self._transcribe_batch([(samples, language) for samples, language, _ in batch])
+            except Exception as e:
+                logger.error(f"Batched transcription of {len(batch)} clips failed: {e}")
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            with self._stats_lock:
+                self._batches += 1
+                self._batched_clips += len(batch)
+            for (_, _, future), text in zip(batch, texts):
+                future.set_result(text)
+
+    def _transcribe_batch(self, clips):
+        """Run the encoder once over a batch of 30-second windows, then decode them together."""
+        import numpy as np
+
+        extractor = self.model.feature_extractor
+        features = np.stack([
+            # Pad with silence to a full window, as Whisper was trained on
+            extractor(np.pad(samples, (0, WINDOW_SAMPLES - len(samples))))[:, :extractor.nb_max_frames]
+            for samples, _ in clips
+        ]).astype(np.float32)
+        encoder_output = self.model.encode(features)
+
+        languages = [language for _, language in clips]
+        if None in languages:
+            detected = self.model.model.detect_language(encoder_output)
+            languages = [language or detected[i][0][0][2:-2] for i, language in enumerate(languages)]
+
+        prompts = []
+        tokenizer = None
+        for language in languages:
+            tokenizer = self._tokenizer_cls(
+                self.model.hf_tokenizer,
+                self.model.model.is_multilingual,
+                task="transcribe",
+                language=language
+            )
+            prompts.append(list(tokenizer.sot_sequence) + [tokenizer.no_timestamps])
+
+        results = self.model.model.generate(
+            encoder_output,
+            prompts,
+            beam_size=self.beam_size,
+            max_length=MAX_DECODE_TOKENS,
+            suppress_blank=True,
+            suppress_tokens=[-1]
+        )
+        return [tokenizer.decode(result.sequences_ids[0]).strip() for result in results]
+
+    def stats(self):
+        """Return how many batches ran and how many clips they held."""
+        with self._stats_lock:
+            return {
+                "batches": self._batches,
+                "clips": self._batched_clips,
+                "avg_batch_size": self._batched_clips / self._batches if self._batches else 0.0
+            }
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_stt_backend(backend=None):
+    """
+    Get the process-wide speech-to-text backend, loading it on first use.
+
+    Args:
+        backend (str): "openai", "google" or "local"; defaults to the STT_BACKEND variable
+
+    Returns:
+        An object with ``transcribe(audio, language=None, fmt=...)``
+    """
+    backend = (backend or os.getenv("STT_BACKEND", DEFAULT_BACKEND)).lower()
+
+    with _backends_lock:
+        if backend in _backends:
+            return _backends[backend]
+
+        if backend == "openai":
+            instance = OpenAIWhisperSTT()
+        elif backend == "google":
+            instance = GoogleSpeechSTT()
+        elif backend == "local":
+            instance = LocalWhisperSTT(
+                model_size=os.getenv("STT_LOCAL_MODEL", "small"),
+                compute_type=os.getenv("STT_COMPUTE_TYPE", "int8"),
+                cpu_threads=int(os.getenv("STT_CPU_THREADS", "0")),
+                num_workers=int(os.getenv("STT_WORKERS", "2")),
+                batch_size=int(os.getenv("STT_BATCH_SIZE", "8")),
+                batch_wait=float(os.getenv("STT_BATCH_WAIT_MS", "25")) / 1000
+            )
+        else:
+            raise ValueError(f"Unknown STT backend: {backend}")
+
+        _backends[backend] = instance
+        return instance
+
+
+def check_recording_url(audio_url):
+    """
+    Refuse a recording URL that is not on an allowed recording host.
+
+    Raises:
+        ValueError: If the URL is not http(s) or its host is not in RECORDING_HOSTS
+    """
+    parts = urlsplit(audio_url)
+    host = (parts.hostname or "").lower()
+    if parts.scheme not in ("http", "https") or not any(
+        host == allowed or host.endswith("." + allowed) for allowed in RECORDING_HOSTS
+    ):
+        raise ValueError(f"Recording host not allowed: {host or audio_url}")
+
+
+def transcribe_recording(audio_url, language=None, fmt="mp3", upstream="default", backend=None, channel="api",
+                         bot=""):
+    """
+    Download a recording and transcribe it, without writing it to disk.
+
+    Args:
+        audio_url (str): URL of the recording
+        language (str): Language name or code; detected when omitted
+        fmt (str): Container format of the recording
+        upstream (str): ``http_pool`` upstream to download through
+        backend (str): STT backend; defaults to the STT_BACKEND variable
+        channel (str): Channel label for metrics
+        bot (str): Bot label for metrics, if the caller has chosen one
+
+    Returns:
+        str: The transcribed text
+    """
+    import metrics
+    from http_pool import get_http_pool
+    from audio_io import thread_audio_buffer, CHUNK_SIZE
+
+    with metrics.timed("audio_download", bot=bot, language=language, channel=channel):
+        # Not following redirects keeps the fetch on the host that was checked
+        with get_http_pool().request(upstream, "GET", audio_url, stream=True, allow_redirects=False) as response:
+            if response.is_redirect:
+                raise ValueError(f"Recording URL redirected to {response.headers.get('location')}")
+            audio = thread_audio_buffer().read_chunks(response.iter_content(CHUNK_SIZE))
+    with metrics.timed("stt", bot=bot, language=language, channel=channel):
+        return get_stt_backend(backend).transcribe(audio, language, fmt=fmt)
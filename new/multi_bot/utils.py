@@ -1,10 +1,24 @@
 import os
+import re
+import time
 import logging
+import threading
+from collections import Counter
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+import numpy as np
 from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
-from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.chains import RetrievalQA
-from prompts.domain_prompts import BOT_PROMPTS
+from langchain.chains.question_answering import load_qa_chain
+from prompts.domain_prompts import BOT_PROMPTS, BOT_PROMPT_STYLES
+from prompts.generation_profiles import GENERATION_PROFILES
+from ingest.versioning import resolve_index_path
+from singleflight import SingleFlight
+from llm_backends import backend_name, get_llm
+from llm_scheduler import LLMOverloaded, LLMScheduler, PRIORITIES
+import metrics
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -13,21 +27,28 @@ logger = logging.getLogger(__name__)
 class LegalBotManager:
     """Manager for legal domain-specific bots."""
     
-    def __init__(self, google_api_key=None):
-        """Initialize the legal bot manager."""
+    def __init__(self, google_api_key=None, llm_backend=None):
+        """
+        Initialize the legal bot manager.
+        
+        Args:
+            google_api_key (str): Google API key, required by the Gemini backend
+            llm_backend (str): "gemini" or "fake"; defaults to the LLM_BACKEND variable
+        """
         # Set Google API key if provided
         if google_api_key:
             os.environ["GOOGLE_API_KEY"] = google_api_key
         
-        # Check if API key is set
-        if "GOOGLE_API_KEY" not in os.environ:
-            raise ValueError("GOOGLE_API_KEY environment variable not set")
+        self.llm_backend = backend_name(llm_backend)
         
         # Initialize embeddings
         self.embedding = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
         
-        # Initialize LLM
-        self.llm = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.2)
+        # Initialize LLM (raises if the backend is missing its credentials)
+        self.llm = get_llm(self.llm_backend, temperature=0.2)
+        # LLMs and answer chains for each generation profile, built on first use
+        self._profile_llms = {"default": self.llm}
+        self._answer_chains = {}
         
         # Vector store paths
         self.base_path = os.path.dirname(os.path.abspath(__file__))
@@ -41,32 +62,82 @@ class LegalBotManager:
             "Constitution Bot": "constitution"
         }
         
+        # Loaded QA chains, keyed by bot name: (vector store path, chain)
+        self._bots = {}
+        self._bots_lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+        
+        # Identical questions asked concurrently share one retrieval and LLM call
+        self._singleflight = SingleFlight()
+        self._query_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("QUERY_WORKERS", "8")),
+            thread_name_prefix="query"
+        )
+        
+        # LLM calls made under a deadline run here so they can be hedged or abandoned
+        self._llm_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("LLM_WORKERS", "16")),
+            thread_name_prefix="llm"
+        )
+        # Fraction of the remaining budget to wait before sending a hedged request
+        self.hedge_after = float(os.getenv("LLM_HEDGE_AFTER", "0.5"))
+        self._answer_paths = Counter()
+        self._answer_paths_lock = threading.Lock()
+        
+        # Every LLM call is admitted by priority, per-bot bulkhead and rate limit
+        self.scheduler = LLMScheduler.from_env()
+        
         # Available bots
         self.available_bots = []
         self._check_available_bots()
         
     def _check_available_bots(self):
         """Check which bots have vector stores available."""
-        self.available_bots = []
-        
-        for bot_name, domain in self.domain_mapping.items():
-            vector_store_path = os.path.join(self.vector_stores_dir, f"{domain}_index")
-            if os.path.exists(vector_store_path) and os.path.isdir(vector_store_path):
-                self.available_bots.append(bot_name)
+        available_bots = [
+            bot_name for bot_name, domain in self.domain_mapping.items()
+            if resolve_index_path(self.vector_stores_dir, domain)
+        ]
         
-        logger.info(f"Available bots: {', '.join(self.available_bots)}")
+        if available_bots != self.available_bots:
+            logger.info(f"Available bots: {', '.join(available_bots)}")
+        self.available_bots = available_bots
     
     def get_bot(self, bot_name):
-        """Get a specific bot by name."""
+        """
+        Get a specific bot by name.
+        
+        Chains are cached per bot and rebuilt whenever ingestion publishes a
+        new vector store version. Queries already running keep the chain they
+        started with, so a swap never interrupts them.
+        """
         if bot_name not in self.domain_mapping:
             raise ValueError(f"Unknown bot: {bot_name}")
         
         domain = self.domain_mapping[bot_name]
-        vector_store_path = os.path.join(self.vector_stores_dir, f"{domain}_index")
+        vector_store_path = resolve_index_path(self.vector_stores_dir, domain)
+        
+        if not vector_store_path:
+            raise ValueError(f"Vector store for {bot_name} not found in {self.vector_stores_dir}")
+        
+        with self._bots_lock:
+            cached = self._bots.get(bot_name)
+        if cached and cached[0] == vector_store_path:
+            return cached[1]
+        
+        qa_chain = self._build_chain(bot_name, vector_store_path)
+        
+        with self._bots_lock:
+            self._bots[bot_name] = (vector_store_path, qa_chain)
         
-        if not os.path.exists(vector_store_path):
-            raise ValueError(f"Vector store for {bot_name} not found at {vector_store_path}")
+        if cached:
+            logger.info(f"Hot-reloaded {bot_name} from {vector_store_path}")
+            _release_vector_store(cached[0])
         
+        return qa_chain
+    
+    def _build_chain(self, bot_name, vector_store_path):
+        """Open a vector store and wrap it in a QA chain for a bot."""
         # Load vector store
         vector_store = Chroma(
             persist_directory=vector_store_path,
@@ -87,21 +158,363 @@ class LegalBotManager:
         
         return qa_chain
     
+    def _get_answer_chain(self, bot_name, profile):
+        """Get the chain that writes an answer for a bot in a generation profile."""
+        key = (bot_name, profile)
+        with self._bots_lock:
+            chain = self._answer_chains.get(key)
+            if chain is not None:
+                return chain
+            
+            settings = GENERATION_PROFILES[profile]
+            llm = self._profile_llms.get(profile)
+            if llm is None:
+                llm = get_llm(
+                    self.llm_backend,
+                    temperature=settings.temperature,
+                    max_output_tokens=settings.max_output_tokens
+                )
+                self._profile_llms[profile] = llm
+            
+            # Independent of the vector store, so these survive hot reloads
+            chain = load_qa_chain(llm, chain_type="stuff", prompt=BOT_PROMPT_STYLES[bot_name][settings.style])
+            self._answer_chains[key] = chain
+            return chain
+    
     def get_available_bots(self):
         """Get list of available bots."""
+        # Cheap enough to do every time, and picks up newly published domains
+        self._check_available_bots()
         return self.available_bots
+
+    def preload(self):
+        """
+        Load every available bot's vector index files into the OS page cache.
+
+        Run by a pre-fork server's master. No vector store is opened here:
+        Chroma holds SQLite connections, which must not be carried across
+        ``fork``, so each worker opens its own on first use and reads the
+        index files from memory rather than disk.
+        """
+        for bot_name in self.get_available_bots():
+            start = time.time()
+            vector_store_path = resolve_index_path(self.vector_stores_dir, self.domain_mapping[bot_name])
+            try:
+                size = _read_files(vector_store_path)
+            except OSError as e:
+                logger.warning(f"Could not warm the {bot_name} index: {e}")
+                continue
+            logger.info(f"Preloaded {bot_name} ({size / 1e6:.1f} MB) in {time.time() - start:.1f}s")
+
+    def _after_fork(self):
+        """A forked worker opens its own vector stores; the inherited clients belong to the parent."""
+        self._bots_lock = threading.Lock()
+        bots, self._bots = self._bots, {}
+        for vector_store_path, _ in bots.values():
+            _release_vector_store(vector_store_path)
+
+    def query_bot(self, bot_name, query, deadline=None, mode="generative", priority="chat", profile="default",
+                  channel="api", language=""):
+        """
+        Query a specific bot.
+        
+        Concurrent calls with the same bot and normalized query are coalesced
+        and receive the same result object, which callers must not mutate.
+        A caller with a deadline that joins another's call waits for it only
+        until its own deadline, then answers extractively.
+        
+        Args:
+            bot_name (str): Bot to query
+            query (str): The user's question
+            deadline (float): Optional ``time.monotonic()`` value by which an
+                answer is needed. A hedged second LLM request is sent part-way
+                through the budget, and if neither request has answered by the
+                deadline an extractive answer is built from the retrieved text.
+            mode (str): "generative" to have the LLM write the answer, or
+                "extractive" to answer with the best-matching retrieved
+                sentences and make no LLM call at all
+            priority (str): Scheduling class for the LLM call: "voice", "chat"
+                or "batch". Lower classes wait, and are shed first, when the
+                LLM is at capacity.
+            profile (str): Generation profile from ``GENERATION_PROFILES``
+                ("default", "voice", "whatsapp" or "sms"), setting the answer
+                style, output token cap and temperature for the channel
+            channel (str): Where the question came from ("phone", "web",
+                "whatsapp", "ivr" or "api"); only used to label metrics
+            language (str): Language the caller chose, e.g. "hindi"; only
+                used to label metrics
+        
+        Returns:
+            dict: ``query``, ``result``, ``source_documents``, ``citations`` and
+            ``answered_by`` ("llm", "llm_hedge" or "extractive")
+        """
+        if bot_name not in self.available_bots:
+            raise ValueError(f"Bot {bot_name} is not available")
+        if mode not in QUERY_MODES:
+            raise ValueError(f"Unknown query mode: {mode}")
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        if profile not in GENERATION_PROFILES:
+            raise ValueError(f"Unknown generation profile: {profile}")
+        
+        # Priority is part of the key so a voice caller never waits on a batch flight
+        key = (bot_name, normalize_query(query), mode, deadline is not None, priority, profile)
+        try:
+            return self._singleflight.do(
+                key, self._run_query, bot_name, query, deadline, mode, priority, profile, channel, language,
+                timeout=_remaining(deadline)
+            )
+        except FuturesTimeoutError:
+            logger.warning("Joined query is still running at this caller's deadline, answering extractively")
+            return self._run_query(bot_name, query, None, "extractive", priority, profile, channel, language)
     
-    def query_bot(self, bot_name, query):
-        """Query a specific bot."""
+    async def aquery_bot(self, bot_name, query, deadline=None, mode="generative", priority="chat",
+                         profile="default", channel="api", language=""):
+        """Async version of ``query_bot`` that keeps the event loop free."""
         if bot_name not in self.available_bots:
             raise ValueError(f"Bot {bot_name} is not available")
+        if mode not in QUERY_MODES:
+            raise ValueError(f"Unknown query mode: {mode}")
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority: {priority}")
+        if profile not in GENERATION_PROFILES:
+            raise ValueError(f"Unknown generation profile: {profile}")
         
+        key = (bot_name, normalize_query(query), mode, deadline is not None, priority, profile)
+        try:
+            return await self._singleflight.ado(
+                key, self._run_query, bot_name, query, deadline, mode, priority, profile, channel, language,
+                executor=self._query_executor, timeout=_remaining(deadline)
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Joined query is still running at this caller's deadline, answering extractively")
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._query_executor, self._run_query,
+                bot_name, query, None, "extractive", priority, profile, channel, language
+            )
+    
+    def get_query_stats(self):
+        """Get counters for query coalescing, answer paths and LLM scheduling."""
+        stats = self._singleflight.stats()
+        with self._answer_paths_lock:
+            stats["answered_by"] = dict(self._answer_paths)
+        stats["llm_scheduler"] = self.scheduler.stats()
+        return stats
+    
+    def _run_query(self, bot_name, query, deadline=None, mode="generative", priority="chat", profile="default",
+                   channel="api", language=""):
+        """Run retrieval and generation for a single query."""
         logger.info(f"Querying {bot_name} with: '{query}'")
         qa_chain = self.get_bot(bot_name)
+        citations = []
         
         try:
-            result = qa_chain.invoke({"query": query})
-            return result
+            # Same as retriever.get_relevant_documents, with the two steps timed separately
+            retriever = qa_chain.retriever
+            with metrics.timed("embedding", bot=bot_name, language=language, channel=channel):
+                query_vector = self.embedding.embed_query(query)
+            with metrics.timed("vector_search", bot=bot_name, language=language, channel=channel):
+                docs = retriever.vectorstore.similarity_search_by_vector(query_vector, **retriever.search_kwargs)
+            
+            if mode == "extractive":
+                answer, citations = self.extract_answer(query, docs)
+                answered_by = "extractive"
+            else:
+                answer_chain = self._get_answer_chain(bot_name, profile)
+                if deadline is None:
+                    answer = self._generate(
+                        bot_name, priority, answer_chain, docs, query, channel=channel, language=language
+                    )
+                    answered_by = "llm"
+                else:
+                    answer, citations, answered_by = self._generate_before(
+                        deadline, bot_name, priority, answer_chain, docs, query, channel, language
+                    )
         except Exception as e:
             logger.error(f"Error querying bot: {e}")
             raise
+        
+        with self._answer_paths_lock:
+            self._answer_paths[answered_by] += 1
+        
+        return {
+            "query": query,
+            "result": answer,
+            "source_documents": docs,
+            "citations": citations,
+            "answered_by": answered_by
+        }
+    
+    def extract_answer(self, query, docs, max_sentences=3):
+        """
+        Answer with the retrieved sentences closest to the query.
+        
+        The query and every candidate sentence are embedded in a single batch
+        and scored with one matrix product, so this costs one embedding call
+        and no LLM call.
+        
+        Returns:
+            tuple: (answer text, citations as dicts with sentence, source and page)
+        """
+        sentences = []
+        origins = []
+        for doc in docs:
+            for sentence in split_sentences(doc.page_content):
+                # Very short fragments are usually headings or section numbers
+                if len(sentence) >= 20:
+                    sentences.append(sentence)
+                    origins.append(doc)
+        
+        if not sentences:
+            return extractive_fallback(docs), []
+        
+        vectors = np.asarray(self.embedding.embed_documents([query] + sentences), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-9
+        scores = vectors[1:] @ vectors[0]
+        
+        # Best sentences, presented in the order they appear in the documents
+        chosen = sorted(np.argsort(-scores)[:max_sentences])
+        citations = [
+            {
+                "sentence": sentences[i],
+                "source": origins[i].metadata.get("source", ""),
+                "page": origins[i].metadata.get("page")
+            }
+            for i in chosen
+        ]
+        return " ".join(sentences[i] for i in chosen), citations
+    
+    def _generate(self, bot_name, priority, answer_chain, docs, query, deadline=None, channel="api", language=""):
+        """
+        Ask the LLM to answer from already retrieved documents.
+        
+        Waits for a scheduler slot first; with a deadline, admission is not
+        awaited past it.
+        
+        Raises:
+            LLMOverloaded: If the scheduler sheds the request
+        """
+        timeout = _remaining(deadline)
+        with self.scheduler.slot(bot_name, priority, timeout=timeout):
+            with metrics.timed("llm", bot=bot_name, language=language, channel=channel):
+                return answer_chain.run(input_documents=docs, question=query)
+    
+    def _generate_before(self, deadline, bot_name, priority, answer_chain, docs, query, channel="api", language=""):
+        """
+        Generate an answer by ``deadline``, hedging and then falling back.
+        
+        Requests that lose the race are left to finish in the background;
+        their results are discarded. No hedge is sent once the scheduler has
+        shed a request, since a second one would only add to the overload.
+        
+        Returns:
+            tuple: (answer, citations, answered_by)
+        """
+        hedge_at = time.monotonic() + max(deadline - time.monotonic(), 0) * self.hedge_after
+        args = (bot_name, priority, answer_chain, docs, query, deadline, channel, language)
+        pending = {self._llm_executor.submit(self._generate, *args): "llm"}
+        hedged = False
+        overloaded = False
+        
+        while pending:
+            now = time.monotonic()
+            wait_until = deadline if hedged else min(hedge_at, deadline)
+            done, _ = wait(pending, timeout=max(wait_until - now, 0), return_when=FIRST_COMPLETED)
+            
+            for future in done:
+                path = pending.pop(future)
+                if future.exception() is None:
+                    return future.result(), [], path
+                logger.warning(f"LLM request ({path}) failed: {future.exception()}")
+                overloaded = overloaded or isinstance(future.exception(), LLMOverloaded)
+            
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            # Hedge once the primary is slow, or straight away if it failed
+            if not hedged and not overloaded and (now >= hedge_at or not pending):
+                logger.info("LLM is slow, sending a hedged request")
+                pending[self._llm_executor.submit(self._generate, *args)] = "llm_hedge"
+                hedged = True
+        
+        logger.warning("No LLM answer before the deadline, answering extractively")
+        try:
+            answer, citations = self.extract_answer(query, docs)
+        except Exception as e:
+            logger.error(f"Extractive answer failed, using the top chunk: {e}")
+            answer, citations = extractive_fallback(docs), []
+        return answer, citations, "extractive"
+
+
+# Ways query_bot can produce an answer
+QUERY_MODES = ("generative", "extractive")
+
+
+def _remaining(deadline):
+    """Seconds left until a ``time.monotonic()`` deadline, or None without one."""
+    return None if deadline is None else max(deadline - time.monotonic(), 0)
+
+
+def split_sentences(text):
+    """Split text into sentences on ., !, ? and the Devanagari danda."""
+    return [s.strip() for s in re.split(r"(?<=[.!?\u0964])\s+", text) if s.strip()]
+
+
+def extractive_fallback(docs, max_chars=400):
+    """Answer with the opening sentences of the top retrieved chunk."""
+    if not docs:
+        # Also reached by explicit extractive queries, so nothing here may mention a deadline
+        return "Sorry, I could not find anything about your question in the documents."
+    
+    sentences = []
+    length = 0
+    for sentence in split_sentences(docs[0].page_content):
+        if sentences and length + len(sentence) > max_chars:
+            break
+        sentences.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(sentences)
+
+
+def _read_files(directory, chunk_size=1024 * 1024):
+    """Read every file under a directory once, so the OS caches it; returns the bytes read."""
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            with open(os.path.join(root, name), "rb") as f:
+                for chunk in iter(lambda: f.read(chunk_size), b""):
+                    total += len(chunk)
+    return total
+
+
+def normalize_query(query):
+    """Normalize a query for coalescing: case, whitespace and trailing punctuation."""
+    return " ".join(query.casefold().split()).rstrip("?.!")
+
+
+def _release_vector_store(vector_store_path):
+    """
+    Drop Chroma's process-wide cached client for a superseded version.
+
+    Chroma keeps one client per persist directory for the life of the process,
+    so without this every hot reload would leak the previous index. The client
+    is only forgotten, not stopped: queries still holding the old chain keep
+    working and the memory is reclaimed once they finish.
+    
+    The cache is private to Chroma, which is why chromadb is pinned in
+    requirements.txt; check this still works whenever the pin is moved.
+    """
+    try:
+        from chromadb.api.client import SharedSystemClient
+    except ImportError:
+        return
+    
+    systems = getattr(SharedSystemClient, "_identifer_to_system", None)
+    if not isinstance(systems, dict):
+        logger.warning(
+            f"Cannot release the Chroma client for {vector_store_path}: this chromadb version has no "
+            "SharedSystemClient._identifer_to_system, so superseded indexes stay in memory"
+        )
+        return
+    systems.pop(vector_store_path, None)
@@ -4,14 +4,19 @@ from twilio.rest import Client
 import os
 import logging
 from utils import LegalBotManager
+from llm_backends import requires_google_api_key
+from stt_backends import get_stt_backend
+from http_pool import get_http_pool, backoff_delay
+from audio_io import AudioTooLarge, CHUNK_SIZE as AUDIO_CHUNK_SIZE, read_request_audio, thread_audio_buffer
+import metrics
+import serving
+from session_store import get_session_store
 from dotenv import load_dotenv
 import openai
-import requests
-import tempfile
 import time
 import datetime
-import base64
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from langchain_community.embeddings import HuggingFaceEmbeddings
 
 # Load environment variables
@@ -31,6 +36,13 @@ os.makedirs(os.path.join(os.path.dirname(__file__), 'static'), exist_ok=True)
 # Initialize OpenAI (for Whisper)
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
+# Keep-alive connections to Twilio and other upstreams, shared by all requests
+http_pool = get_http_pool()
+
+# Speech-to-text backend, loaded once for the whole process
+STT_BACKEND = os.getenv("STT_BACKEND", "openai")
+stt_backend = get_stt_backend(STT_BACKEND)
+
 # Initialize bot manager
 bot_manager = LegalBotManager(google_api_key=os.getenv("GOOGLE_API_KEY"))
 
@@ -62,19 +74,56 @@ LEGAL_BOTS = {
     "4": "Constitution Bot"
 }
 
-# Global session storage (in production, use a database)
-call_sessions = {}
-
-# Call analytics storage
-call_analytics = {
-    "total_calls": 0,
-    "completed_queries": 0,
-    "languages": {},
-    "bots": {},
-    "avg_response_time": 0,
-    "total_response_time": 0
+# Seconds from receiving a recording until an answer must be ready. Past
+# this the bot falls back to an extractive answer instead of leaving dead air.
+VOICE_ANSWER_BUDGET = float(os.getenv("VOICE_ANSWER_BUDGET", "10"))
+
+# "extractive" reads back the best-matching passage sentences without an LLM call
+VOICE_ANSWER_MODE = os.getenv("VOICE_ANSWER_MODE", "generative")
+
+# Workers that answer recorded questions while the caller is on hold
+VOICE_WORKERS = int(os.getenv("VOICE_WORKERS", "8"))
+
+# Seconds of silence between polls of /answer_ready while the caller waits
+VOICE_POLL_INTERVAL = int(os.getenv("VOICE_POLL_INTERVAL", "2"))
+
+# Optional short hold clip played on each poll instead of silence
+VOICE_HOLD_MUSIC_URL = os.getenv("VOICE_HOLD_MUSIC_URL", "")
+
+# Give up on a question after this many seconds on hold
+VOICE_JOB_TIMEOUT = float(os.getenv("VOICE_JOB_TIMEOUT", "60"))
+
+# Drop uncollected answers (caller hung up) after this many seconds
+VOICE_JOB_TTL = 600
+
+# Forget a call or browser session this many seconds after its last change
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
+
+# Progress messages spoken while on hold, per job stage and language
+STAGE_MESSAGES = {
+    "transcribing": {
+        "english": "Transcribing your question...",
+        "hindi": "आपके प्रश्न को लिखित रूप में बदल रहा हूं..."
+    },
+    "searching": {
+        "english": "Searching for relevant legal information...",
+        "hindi": "प्रासंगिक कानूनी जानकारी खोज रहा हूं..."
+    }
 }
 
+# Per-call state, keyed by CallSid; shared by all workers of a multi-worker server
+call_sessions = get_session_store("call", SESSION_TTL)
+
+# Questions being answered in the background, keyed by job ID
+voice_jobs = get_session_store("voice_job", VOICE_JOB_TTL)
+voice_executor = ThreadPoolExecutor(max_workers=VOICE_WORKERS, thread_name_prefix="voice")
+
+def _record_answer(bot_name, response_time):
+    """Count a completed query in the call analytics."""
+    metrics.increment("completed_queries")
+    metrics.increment("response_seconds", response_time)
+    metrics.increment("bot_queries", bot=bot_name)
+
 @app.route("/voice", methods=["POST"])
 def voice():
     """Handle incoming voice calls."""
@@ -83,16 +132,16 @@ def voice():
     call_sid = request.values.get("CallSid", "Unknown")
     
     # Update call analytics
-    call_analytics["total_calls"] += 1
+    metrics.increment("calls")
     
     # Initialize or retrieve session
     if call_sid not in call_sessions:
-        call_sessions[call_sid] = {
+        call_sessions.set(call_sid, {
             "caller_id": caller_id,
             "language": None,
             "selected_bot": None,
             "start_time": datetime.datetime.now().isoformat()
-        }
+        })
     
     # Create TwiML response
     response = VoiceResponse()
@@ -129,11 +178,15 @@ def select_language():
     
     if digit in LANGUAGES:
         # Store the language preference
-        call_sessions[call_sid]["language"] = LANGUAGES[digit]
+        session = call_sessions.update(call_sid, language=LANGUAGES[digit])
+        if session is None:
+            response = VoiceResponse()
+            response.redirect("/voice")
+            return Response(str(response), mimetype="text/xml")
         
         # Update analytics
         language_name = LANGUAGES[digit]["name"]
-        call_analytics["languages"][language_name] = call_analytics["languages"].get(language_name, 0) + 1
+        metrics.increment("language_selections", language=language_name)
         
         # Create TwiML response
         response = VoiceResponse()
@@ -146,7 +199,7 @@ def select_language():
             timeout=10
         )
         
-        language_code = call_sessions[call_sid]["language"]["tts"]
+        language_code = session["language"]["tts"]
         
         if language_code == "en-US":
             gather.say(
@@ -200,12 +253,16 @@ def select_bot():
     
     if digit in LEGAL_BOTS:
         # Store the bot selection
-        call_sessions[call_sid]["selected_bot"] = LEGAL_BOTS[digit]
+        session = call_sessions.update(call_sid, selected_bot=LEGAL_BOTS[digit])
+        if session is None or not session["language"]:
+            response = VoiceResponse()
+            response.redirect("/voice")
+            return Response(str(response), mimetype="text/xml")
         
         # Create TwiML response
         response = VoiceResponse()
         
-        language_code = call_sessions[call_sid]["language"]["tts"]
+        language_code = session["language"]["tts"]
         bot_name = LEGAL_BOTS[digit]
         
         if language_code == "en-US":
@@ -251,22 +308,28 @@ def select_bot():
 
 @app.route("/process_question", methods=["POST"])
 def process_question():
-    """Process the user's question."""
+    """
+    Accept the user's recorded question and start answering it.
+    
+    Transcription, retrieval and generation run on the voice worker pool.
+    The caller immediately hears a hold message, and Twilio is redirected to
+    ``/answer_ready``, which keeps the call on hold until the answer is ready.
+    """
     recording_url = request.values.get("RecordingUrl")
     call_sid = request.values.get("CallSid", "Unknown")
     
-    if not recording_url or call_sid not in call_sessions:
+    session = call_sessions.get(call_sid)
+    if not recording_url or session is None:
         response = VoiceResponse()
         response.say("Sorry, there was an error processing your question.")
         return Response(str(response), mimetype="text/xml")
     
-    # Get session data
-    session = call_sessions[call_sid]
-    language_code = session["language"]["code"]
     language_name = session["language"]["name"]
-    bot_name = session["selected_bot"]
     tts_code = session["language"]["tts"]
     
+    # Start the work before replying so it overlaps with the hold message
+    job_id = start_voice_job(call_sid, recording_url)
+    
     # Create TwiML response with initial status
     response = VoiceResponse()
     if language_name.lower() == "english":
@@ -275,169 +338,256 @@ def process_question():
         response.say("कृपया प्रतीक्षा करें जबकि मैं आपके प्रश्न पर काम कर रहा हूं।", language=tts_code)
     else:
         response.say("Please wait while I process your question.", language="en-US")
-        
-    # Play a brief hold music or comfort tone
-    response.play("https://demo.twilio.com/docs/classic.mp3", loop=1)
     
+    response.redirect(f"/answer_ready?job_id={job_id}", method="POST")
+    return Response(str(response), mimetype="text/xml")
+
+@app.route("/answer_ready", methods=["POST"])
+def answer_ready():
+    """
+    Poll for the answer to a question started by ``/process_question``.
+    
+    Returns the answer TwiML once the job is done. Until then the caller is
+    kept on hold (progress messages, hold music or a pause) and Twilio is
+    redirected back here.
+    """
+    job_id = request.values.get("job_id", "")
+    
+    job = voice_jobs.get(job_id)
+    if job and job["twiml"] is not None:
+        voice_jobs.delete(job_id)
+    
+    if job is None:
+        response = VoiceResponse()
+        response.say("Sorry, there was an error processing your question.")
+        response.redirect("/another_question?Digits=1", method="POST")
+        return Response(str(response), mimetype="text/xml")
+    
+    if job["twiml"] is not None:
+        return Response(job["twiml"], mimetype="text/xml")
+    
+    response = VoiceResponse()
+    
+    if time.time() - job["created"] > VOICE_JOB_TIMEOUT:
+        logger.error(f"Voice job {job_id} for call {job['call_sid']} timed out")
+        voice_jobs.delete(job_id)
+        response.say("Sorry, this is taking too long. Please try asking again.")
+        response.redirect("/another_question?Digits=1", method="POST")
+        return Response(str(response), mimetype="text/xml")
+    
+    # Tell the caller what is happening when the job reaches a new stage
+    session = call_sessions.get(job["call_sid"])
+    stage = job["stage"]
+    if session and stage != job["announced"]:
+        voice_jobs.update(job_id, announced=stage)
+        message = STAGE_MESSAGES.get(stage, {}).get(session["language"]["name"].lower())
+        if message:
+            response.say(message, language=session["language"]["tts"])
+    
+    if VOICE_HOLD_MUSIC_URL:
+        response.play(VOICE_HOLD_MUSIC_URL)
+    else:
+        response.pause(length=VOICE_POLL_INTERVAL)
+    response.redirect(f"/answer_ready?job_id={job_id}", method="POST")
+    return Response(str(response), mimetype="text/xml")
+
+def start_voice_job(call_sid, recording_url):
+    """
+    Queue a recorded question for answering on the voice worker pool.
+    
+    Returns:
+        str: Job ID to poll with ``/answer_ready``
+    """
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    
+    # Jobs whose caller hung up before collecting the answer expire after VOICE_JOB_TTL
+    voice_jobs.set(job_id, {
+        "call_sid": call_sid,
+        "created": now,
+        "stage": "queued",
+        "announced": "queued",
+        "twiml": None
+    })
+    
+    voice_executor.submit(run_voice_job, job_id, call_sid, recording_url, now)
+    return job_id
+
+def run_voice_job(job_id, call_sid, recording_url, start_time):
+    """Answer a recorded question and store the resulting TwiML on its job."""
     try:
-        start_time = time.time()
-        
-        # Download and transcribe the audio (with status update)
-        logger.info(f"Processing recording from {session['caller_id']}")
-        if language_name.lower() == "english":
-            response.say("Transcribing your question...", language=tts_code)
-        elif language_name.lower() == "hindi":
-            response.say("आपके प्रश्न को लिखित रूप में बदल रहा हूं...", language=tts_code)
+        twiml = answer_question(job_id, call_sid, recording_url, start_time)
+    except Exception as e:
+        logger.error(f"Error processing question: {e}")
+        response = VoiceResponse()
+        response.say("Sorry, there was an error processing your question.")
+        twiml = str(response)
+    
+    voice_jobs.update(job_id, twiml=twiml)
+
+def set_job_stage(job_id, stage):
+    """Record how far a voice job has got, for progress messages."""
+    voice_jobs.update(job_id, stage=stage)
+
+def answer_question(job_id, call_sid, recording_url, start_time):
+    """
+    Transcribe a recorded question, query the bot and build the answer TwiML.
+    
+    Returns:
+        str: TwiML to play to the caller
+    """
+    # Get session data
+    session = call_sessions[call_sid]
+    language_name = session["language"]["name"]
+    bot_name = session["selected_bot"]
+    tts_code = session["language"]["tts"]
+    
+    # The answer budget starts when the recording arrived, not when a worker picked it up
+    deadline = time.monotonic() + VOICE_ANSWER_BUDGET - (time.time() - start_time)
+    
+    # Download and transcribe the audio (with status update)
+    logger.info(f"Processing recording from {session['caller_id']}")
+    set_job_stage(job_id, "transcribing")
+    
+    transcription = transcribe_audio(recording_url, language_name.lower(), bot_name)
+    logger.info(f"Transcription: {transcription}")
+    
+    # Store transcription in session
+    call_sessions.update(call_sid, last_question=transcription)
+    
+    # Update user on progress
+    set_job_stage(job_id, "searching")
+    
+    # Get answer from RAG system
+    if bot_name in bot_manager.get_available_bots():
+        # Add language instruction if not in English
+        if language_name.lower() != "english":
+            query = f"Answer the following query in {language_name}: {transcription}"
+        else:
+            query = transcription
             
-        transcription = transcribe_audio(recording_url, language_name.lower())
-        logger.info(f"Transcription: {transcription}")
+        # Query the bot
+        result = bot_manager.query_bot(
+            bot_name, query, deadline=deadline, mode=VOICE_ANSWER_MODE, priority="voice", profile="voice",
+            channel="phone", language=language_name.lower()
+        )
+        answer = result["result"]
+        answered_by = result.get("answered_by", "llm")
+        logger.info(f"Answer for call {call_sid} came from: {answered_by}")
+        metrics.increment("answers", answered_by=answered_by)
+        
+        # Format sources for citation
+        sources = []
+        if result.get("source_documents"):
+            for i, doc in enumerate(result["source_documents"][:2]):  # Limit to 2 sources for voice
+                source = doc.metadata.get("source", "").split("/")[-1]
+                page = doc.metadata.get("page", "")
+                if source and page:
+                    sources.append(f"Source {i+1}: {source}, page {page}")
+        
+        # Create source citation text
+        if sources:
+            source_text = ". ".join(sources)
+            if language_name.lower() == "english":
+                answer += f". Based on: {source_text}"
+            elif language_name.lower() == "hindi":
+                answer += f". आधारित: {source_text}"
+            # Add other languages if needed
+            
+        # Store answer in session
+        call_sessions.update(call_sid, last_answer=answer)
         
-        # Store transcription in session
-        session["last_question"] = transcription
+        # Calculate response time
+        response_time = time.time() - start_time
+        
+        # Update analytics
+        _record_answer(bot_name, response_time)
         
-        # Update user on progress
+        # Respond with the answer
+        response = VoiceResponse()
+        
+        # Inform user their question is answered
         if language_name.lower() == "english":
-            response.say("Searching for relevant legal information...", language=tts_code)
+            response.say(
+                f"Here's the answer to your question: '{transcription}'", 
+                language=tts_code
+            )
         elif language_name.lower() == "hindi":
-            response.say("प्रासंगिक कानूनी जानकारी खोज रहा हूं...", language=tts_code)
-            
-        # Get answer from RAG system
-        if bot_name in bot_manager.get_available_bots():
-            # Add language instruction if not in English
-            if language_name.lower() != "english":
-                query = f"Answer the following query in {language_name}: {transcription}"
-            else:
-                query = transcription
-                
-            # Query the bot
-            result = bot_manager.query_bot(bot_name, query)
-            answer = result["result"]
-            
-            # Format sources for citation
-            sources = []
-            if result.get("source_documents"):
-                for i, doc in enumerate(result["source_documents"][:2]):  # Limit to 2 sources for voice
-                    source = doc.metadata.get("source", "").split("/")[-1]
-                    page = doc.metadata.get("page", "")
-                    if source and page:
-                        sources.append(f"Source {i+1}: {source}, page {page}")
-            
-            # Create source citation text
-            if sources:
-                source_text = ". ".join(sources)
-                if language_name.lower() == "english":
-                    answer += f". Based on: {source_text}"
-                elif language_name.lower() == "hindi":
-                    answer += f". आधारित: {source_text}"
-                # Add other languages if needed
-                
-            # Store answer in session
-            session["last_answer"] = answer
-            
-            # Calculate response time
-            response_time = time.time() - start_time
-            
-            # Update analytics
-            call_analytics["completed_queries"] += 1
-            call_analytics["total_response_time"] += response_time
-            call_analytics["avg_response_time"] = (
-                call_analytics["total_response_time"] / call_analytics["completed_queries"]
+            response.say(
+                f"आपके प्रश्न का उत्तर यहां है: '{transcription}'", 
+                language=tts_code
             )
             
-            # Log bot usage
-            call_analytics["bots"][bot_name] = call_analytics["bots"].get(bot_name, 0) + 1
-            
-            # Respond with the answer
-            response = VoiceResponse()
+        # Provide the answer
+        response.say(answer, language=tts_code, voice="woman")
+        
+        # Offer to send answer via SMS
+        if twilio_client and session["caller_id"] != "Unknown":
+            gather = Gather(
+                num_digits=1,
+                action="/send_sms",
+                method="POST",
+                timeout=5
+            )
             
-            # Inform user their question is answered
             if language_name.lower() == "english":
-                response.say(
-                    f"Here's the answer to your question: '{transcription}'", 
+                gather.say(
+                    "To receive this answer as a text message, press 1.",
                     language=tts_code
                 )
             elif language_name.lower() == "hindi":
-                response.say(
-                    f"आपके प्रश्न का उत्तर यहां है: '{transcription}'", 
+                gather.say(
+                    "इस उत्तर को एसएमएस के रूप में प्राप्त करने के लिए 1 दबाएं।",
                     language=tts_code
                 )
-                
-            # Provide the answer
-            response.say(answer, language=tts_code, voice="woman")
-            
-            # Offer to send answer via SMS
-            if twilio_client and session["caller_id"] != "Unknown":
-                gather = Gather(
-                    num_digits=1,
-                    action="/send_sms",
-                    method="POST",
-                    timeout=5
+            else:
+                gather.say(
+                    "To receive this answer as a text message, press 1.",
+                    language="en-US"
                 )
                 
-                if language_name.lower() == "english":
-                    gather.say(
-                        "To receive this answer as a text message, press 1.",
-                        language=tts_code
-                    )
-                elif language_name.lower() == "hindi":
-                    gather.say(
-                        "इस उत्तर को एसएमएस के रूप में प्राप्त करने के लिए 1 दबाएं।",
-                        language=tts_code
-                    )
-                else:
-                    gather.say(
-                        "To receive this answer as a text message, press 1.",
-                        language="en-US"
-                    )
-                    
-                response.append(gather)
-            
-        else:
-            # Bot not available
-            response = VoiceResponse()
-            if language_name.lower() == "english":
-                response.say(f"Sorry, the {bot_name} is not available at this time.", language=tts_code)
-            elif language_name.lower() == "hindi":
-                response.say(f"क्षमा करें, {bot_name} इस समय उपलब्ध नहीं है।", language=tts_code)
-            else:
-                response.say(f"Sorry, the {bot_name} is not available at this time.", language="en-US")
+            response.append(gather)
         
-        # Add option to ask another question
-        gather = Gather(
-            num_digits=1,
-            action="/another_question",
-            method="POST",
-            timeout=10
-        )
-        
-        if tts_code == "en-US":
-            gather.say(
-                "To ask another question, press 1. "
-                "To end this call, press 2.",
-                language=tts_code
-            )
-        elif tts_code == "hi-IN":
-            gather.say(
-                "एक और प्रश्न पूछने के लिए 1 दबाएं। "
-                "इस कॉल को समाप्त करने के लिए 2 दबाएं।",
-                language=tts_code
-            )
+    else:
+        # Bot not available
+        response = VoiceResponse()
+        if language_name.lower() == "english":
+            response.say(f"Sorry, the {bot_name} is not available at this time.", language=tts_code)
+        elif language_name.lower() == "hindi":
+            response.say(f"क्षमा करें, {bot_name} इस समय उपलब्ध नहीं है।", language=tts_code)
         else:
-            gather.say(
-                "To ask another question, press 1. "
-                "To end this call, press 2.",
-                language="en-US"
-            )
-            
-        response.append(gather)
-        
-        return Response(str(response), mimetype="text/xml")
+            response.say(f"Sorry, the {bot_name} is not available at this time.", language="en-US")
+    
+    # Add option to ask another question
+    gather = Gather(
+        num_digits=1,
+        action="/another_question",
+        method="POST",
+        timeout=10
+    )
+    
+    if tts_code == "en-US":
+        gather.say(
+            "To ask another question, press 1. "
+            "To end this call, press 2.",
+            language=tts_code
+        )
+    elif tts_code == "hi-IN":
+        gather.say(
+            "एक और प्रश्न पूछने के लिए 1 दबाएं। "
+            "इस कॉल को समाप्त करने के लिए 2 दबाएं।",
+            language=tts_code
+        )
+    else:
+        gather.say(
+            "To ask another question, press 1. "
+            "To end this call, press 2.",
+            language="en-US"
+        )
         
-    except Exception as e:
-        logger.error(f"Error processing question: {e}")
-        response = VoiceResponse()
-        response.say("Sorry, there was an error processing your question.")
-        return Response(str(response), mimetype="text/xml")
+    response.append(gather)
+    
+    return str(response)
 
 @app.route("/send_sms", methods=["POST"])
 def send_sms():
@@ -447,9 +597,8 @@ def send_sms():
     
     response = VoiceResponse()
     
-    if digit == "1" and call_sid in call_sessions and twilio_client:
-        session = call_sessions[call_sid]
-        
+    session = call_sessions.get(call_sid)
+    if digit == "1" and session and twilio_client:
         if "last_answer" in session and session["caller_id"] != "Unknown":
             try:
                 # Format SMS message
@@ -493,8 +642,8 @@ def send_sms():
         timeout=10
     )
     
-    if call_sid in call_sessions:
-        language_code = call_sessions[call_sid]["language"]["tts"]
+    if session:
+        language_code = session["language"]["tts"]
         
         if language_code == "en-US":
             gather.say(
@@ -542,8 +691,9 @@ def another_question():
             timeout=10
         )
         
-        if call_sid in call_sessions:
-            language_code = call_sessions[call_sid]["language"]["tts"]
+        session = call_sessions.get(call_sid)
+        if session:
+            language_code = session["language"]["tts"]
             
             if language_code == "en-US":
                 gather.say(
@@ -588,8 +738,9 @@ def another_question():
         # End the call
         response = VoiceResponse()
         
-        if call_sid in call_sessions:
-            language_code = call_sessions[call_sid]["language"]["tts"]
+        session = call_sessions.get(call_sid)
+        if session:
+            language_code = session["language"]["tts"]
             
             if language_code == "en-US":
                 response.say("Thank you for using the Legal Assistant. Goodbye.", language=language_code)
@@ -601,18 +752,42 @@ def another_question():
             response.say("Thank you for using the Legal Assistant. Goodbye.")
             
         # Clean up the session
-        if call_sid in call_sessions:
-            del call_sessions[call_sid]
+        call_sessions.delete(call_sid)
             
         return Response(str(response), mimetype="text/xml")
 
 @app.route("/call_stats", methods=["GET"])
 def call_stats():
-    """API endpoint to get call statistics."""
-    return call_analytics
+    """API endpoint to get call statistics, summed over all workers."""
+    counters = metrics.counters()
+
+    def total(name):
+        return sum(counters.get(name, {}).values())
+
+    def by(name, label):
+        return {dict(labels)[label]: int(value) for labels, value in counters.get(name, {}).items()}
+
+    completed = int(total("completed_queries"))
+    response_time = total("response_seconds")
+    return {
+        "total_calls": int(total("calls")),
+        "completed_queries": completed,
+        "languages": by("language_selections", "language"),
+        "bots": by("bot_queries", "bot"),
+        "avg_response_time": response_time / completed if completed else 0,
+        "total_response_time": response_time,
+        "answered_by": by("answers", "answered_by"),
+        "stages": metrics.snapshot(),
+        "http": http_pool.stats()
+    }
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Stage latency histograms in the Prometheus text format."""
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
 
 # Web sessions for browser-based interaction
-web_sessions = {}
+web_sessions = get_session_store("voice_web", SESSION_TTL)
 
 # Add routes for web-based voice interaction
 @app.route("/", methods=["GET"])
@@ -626,11 +801,11 @@ def index():
 def create_web_session():
     """Create a new web session for browser-based interaction."""
     session_id = str(uuid.uuid4())
-    web_sessions[session_id] = {
+    web_sessions.set(session_id, {
         "language": None,
         "selected_bot": None,
         "start_time": datetime.datetime.now().isoformat()
-    }
+    })
     return jsonify({"session_id": session_id})
 
 @app.route("/web_set_language", methods=["POST"])
@@ -646,11 +821,11 @@ def web_set_language():
     if language_code not in LANGUAGES:
         return jsonify({"error": "Invalid language"}), 400
     
-    web_sessions[session_id]["language"] = LANGUAGES[language_code]
+    web_sessions.update(session_id, language=LANGUAGES[language_code])
     
     # Update analytics
     language_name = LANGUAGES[language_code]["name"]
-    call_analytics["languages"][language_name] = call_analytics["languages"].get(language_name, 0) + 1
+    metrics.increment("language_selections", language=language_name)
     
     return jsonify({"success": True, "language": LANGUAGES[language_code]["name"]})
 
@@ -667,53 +842,42 @@ def web_set_bot():
     if bot_code not in LEGAL_BOTS:
         return jsonify({"error": "Invalid bot"}), 400
     
-    web_sessions[session_id]["selected_bot"] = LEGAL_BOTS[bot_code]
+    web_sessions.update(session_id, selected_bot=LEGAL_BOTS[bot_code])
     
     return jsonify({"success": True, "bot": LEGAL_BOTS[bot_code]})
 
 @app.route("/web_process_audio", methods=["POST"])
 def web_process_audio():
-    """Process audio recording from web interface."""
-    data = request.json
-    session_id = data.get("session_id")
-    audio_data = data.get("audio")  # Base64 encoded audio
+    """
+    Process audio recording from web interface.
     
-    if not session_id or session_id not in web_sessions:
+    Takes the raw recording as the request body (``Content-Type: audio/webm``,
+    ``?session_id=...``), or JSON with a base64 ``audio`` field.
+    """
+    try:
+        session_id, audio_data, audio_format = read_request_audio(request)
+    except AudioTooLarge as e:
+        return jsonify({"error": str(e)}), 413
+    
+    session = web_sessions.get(session_id) if session_id else None
+    if session is None:
         return jsonify({"error": "Invalid session"}), 400
     
     if not audio_data:
         return jsonify({"error": "No audio data"}), 400
     
-    session = web_sessions[session_id]
     language_name = session["language"]["name"]
     bot_name = session["selected_bot"]
     
     try:
         start_time = time.time()
         
-        # Decode and save audio to a temporary file
-        audio_bytes = base64.b64decode(audio_data.split(',')[1] if ',' in audio_data else audio_data)
-        
-        with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as temp_file:
-            temp_filename = temp_file.name
-            temp_file.write(audio_bytes)
-        
-        # Transcribe the audio
-        with open(temp_filename, "rb") as audio_file:
-            result = openai.Audio.transcribe(
-                file=audio_file,
-                model="whisper-1",
-                language=language_name.lower()
-            )
-        
-        transcription = result.text if hasattr(result, 'text') else result['text']
-        
-        # Clean up the temporary file
-        if os.path.exists(temp_filename):
-            os.unlink(temp_filename)
+        # Transcribe the audio straight from memory
+        with metrics.timed("stt", bot=bot_name, language=language_name.lower(), channel="web"):
+            transcription = stt_backend.transcribe(audio_data, language_name, fmt=audio_format)
         
         # Store transcription in session
-        session["last_question"] = transcription
+        web_sessions.update(session_id, last_question=transcription)
         
         # Get answer from RAG system
         if bot_name in bot_manager.get_available_bots():
@@ -724,7 +888,9 @@ def web_process_audio():
                 query = transcription
                 
             # Query the bot
-            result = bot_manager.query_bot(bot_name, query)
+            result = bot_manager.query_bot(
+                bot_name, query, priority="voice", profile="voice", channel="web", language=language_name.lower()
+            )
             answer = result["result"]
             
             # Format sources for citation
@@ -737,18 +903,13 @@ def web_process_audio():
                         sources.append({"source": source, "page": page})
             
             # Store answer in session
-            session["last_answer"] = answer
+            web_sessions.update(session_id, last_answer=answer)
             
             # Calculate response time
             response_time = time.time() - start_time
             
             # Update analytics
-            call_analytics["completed_queries"] += 1
-            call_analytics["total_response_time"] += response_time
-            call_analytics["avg_response_time"] = (
-                call_analytics["total_response_time"] / call_analytics["completed_queries"]
-            )
-            call_analytics["bots"][bot_name] = call_analytics["bots"].get(bot_name, 0) + 1
+            _record_answer(bot_name, response_time)
             
             return jsonify({
                 "success": True,
@@ -770,13 +931,14 @@ def web_process_audio():
         })
 
 # Update transcribe_audio function with more robust error handling
-def transcribe_audio(audio_url, language):
+def transcribe_audio(audio_url, language, bot_name=""):
     """
-    Transcribe audio using OpenAI's Whisper API.
+    Transcribe a Twilio recording with the configured STT backend.
     
     Args:
         audio_url (str): URL of the audio file
         language (str): Language of the audio
+        bot_name (str): Bot the caller chose, for metrics
         
     Returns:
         str: The transcribed text
@@ -784,62 +946,40 @@ def transcribe_audio(audio_url, language):
     # Add .mp3 to the Twilio URL to get downloadable URL
     mp3_url = audio_url + ".mp3"
     
-    # Download the audio file (with retry logic)
+    # Download over the pooled Twilio session, which retries with backoff.
+    # Streamed into this thread's reusable buffer; nothing touches the disk.
+    buffer = thread_audio_buffer()
+    try:
+        with metrics.timed("audio_download", bot=bot_name, language=language, channel="phone"):
+            with http_pool.request("twilio", "GET", mp3_url, stream=True) as response:
+                audio = buffer.read_chunks(response.iter_content(AUDIO_CHUNK_SIZE))
+    except Exception as e:
+        logger.error(f"Failed to download audio: {e}")
+        raise
+    
+    # Transcribe (with retry logic)
     max_retries = 3
     retry_count = 0
-    
     while retry_count < max_retries:
         try:
-            response = requests.get(mp3_url, timeout=10)
-            response.raise_for_status()  # Raise exception for 4XX/5XX responses
-            break
-        except requests.exceptions.RequestException as e:
-            retry_count += 1
-            logger.warning(f"Retry {retry_count}/{max_retries} downloading audio: {e}")
-            time.sleep(1)
-            if retry_count == max_retries:
-                logger.error(f"Failed to download audio after {max_retries} attempts")
+            with metrics.timed("stt", bot=bot_name, language=language, channel="phone"):
+                return stt_backend.transcribe(audio, language, fmt="mp3")
+        except Exception as e:
+            if retry_count + 1 == max_retries:
+                logger.error(f"Failed to transcribe audio after {max_retries} attempts")
                 raise
-    
-    # Create a temporary file
-    with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_file:
-        temp_filename = temp_file.name
-        temp_file.write(response.content)
-    
-    try:
-        # Transcribe using OpenAI Whisper (with retry logic)
-        retry_count = 0
-        while retry_count < max_retries:
-            try:
-                with open(temp_filename, "rb") as audio_file:
-                    result = openai.Audio.transcribe(
-                        file=audio_file,
-                        model="whisper-1",
-                        language=language
-                    )
-                
-                # Get the transcribed text
-                text = result.text if hasattr(result, 'text') else result['text']
-                return text
-            except Exception as e:
-                retry_count += 1
-                logger.warning(f"Retry {retry_count}/{max_retries} transcribing audio: {e}")
-                time.sleep(1)
-                if retry_count == max_retries:
-                    logger.error(f"Failed to transcribe audio after {max_retries} attempts")
-                    raise
-    finally:
-        # Clean up the temporary file
-        if os.path.exists(temp_filename):
-            os.unlink(temp_filename)
+            delay = backoff_delay(retry_count)
+            retry_count += 1
+            logger.warning(f"Retry {retry_count}/{max_retries} transcribing audio in {delay:.2f}s: {e}")
+            time.sleep(delay)
 
 if __name__ == "__main__":
     # Check if the required API keys are set
-    if not os.getenv("GOOGLE_API_KEY"):
+    if requires_google_api_key() and not os.getenv("GOOGLE_API_KEY"):
         logger.error("GOOGLE_API_KEY environment variable not set")
         exit(1)
         
-    if not os.getenv("OPENAI_API_KEY"):
+    if STT_BACKEND == "openai" and not os.getenv("OPENAI_API_KEY"):
         logger.error("OPENAI_API_KEY environment variable not set")
         exit(1)
     
@@ -850,5 +990,5 @@ if __name__ == "__main__":
         logger.info(f"SMS functionality enabled using Twilio number: {twilio_phone_number}")
     
     logger.info("Voice server starting up...")
-    # Run the Flask server
-    app.run(host="0.0.0.0", port=5001, debug=True)
+    # Pre-fork workers sharing the preloaded indexes (SERVER_MODE=dev for the Flask debug server)
+    serving.run(app, 5001, preload=bot_manager.preload)
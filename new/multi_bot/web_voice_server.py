@@ -1,11 +1,14 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response
 import os
 import uuid
-import base64
-import tempfile
 import logging
-from google.cloud import speech
 from utils import LegalBotManager
+from llm_backends import requires_google_api_key
+from stt_backends import get_stt_backend
+from audio_io import AudioTooLarge, read_request_audio
+import metrics
+import serving
+from session_store import get_session_store
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -18,10 +21,8 @@ logger = logging.getLogger(__name__)
 # Initialize the Flask application
 app = Flask(__name__, template_folder='templates')
 
-# Initialize Google Speech client
-speech_client = speech.SpeechClient.from_service_account_json(
-    os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-)
+# Speech-to-text backend (Google Speech unless STT_BACKEND says otherwise)
+stt_backend = get_stt_backend(os.getenv("STT_BACKEND", "google"))
 
 # Initialize bot manager
 bot_manager = LegalBotManager(google_api_key=os.getenv("GOOGLE_API_KEY"))
@@ -43,8 +44,11 @@ LEGAL_BOTS = {
     "4": "Constitution Bot"
 }
 
-# Session storage
-web_sessions = {}
+# Forget a browser session this many seconds after its last change
+SESSION_TTL = float(os.getenv("SESSION_TTL", "3600"))
+
+# Session storage; shared by all workers of a multi-worker server
+web_sessions = get_session_store("web", SESSION_TTL)
 
 @app.route("/")
 def index():
@@ -55,10 +59,10 @@ def index():
 def create_session():
     """Create a new web session."""
     session_id = str(uuid.uuid4())
-    web_sessions[session_id] = {
+    web_sessions.set(session_id, {
         "language": None,
         "selected_bot": None
-    }
+    })
     
     logger.info(f"Created new web session: {session_id}")
     return jsonify({"success": True, "session_id": session_id})
@@ -73,13 +77,11 @@ def set_language():
     if not session_id or not language_code:
         return jsonify({"success": False, "error": "Missing session_id or language_code"})
     
-    if session_id not in web_sessions:
-        return jsonify({"success": False, "error": "Invalid session_id"})
-    
     if language_code not in LANGUAGES:
         return jsonify({"success": False, "error": "Invalid language_code"})
     
-    web_sessions[session_id]["language"] = LANGUAGES[language_code]
+    if web_sessions.update(session_id, language=LANGUAGES[language_code]) is None:
+        return jsonify({"success": False, "error": "Invalid session_id"})
     logger.info(f"Set language to {LANGUAGES[language_code]['name']} for session {session_id}")
     
     return jsonify({"success": True})
@@ -94,122 +96,98 @@ def set_bot():
     if not session_id or not bot_code:
         return jsonify({"success": False, "error": "Missing session_id or bot_code"})
     
-    if session_id not in web_sessions:
-        return jsonify({"success": False, "error": "Invalid session_id"})
-    
     if bot_code not in LEGAL_BOTS:
         return jsonify({"success": False, "error": "Invalid bot_code"})
     
-    web_sessions[session_id]["selected_bot"] = LEGAL_BOTS[bot_code]
+    if web_sessions.update(session_id, selected_bot=LEGAL_BOTS[bot_code]) is None:
+        return jsonify({"success": False, "error": "Invalid session_id"})
     logger.info(f"Set bot to {LEGAL_BOTS[bot_code]} for session {session_id}")
     
     return jsonify({"success": True})
 
 @app.route("/web_process_audio", methods=["POST"])
 def process_audio():
-    """Process audio from the web interface."""
-    data = request.json
-    session_id = data.get("session_id")
-    audio_b64 = data.get("audio")
+    """
+    Process audio from the web interface.
+    
+    Takes the raw recording as the request body (``Content-Type: audio/webm``,
+    ``?session_id=...``), or JSON with a base64 ``audio`` field.
+    """
+    try:
+        session_id, audio_data, audio_format = read_request_audio(request)
+    except AudioTooLarge as e:
+        return jsonify({"success": False, "error": str(e)}), 413
     
-    if not session_id or not audio_b64:
+    if not session_id or audio_data is None:
         return jsonify({"success": False, "error": "Missing session_id or audio"})
     
-    if session_id not in web_sessions:
+    session = web_sessions.get(session_id)
+    if session is None:
         return jsonify({"success": False, "error": "Invalid session_id"})
     
-    session = web_sessions[session_id]
     
     if not session["language"] or not session["selected_bot"]:
         return jsonify({"success": False, "error": "Language or bot not selected"})
     
     try:
-        # Extract base64 audio data (remove data URL prefix if present)
-        if "," in audio_b64:
-            audio_b64 = audio_b64.split(",", 1)[1]
+        # Transcribe the audio straight from memory
+        language_code = session["language"]["speech_code"]
+        with metrics.timed("stt", bot=session["selected_bot"], language=session["language"]["name"].lower(), channel="web"):
+            transcription = stt_backend.transcribe(audio_data, language_code, fmt=audio_format)
         
-        # Decode base64 audio
-        audio_data = base64.b64decode(audio_b64)
+        logger.info(f"Transcription: {transcription}")
         
-        # Save to temporary file
-        with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as temp_file:
-            temp_filename = temp_file.name
-            temp_file.write(audio_data)
+        # Query the bot
+        bot_name = session["selected_bot"]
+        language_name = session["language"]["name"]
         
-        try:
-            # Transcribe using Google Speech-to-Text
-            language_code = session["language"]["speech_code"]
-            
-            # Read the audio file
-            with open(temp_filename, "rb") as audio_file:
-                content = audio_file.read()
+        if bot_name in bot_manager.get_available_bots():
+            # Add language instruction if not in English
+            if language_name.lower() != "english":
+                query = f"Answer the following query in {language_name}: {transcription}"
+            else:
+                query = transcription
             
-            audio = speech.RecognitionAudio(content=content)
-            config = speech.RecognitionConfig(
-                encoding=speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,
-                sample_rate_hertz=48000,  # Standard WebM rate
-                language_code=language_code,
-                enable_automatic_punctuation=True
+            # Query the bot
+            result = bot_manager.query_bot(
+                bot_name, query, priority="voice", profile="voice", channel="web", language=language_name.lower()
             )
+            answer = result["result"]
             
-            response = speech_client.recognize(config=config, audio=audio)
-            
-            # Extract transcription
-            transcription = ""
-            for result in response.results:
-                transcription += result.alternatives[0].transcript
-            
-            logger.info(f"Transcription: {transcription}")
+            # Format sources for citation
+            sources = []
+            if result.get("source_documents"):
+                for i, doc in enumerate(result["source_documents"][:2]):  # Limit to 2 sources
+                    source = doc.metadata.get("source", "").split("/")[-1]
+                    page = doc.metadata.get("page", "")
+                    if source and page:
+                        sources.append({"source": source, "page": page})
             
-            # Query the bot
-            bot_name = session["selected_bot"]
-            language_name = session["language"]["name"]
-            
-            if bot_name in bot_manager.get_available_bots():
-                # Add language instruction if not in English
-                if language_name.lower() != "english":
-                    query = f"Answer the following query in {language_name}: {transcription}"
-                else:
-                    query = transcription
-                
-                # Query the bot
-                result = bot_manager.query_bot(bot_name, query)
-                answer = result["result"]
-                
-                # Format sources for citation
-                sources = []
-                if result.get("source_documents"):
-                    for i, doc in enumerate(result["source_documents"][:2]):  # Limit to 2 sources
-                        source = doc.metadata.get("source", "").split("/")[-1]
-                        page = doc.metadata.get("page", "")
-                        if source and page:
-                            sources.append({"source": source, "page": page})
-                
-                return jsonify({
-                    "success": True,
-                    "transcription": transcription,
-                    "answer": answer,
-                    "sources": sources
-                })
-            else:
-                return jsonify({
-                    "success": False,
-                    "error": f"Bot {bot_name} not available",
-                    "transcription": transcription
-                })
-                
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_filename):
-                os.unlink(temp_filename)
-                
+            return jsonify({
+                "success": True,
+                "transcription": transcription,
+                "answer": answer,
+                "sources": sources
+            })
+        else:
+            return jsonify({
+                "success": False,
+                "error": f"Bot {bot_name} not available",
+                "transcription": transcription
+            })
+    
     except Exception as e:
         logger.error(f"Error processing audio: {e}")
         return jsonify({"success": False, "error": str(e)})
 
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Stage latency histograms in the Prometheus text format."""
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
     # Check if the required API keys are set
-    if not os.getenv("GOOGLE_API_KEY"):
+    if requires_google_api_key() and not os.getenv("GOOGLE_API_KEY"):
         logger.error("GOOGLE_API_KEY environment variable not set")
         exit(1)
     
@@ -218,5 +196,5 @@ if __name__ == "__main__":
         exit(1)
     
     logger.info("Web voice server starting up...")
-    # Run the Flask server
-    app.run(host="0.0.0.0", port=5002, debug=True)
+    # Pre-fork workers sharing the preloaded indexes (SERVER_MODE=dev for the Flask debug server)
+    serving.run(app, 5002, preload=bot_manager.preload)
@@ -1,10 +1,16 @@
-from flask import Flask, request
+from flask import Flask, request, Response
 from twilio.twiml.messaging_response import MessagingResponse
 from twilio.rest import Client
 import os
 import logging
 from utils import LegalBotManager
+from llm_backends import requires_google_api_key
+import metrics
+import serving
+from whatsapp_sender import OutboundSender
+from session_store import get_session_store
 from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 import json
 
 # Load environment variables
@@ -25,6 +31,13 @@ twilio_client = Client(account_sid, auth_token)
 # Initialize bot manager
 bot_manager = LegalBotManager(google_api_key=os.getenv("GOOGLE_API_KEY"))
 
+# Questions are answered here after the webhook has been acknowledged
+WHATSAPP_WORKERS = int(os.getenv("WHATSAPP_WORKERS", "8"))
+answer_executor = ThreadPoolExecutor(max_workers=WHATSAPP_WORKERS, thread_name_prefix="whatsapp")
+
+# Answers go out through the REST API, in order and under Twilio's rate limit
+outbound = OutboundSender(twilio_client)
+
 # Available bots
 LEGAL_BOTS = {
     "1": "IPC Bot",
@@ -33,8 +46,14 @@ LEGAL_BOTS = {
     "4": "Constitution Bot"
 }
 
-# User sessions (in-memory for simplicity, use a database in production)
-user_sessions = {}
+# Forget a conversation this many seconds after the user's last message
+SESSION_TTL = float(os.getenv("SESSION_TTL", "86400"))
+
+# User sessions, keyed by sender; shared by all workers of a multi-worker server
+user_sessions = get_session_store("whatsapp", SESSION_TTL)
+
+# Message SIDs already accepted, so a webhook retried by Twilio is answered once
+seen_messages = get_session_store("whatsapp_message", 600)
 
 # Define welcome message
 WELCOME_MESSAGE = """🔍 *Welcome to Legal Assistant!*
@@ -65,6 +84,8 @@ def whatsapp_webhook():
     # Get the message from the request
     incoming_msg = request.values.get("Body", "").strip()
     sender = request.values.get("From", "")  # Format: 'whatsapp:+1234567890'
+    our_number = request.values.get("To", "")  # The WhatsApp number messages are coming into
+    message_sid = request.values.get("MessageSid", "")
     
     logger.info(f"Received message from {sender}: {incoming_msg}")
     
@@ -82,16 +103,15 @@ def whatsapp_webhook():
         return str(resp)
     
     if incoming_msg.lower() == "exit":
-        if sender in user_sessions:
-            del user_sessions[sender]
+        user_sessions.delete(sender)
         msg.body("Conversation reset. Type 'menu' to start again.")
         return str(resp)
     
     # Initialize or retrieve user session
-    if sender not in user_sessions:
-        user_sessions[sender] = {"selected_bot": None, "stage": "selecting_bot"}
-    
-    session = user_sessions[sender]
+    session = user_sessions.get(sender)
+    if session is None:
+        session = {"selected_bot": None, "stage": "selecting_bot"}
+        user_sessions.set(sender, session)
     
     # Handle bot selection
     if session["stage"] == "selecting_bot":
@@ -100,8 +120,7 @@ def whatsapp_webhook():
             
             # Check if bot exists and is available
             if bot_name in bot_manager.get_available_bots():
-                session["selected_bot"] = bot_name
-                session["stage"] = "asking_question"
+                user_sessions.update(sender, selected_bot=bot_name, stage="asking_question")
                 
                 msg.body(f"✅ Selected: *{bot_name}*\n\nPlease ask your legal question and I'll provide an answer based on relevant legal documents.")
             else:
@@ -109,65 +128,74 @@ def whatsapp_webhook():
         else:
             msg.body(WELCOME_MESSAGE)
     
-    # Handle legal questions
+    # Handle legal questions: acknowledge now, answer through the REST API
     elif session["stage"] == "asking_question":
-        try:
-            bot_name = session["selected_bot"]
-            result = bot_manager.query_bot(bot_name, incoming_msg)
-            
-            # Format the answer and sources for WhatsApp
-            answer = result["result"]
-            
-            # Format source citations if available
-            source_text = ""
-            if result.get("source_documents"):
-                sources = []
-                for i, doc in enumerate(result["source_documents"][:2]):  # Limit to 2 sources for readability
-                    source = doc.metadata.get("source", "").split("/")[-1]
-                    page = doc.metadata.get("page", "")
-                    if source and page:
-                        sources.append(f"Source {i+1}: {source}, Page: {page}")
-                
-                if sources:
-                    source_text = "\n\n*Sources:*\n" + "\n".join(sources)
-            
-            # Reset session stage to allow another question to the same bot
-            session["stage"] = "asking_question"
-            
-            # Prepare response with emojis for better readability
-            response_text = f"🔍 *Question:*\n{incoming_msg}\n\n📝 *Answer:*\n{answer}{source_text}\n\n_(Ask another question or type 'menu' to change legal domain)_"
-            
-            # Split long messages if needed (WhatsApp has a 1600 character limit)
-            if len(response_text) > 1500:
-                # Split the response into multiple messages
-                parts = [response_text[i:i+1500] for i in range(0, len(response_text), 1500)]
-                
-                # Send the first part as the immediate response
-                msg.body(parts[0])
-                
-                # Send subsequent parts using the Twilio API
-                for part in parts[1:]:
-                    twilio_client.messages.create(
-                        body=part,
-                        from_=request.values.get("To"),  # The WhatsApp number messages are coming into
-                        to=sender
-                    )
-            else:
-                msg.body(response_text)
-                
-        except Exception as e:
-            logger.error(f"Error querying bot: {e}")
-            msg.body(f"❌ Sorry, I encountered an error while processing your question. Please try again or type 'menu' to restart.")
+        if message_sid and message_sid in seen_messages:
+            logger.info(f"Ignoring retried webhook for {message_sid}")
+            return str(MessagingResponse())
+        if message_sid:
+            seen_messages.set(message_sid, {})
+        
+        bot_name = session["selected_bot"]
+        # Keeps the conversation alive for another SESSION_TTL
+        user_sessions.update(sender, stage="asking_question")
+        answer_executor.submit(answer_question, sender, our_number, bot_name, incoming_msg)
+        msg.body(f"⏳ Looking that up in the *{bot_name}* documents...")
             
     return str(resp)
 
+def answer_question(sender, our_number, bot_name, question):
+    """Answer a question on the worker pool and queue the reply for sending."""
+    try:
+        result = bot_manager.query_bot(bot_name, question, priority="chat", profile="whatsapp",
+                                       channel="whatsapp")
+        
+        # Format the answer and sources for WhatsApp
+        answer = result["result"]
+        
+        # Format source citations if available
+        source_text = ""
+        if result.get("source_documents"):
+            sources = []
+            for i, doc in enumerate(result["source_documents"][:2]):  # Limit to 2 sources for readability
+                source = doc.metadata.get("source", "").split("/")[-1]
+                page = doc.metadata.get("page", "")
+                if source and page:
+                    sources.append(f"Source {i+1}: {source}, Page: {page}")
+            
+            if sources:
+                source_text = "\n\n*Sources:*\n" + "\n".join(sources)
+        
+        # Prepare response with emojis for better readability
+        response_text = f"🔍 *Question:*\n{question}\n\n📝 *Answer:*\n{answer}{source_text}\n\n_(Ask another question or type 'menu' to change legal domain)_"
+    except Exception as e:
+        logger.error(f"Error querying bot: {e}")
+        response_text = "❌ Sorry, I encountered an error while processing your question. Please try again or type 'menu' to restart."
+    
+    # Long answers are split on sentence boundaries to fit WhatsApp's message limit
+    outbound.send(sender, our_number, response_text)
+
 @app.route("/")
 def index():
     return "WhatsApp Legal Assistant Bot is running!"
 
+@app.route("/stats", methods=["GET"])
+def stats():
+    """Outbound message, session and stage latency statistics."""
+    return {
+        "outbound": outbound.stats(),
+        "sessions": user_sessions.stats(),
+        "stages": metrics.snapshot()
+    }
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Stage latency histograms in the Prometheus text format."""
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
 if __name__ == "__main__":
     # Check if the required environment variables are set
-    if not os.getenv("GOOGLE_API_KEY"):
+    if requires_google_api_key() and not os.getenv("GOOGLE_API_KEY"):
         logger.error("GOOGLE_API_KEY environment variable not set")
         exit(1)
     
@@ -176,5 +204,5 @@ if __name__ == "__main__":
         exit(1)
     
     logger.info("WhatsApp bot server starting up...")
-    # Run the Flask server
-    app.run(host="0.0.0.0", port=5003, debug=True)
+    # Pre-fork workers sharing the preloaded indexes (SERVER_MODE=dev for the Flask debug server)
+    serving.run(app, 5003, preload=bot_manager.preload)
@@ -0,0 +1,200 @@
+"""
+Outbound WhatsApp messages through the Twilio REST API.
+
+Answers are not returned in the webhook reply but queued on an
+``OutboundSender``:
+
+- Text is split into parts of at most WHATSAPP_MESSAGE_CHARS characters
+  (default 1500, under WhatsApp's 1600 limit), on sentence and line
+  boundaries where possible.
+- Messages to one recipient are sent one at a time, in the order they were
+  queued, so the parts of an answer arrive in order. Different recipients
+  are served in turn by WHATSAPP_SEND_THREADS threads.
+- Every send takes a token from a bucket refilled at WHATSAPP_SEND_RATE
+  messages per second. Set WHATSAPP_RATE_LIMIT_DB to a SQLite file to
+  share one bucket between all worker processes.
+- Sends rejected with 429 or a 5xx status are retried with backoff, up to
+  WHATSAPP_SEND_RETRIES times.
+"""
+import os
+import re
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+
+from http_pool import RETRY_STATUSES, backoff_delay
+from llm_scheduler import TokenBucket, SharedTokenBucket
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_CHARS = int(os.getenv("WHATSAPP_MESSAGE_CHARS", "1500"))
+SEND_RATE = float(os.getenv("WHATSAPP_SEND_RATE", "10"))
+SEND_THREADS = int(os.getenv("WHATSAPP_SEND_THREADS", "4"))
+SEND_RETRIES = int(os.getenv("WHATSAPP_SEND_RETRIES", "3"))
+RATE_LIMIT_DB = os.getenv("WHATSAPP_RATE_LIMIT_DB")
+
+# Seconds a stopping process waits for queued messages to go out
+DRAIN_TIMEOUT = 10
+
+# Zero-width split points: after sentence-ending punctuation that is followed
+# by whitespace, and after each newline. Every character is kept.
+_BREAKS = re.compile(r"(?<=[.!?\u0964])(?=\s)|(?<=\n)")
+
+
+def split_message(text, limit=MESSAGE_CHARS):
+    """
+    Split text into messages of at most ``limit`` characters.
+
+    Sentences and lines are kept whole where they fit; a longer one is
+    broken at the last space before the limit, or at the limit itself.
+
+    Returns:
+        list: The parts, in order
+    """
+    parts = []
+    current = ""
+    for piece in _BREAKS.split(text):
+        if len(current) + len(piece) <= limit:
+            current += piece
+            continue
+        if current.strip():
+            parts.append(current.strip())
+        current = piece.lstrip()
+        while len(current) > limit:
+            cut = current.rfind(" ", 0, limit + 1)
+            if cut <= 0:
+                cut = limit
+            parts.append(current[:cut].strip())
+            current = current[cut:].lstrip()
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+class OutboundSender:
+    """Ordered, rate-limited delivery of WhatsApp messages."""
+
+    def __init__(self, client, rate_per_second=SEND_RATE, threads=SEND_THREADS, retries=SEND_RETRIES,
+                 rate_limit_db=RATE_LIMIT_DB):
+        """
+        Args:
+            client: ``twilio.rest.Client``
+            rate_per_second (float): Messages sent per second across all recipients
+            threads (int): Recipients served at the same time
+            retries (int): Retries of a send rejected with 429 or 5xx
+            rate_limit_db (str): SQLite file to share the rate limit between processes
+        """
+        self.client = client
+        self.threads = threads
+        self.retries = retries
+        if rate_limit_db:
+            self.bucket = SharedTokenBucket(rate_limit_db, "whatsapp_send", rate_per_second)
+        else:
+            self.bucket = TokenBucket(rate_per_second)
+        self._reset()
+        # Threads and queued messages belong to the process that created them
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._reset)
+        atexit.register(self.drain, DRAIN_TIMEOUT)
+
+    def _reset(self):
+        self._cond = threading.Condition()
+        # Recipient -> deque of (sender number, body); present while it has messages to send
+        self._queues = {}
+        # Recipients with queued messages that no thread is sending to
+        self._ready = deque()
+        self._started = False
+        self._stats = {"queued": 0, "sent": 0, "retried": 0, "failed": 0}
+
+    def send(self, to, from_, text):
+        """
+        Queue a message, split into parts if it is long.
+
+        Args:
+            to (str): Recipient, e.g. "whatsapp:+911234567890"
+            from_ (str): Our WhatsApp number the message is sent from
+            text (str): Message text
+
+        Returns:
+            int: Number of messages queued
+        """
+        parts = split_message(text)
+        with self._cond:
+            queue = self._queues.get(to)
+            if queue is None:
+                queue = self._queues[to] = deque()
+                self._ready.append(to)
+            queue.extend((from_, part) for part in parts)
+            self._stats["queued"] += len(parts)
+            if not self._started:
+                self._started = True
+                for i in range(self.threads):
+                    threading.Thread(target=self._send_loop, name=f"whatsapp-send-{i}", daemon=True).start()
+            self._cond.notify()
+        return len(parts)
+
+    def _send_loop(self):
+        while True:
+            with self._cond:
+                while not self._ready:
+                    self._cond.wait()
+                to = self._ready.popleft()
+                from_, body = self._queues[to].popleft()
+
+            self._deliver(to, from_, body)
+
+            with self._cond:
+                if self._queues[to]:
+                    # Back of the line, so one long answer does not hold up other recipients
+                    self._ready.append(to)
+                    self._cond.notify()
+                else:
+                    del self._queues[to]
+                    self._cond.notify_all()
+
+    def _deliver(self, to, from_, body):
+        for attempt in range(self.retries + 1):
+            wait = self.bucket.try_acquire()
+            while wait > 0:
+                time.sleep(wait)
+                wait = self.bucket.try_acquire()
+
+            try:
+                self.client.messages.create(body=body, from_=from_, to=to)
+                with self._cond:
+                    self._stats["sent"] += 1
+                return
+            except Exception as e:
+                if getattr(e, "status", None) not in RETRY_STATUSES or attempt == self.retries:
+                    logger.error(f"Failed to send WhatsApp message to {to}: {e}")
+                    with self._cond:
+                        self._stats["failed"] += 1
+                    return
+                delay = backoff_delay(attempt)
+                logger.warning(f"Retry {attempt + 1}/{self.retries} sending to {to} in {delay:.2f}s: {e}")
+                with self._cond:
+                    self._stats["retried"] += 1
+                time.sleep(delay)
+
+    def drain(self, timeout):
+        """Wait up to ``timeout`` seconds for queued messages to be sent; returns whether they all were."""
+        give_up = time.monotonic() + timeout
+        with self._cond:
+            while self._queues:
+                remaining = give_up - time.monotonic()
+                if remaining <= 0:
+                    logger.warning(f"{sum(len(q) for q in self._queues.values())} WhatsApp messages not sent")
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def stats(self):
+        """Return counts of queued, sent, retried, failed and pending messages."""
+        with self._cond:
+            return {
+                **self._stats,
+                "pending": sum(len(queue) for queue in self._queues.values()),
+                "recipients": len(self._queues)
+            }